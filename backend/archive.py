@@ -0,0 +1,83 @@
+"""
+@file archive.py
+Serves questions from the permanent generated_questions archive before falling back to the LLM.
+
+On a preload cache miss, ARCHIVE_REUSE_RATIO of requests are answered with an archived question matching
+the request's (category, language, knowledge_level, game_mode, theme) key; the rest are generated fresh so
+the archive keeps growing. Every question a game has been shown is remembered in a per-game "seen" set so
+players never get repeats; when every archived question for a key has been seen, generation takes over.
+"""
+
+import random
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+from . import database
+from .config import ARCHIVE_REUSE_RATIO, ARCHIVE_SEEN_MAX_GAMES
+from .question_cache import CacheKey
+
+# Field carrying the generated_questions id alongside a question until it is served
+ARCHIVE_ID_FIELD = "archive_id"
+
+class QuestionArchive:
+    def __init__(self, reuse_ratio: float = ARCHIVE_REUSE_RATIO, max_games: int = ARCHIVE_SEEN_MAX_GAMES):
+        self.reuse_ratio = min(1.0, max(0.0, reuse_ratio))
+        self.max_games = max(1, max_games)
+        # gameId -> archive ids already shown in that game; least recently active games are evicted first
+        self._seen: "OrderedDict[str, Set[int]]" = OrderedDict()
+        self.served = 0
+        self.exhausted = 0
+        self.skipped = 0
+
+    def _seen_for(self, game_id: str) -> Set[int]:
+        seen = self._seen.get(game_id)
+        if seen is None:
+            seen = self._seen[game_id] = set()
+            if len(self._seen) > self.max_games:
+                self._seen.popitem(last=False)
+        else:
+            self._seen.move_to_end(game_id)
+        return seen
+
+    def remember(self, game_id: str, archive_id: Optional[int]):
+        if archive_id is not None:
+            self._seen_for(game_id).add(archive_id)
+
+    def mark_served(self, game_id: str, question_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Records the question as seen by the game and strips the archive id before it is sent out."""
+        self.remember(game_id, question_data.pop(ARCHIVE_ID_FIELD, None))
+        return question_data
+
+    def should_reuse(self) -> bool:
+        if random.random() < self.reuse_ratio:
+            return True
+        self.skipped += 1
+        return False
+
+    async def take(self, game_id: str, key: CacheKey) -> Optional[Dict[str, Any]]:
+        """Returns an archived question for the key that this game has not seen yet, or None."""
+        seen = self._seen_for(game_id)
+        try:
+            question_data = await database.pick_archived_question(key, seen)
+        except Exception as e:
+            print(f"ERROR: Archive lookup failed for '{key[0]}'. Reason: {e}")
+            return None
+        if question_data is None:
+            self.exhausted += 1
+            return None
+        self.served += 1
+        return self.mark_served(game_id, question_data)
+
+    def forget(self, game_id: str):
+        self._seen.pop(game_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "reuse_ratio": self.reuse_ratio,
+            "served": self.served,
+            "exhausted": self.exhausted,
+            "skipped_by_ratio": self.skipped,
+            "tracked_games": len(self._seen),
+        }
+
+question_archive = QuestionArchive()
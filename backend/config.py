@@ -3,7 +3,6 @@ import json
 import asyncio
 import random
 from datetime import datetime
-from aiolimiter import AsyncLimiter
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
@@ -32,12 +31,75 @@ async def fetch_models_from_api():
 GENERATIVE_RATE_LIMIT_COUNT = int(os.getenv("GENERATIVE_RATE_LIMIT_COUNT", "20"))
 GENERATIVE_RATE_LIMIT_PERIOD = int(os.getenv("GENERATIVE_RATE_LIMIT_PERIOD", "60"))
 GENERATIVE_INFLIGHT_LIMIT = int(os.getenv("GENERATIVE_INFLIGHT_LIMIT", "3"))
+# Adaptive limits: the values above are starting points, moved within these bounds by backend/limiter.py
+GENERATIVE_ADAPTIVE_LIMITS = os.getenv("GENERATIVE_ADAPTIVE_LIMITS", "true").lower() in ("1", "true", "yes")
+GENERATIVE_INFLIGHT_MIN = int(os.getenv("GENERATIVE_INFLIGHT_MIN", "1"))
+GENERATIVE_INFLIGHT_MAX = int(os.getenv("GENERATIVE_INFLIGHT_MAX", "32"))
+GENERATIVE_RATE_LIMIT_MAX_COUNT = int(os.getenv("GENERATIVE_RATE_LIMIT_MAX_COUNT", str(GENERATIVE_RATE_LIMIT_COUNT * 4)))
+GENERATIVE_LATENCY_TOLERANCE = float(os.getenv("GENERATIVE_LATENCY_TOLERANCE", "2.0"))
+# Priority scheduling of generative calls: share of slots kept for interactive/live work, and how fast waiting work ages
+SCHEDULER_RESERVED_SHARE = float(os.getenv("SCHEDULER_RESERVED_SHARE", "0.25"))
+SCHEDULER_AGING_SECONDS = float(os.getenv("SCHEDULER_AGING_SECONDS", "10"))
 
 MAX_CONCURRENT_PRELOAD_TASKS = int(os.getenv("MAX_CONCURRENT_PRELOAD_TASKS", "3"))
 MAX_PRELOAD_CATEGORIES = int(os.getenv("MAX_PRELOAD_CATEGORIES", "20"))
-MIN_PRELOAD_INTERVAL = int(os.getenv("MIN_PRELOAD_INTERVAL_SECONDS", "10"))
+# Per-game warm pool (/api/preload-plan): ready questions kept for every board category, more for the categories
+# the players are likely to land on next; plans of games that stopped sending them are dropped after the TTL
+WARM_POOL_TARGET = max(0, int(os.getenv("WARM_POOL_TARGET", "1")))
+WARM_POOL_LIKELY_TARGET = max(1, int(os.getenv("WARM_POOL_LIKELY_TARGET", "2")))
+WARM_POOL_LIKELY_PROBABILITY = float(os.getenv("WARM_POOL_LIKELY_PROBABILITY", "0.15"))
+WARM_POOL_PLAN_TTL_SECONDS = float(os.getenv("WARM_POOL_PLAN_TTL_SECONDS", "3600"))
 
 GEN_CALL_MAX_ATTEMPTS = int(os.getenv("GEN_CALL_MAX_ATTEMPTS", "2"))
+# End-to-end time budget of an interactive generation request (question, live quiz question, categories,
+# mutation, explanation): retries, fallbacks and waits stop when it is used up and the request answers 504
+GENERATION_DEADLINE_SECONDS = float(os.getenv("GENERATION_DEADLINE_SECONDS", "25"))
+
+# Per-model circuit breakers: stop sending work to a model that keeps failing, probe it again after a cooldown
+MODEL_CIRCUIT_ENABLED = os.getenv("MODEL_CIRCUIT_ENABLED", "true").lower() in ("1", "true", "yes")
+MODEL_CIRCUIT_FAILURE_THRESHOLD = max(1, int(os.getenv("MODEL_CIRCUIT_FAILURE_THRESHOLD", "5")))
+MODEL_CIRCUIT_FAILURE_RATE = float(os.getenv("MODEL_CIRCUIT_FAILURE_RATE", "0.5"))
+MODEL_CIRCUIT_COOLDOWN_SECONDS = float(os.getenv("MODEL_CIRCUIT_COOLDOWN_SECONDS", "30"))
+MODEL_CIRCUIT_MAX_COOLDOWN_SECONDS = float(os.getenv("MODEL_CIRCUIT_MAX_COOLDOWN_SECONDS", "600"))
+
+# Optional hedged requests (question generation, off by default): duplicate a request still running after the HEDGE_PERCENTILE latency
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.05"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_MS = int(os.getenv("HEDGE_MIN_DELAY_MS", "500"))
+HEDGE_ALTERNATE_MODEL = os.getenv("HEDGE_ALTERNATE_MODEL", "")
+
+# Questions requested per model call (1 disables batching); extras go into the preloaded cache
+PRELOAD_BATCH_SIZE = max(1, int(os.getenv("PRELOAD_BATCH_SIZE", "4")))
+LIVE_QUIZ_BATCH_SIZE = max(1, int(os.getenv("LIVE_QUIZ_BATCH_SIZE", "3")))
+
+# Write-behind telemetry (model stats, prompt history, error logs)
+TELEMETRY_QUEUE_SIZE = int(os.getenv("TELEMETRY_QUEUE_SIZE", "5000"))
+TELEMETRY_FLUSH_INTERVAL_MS = int(os.getenv("TELEMETRY_FLUSH_INTERVAL_MS", "500"))
+TELEMETRY_FLUSH_BATCH_SIZE = int(os.getenv("TELEMETRY_FLUSH_BATCH_SIZE", "200"))
+
+# Share one in-flight blueprint batch / preload among concurrent callers asking for the same key
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Response cache for idempotent prompts: LRU size, TTL (seconds) per endpoint (0 disables), SQLite tier
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_TTLS = {
+    "generate_categories": float(os.getenv("RESPONSE_CACHE_TTL_CATEGORIES", "86400")),
+    "category_mutation": float(os.getenv("RESPONSE_CACHE_TTL_MUTATION", "3600")),
+    "incorrect_explanation": float(os.getenv("RESPONSE_CACHE_TTL_EXPLANATION", "604800")),
+}
+RESPONSE_CACHE_PERSIST = os.getenv("RESPONSE_CACHE_PERSIST", "true").lower() in ("1", "true", "yes")
+
+# Latency histograms are flushed to SQLite this often
+METRICS_FLUSH_INTERVAL_SECONDS = int(os.getenv("METRICS_FLUSH_INTERVAL_SECONDS", "15"))
+
+# Archive reuse: share of preload cache misses served from generated_questions instead of the LLM
+ARCHIVE_REUSE_RATIO = float(os.getenv("ARCHIVE_REUSE_RATIO", "0.5"))
+ARCHIVE_SEEN_MAX_GAMES = int(os.getenv("ARCHIVE_SEEN_MAX_GAMES", "5000"))
+
+# Error log compaction (retention limits live in database.py)
+ERROR_COMPACTION_INTERVAL_SECONDS = max(10, int(os.getenv("ERROR_COMPACTION_INTERVAL_SECONDS", "300")))
 
 # Load static models and prompts as fallback
 with open('models.json', 'r', encoding='utf-8') as f:
@@ -131,18 +193,11 @@ print("Prompt templates file loaded successfully.")
 if DEBUG_MODE:
     print(f"DEBUG mode is enabled.")
 
-# placeholders to be initialized on startup
-generative_api_limiter: AsyncLimiter = None
-GENERATIVE_CONCURRENCY_SEMAPHORE: asyncio.Semaphore = None
-
 def initialize_async_resources():
-    from .state import PRELOAD_CONCURRENCY_SEMAPHORE, PRELOAD_STATUS_LOCK
-    global generative_api_limiter, GENERATIVE_CONCURRENCY_SEMAPHORE, PRELOAD_CONCURRENCY_SEMAPHORE, PRELOAD_STATUS_LOCK
-    generative_api_limiter = AsyncLimiter(GENERATIVE_RATE_LIMIT_COUNT, GENERATIVE_RATE_LIMIT_PERIOD)
-    GENERATIVE_CONCURRENCY_SEMAPHORE = asyncio.Semaphore(GENERATIVE_INFLIGHT_LIMIT)
-    PRELOAD_CONCURRENCY_SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT_PRELOAD_TASKS)
-    PRELOAD_STATUS_LOCK = asyncio.Lock()
+    # Set on the state module itself: its users look the semaphore up there when they need it
+    from . import state
+    state.PRELOAD_CONCURRENCY_SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT_PRELOAD_TASKS)
     if DEBUG_MODE:
-        print("Startup completed. Rate limiter and semaphores initialized.")
-        print(f"Generative rate limit: {GENERATIVE_RATE_LIMIT_COUNT}/{GENERATIVE_RATE_LIMIT_PERIOD}s, inflight: {GENERATIVE_INFLIGHT_LIMIT}")
+        print("Startup completed. Semaphores initialized.")
+        print(f"Generative rate limit: {GENERATIVE_RATE_LIMIT_COUNT}/{GENERATIVE_RATE_LIMIT_PERIOD}s, inflight: {GENERATIVE_INFLIGHT_LIMIT} (adaptive: {GENERATIVE_ADAPTIVE_LIMITS})")
         print(f"Preload concurrency limit: {MAX_CONCURRENT_PRELOAD_TASKS}, max categories per preload: {MAX_PRELOAD_CATEGORIES}")
\ No newline at end of file
@@ -1,141 +1,513 @@
+import os
+import re
+import time
+import random
+import asyncio
 import aiosqlite
 import json
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Awaitable, Callable, Iterable, Optional, Tuple, AsyncIterator
+from datetime import datetime, timezone
 
-DATABASE_FILE = "/app/data/questions.db"
+DATABASE_FILE = os.getenv("DATABASE_FILE", "/app/data/questions.db")
 
-def get_db_connection():
-    """Returns oan asynchronous database connection object (not yet connected)."""
-    conn = aiosqlite.connect(DATABASE_FILE, timeout=10)
-    return conn
+# Connection pool tuning (override via env)
+DB_READER_POOL_SIZE = int(os.getenv("DB_READER_POOL_SIZE", "4"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "10000"))
 
-async def init_db():
-    """Initializes all necessary tables in the database if they don't exist."""
-    async with get_db_connection() as conn:
+# Number of slots in the prompt_history ring buffer
+PROMPT_HISTORY_CAPACITY = max(1, int(os.getenv("PROMPT_HISTORY_CAPACITY", "50")))
+
+# Error log retention and rollups
+ERROR_LOG_MAX_AGE_DAYS = float(os.getenv("ERROR_LOG_MAX_AGE_DAYS", "14"))
+ERROR_LOG_MAX_ROWS = int(os.getenv("ERROR_LOG_MAX_ROWS", "10000"))
+ERROR_ROLLUP_BUCKET_SECONDS = max(60, int(os.getenv("ERROR_ROLLUP_BUCKET_SECONDS", "3600")))
+ERROR_ROLLUP_RETENTION_DAYS = float(os.getenv("ERROR_ROLLUP_RETENTION_DAYS", "180"))
+
+# Latency histogram retention
+LATENCY_RETENTION_DAYS = float(os.getenv("LATENCY_RETENTION_DAYS", "7"))
+# Token usage and served question counts (per minute, per game)
+USAGE_RETENTION_DAYS = float(os.getenv("USAGE_RETENTION_DAYS", "30"))
+
+# Expression the admin model filter and its index on error_logs share; they must stay identical. Like
+# make_error_entry, it takes a top-level "model" and falls back to the one in the logged "request"
+ERROR_LOG_MODEL_EXPR = ("coalesce(nullif(json_extract(error_details_json, '$.model'), ''), "
+                        "json_extract(error_details_json, '$.request.model'))")
+
+class ConnectionManager:
+    """
+    Long-lived aiosqlite connections shared by all database helpers:
+    - a pool of reader connections (WAL lets them run alongside the writer)
+    - one dedicated writer, serialized by a lock, that commits on success and rolls back on error
+    Pragmas are applied once per connection and sqlite's per-connection statement cache
+    keeps the prepared statements of the helpers below alive between calls.
+    """
+    def __init__(self, path: str, reader_count: int = DB_READER_POOL_SIZE):
+        self.path = path
+        self.reader_count = max(1, reader_count)
+        self._readers: Optional[asyncio.Queue] = None
+        self._all_readers: List[aiosqlite.Connection] = []
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.path, timeout=DB_BUSY_TIMEOUT_MS / 1000, cached_statements=DB_STATEMENT_CACHE_SIZE)
         conn.row_factory = aiosqlite.Row
-        # Table for permanently storing all generated questions
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS generated_questions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, model TEXT NOT NULL, language TEXT NOT NULL,
-                category TEXT NOT NULL, knowledge_level TEXT NOT NULL, game_mode TEXT NOT NULL,
-                theme TEXT, question_text TEXT NOT NULL UNIQUE, answer_text TEXT NOT NULL,
-                explanation TEXT, subcategory TEXT, key_entities_json TEXT, options_json TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        # Table for the shared, preloaded questions cache
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS preloaded_questions_cache (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                category TEXT NOT NULL,
-                question_data_json TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        # Table for model performance statistics
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS model_stats (
-                model_name TEXT PRIMARY KEY,
-                generated_questions INTEGER DEFAULT 0,
-                errors INTEGER DEFAULT 0,
-                total_response_time REAL DEFAULT 0.0
-            )
-        """)
-        # Table for logging errors
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS error_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                endpoint TEXT,
-                error_details_json TEXT
-            )
-        """)
-        # Table for prompt history (capped at 50 entries)
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        await conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        await conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        await conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        await conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    async def open(self):
+        # The writer is opened first so WAL mode is in place before any reader attaches
+        self._writer = await self._connect()
+        self._readers = asyncio.Queue()
+        for _ in range(self.reader_count):
+            conn = await self._connect()
+            self._all_readers.append(conn)
+            self._readers.put_nowait(conn)
+
+    async def close(self):
+        for conn in self._all_readers:
+            await conn.close()
+        self._all_readers = []
+        self._readers = None
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+
+    @asynccontextmanager
+    async def reader(self):
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self):
+        async with self._write_lock:
+            try:
+                yield self._writer
+                await self._writer.commit()
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+# placeholder to be initialized in init_db()
+_manager: Optional[ConnectionManager] = None
+
+def _get_manager() -> ConnectionManager:
+    if _manager is None:
+        raise RuntimeError("Database is not initialized. Call init_db() on startup first.")
+    return _manager
+
+def read_connection():
+    """Borrows a pooled reader connection: `async with read_connection() as conn`."""
+    return _get_manager().reader()
+
+def write_connection():
+    """Borrows the dedicated writer connection inside a transaction: `async with write_connection() as conn`."""
+    return _get_manager().writer()
+
+async def close_db():
+    """Closes all pooled connections. Called on shutdown."""
+    global _manager
+    if _manager is not None:
+        await _manager.close()
+        _manager = None
+        print("SQLite connection pool closed.")
+
+# --- Schema migrations ---
+# Each migration runs in its own transaction together with the PRAGMA user_version bump that records it.
+# Databases created before versioning report user_version 0 and may already contain any of the changes
+# below, so every migration must be idempotent (IF NOT EXISTS, column checks).
+
+async def _create_base_schema(conn: aiosqlite.Connection):
+    """The original schema; later migrations evolve it."""
+    # Table for permanently storing all generated questions
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS generated_questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, model TEXT NOT NULL, language TEXT NOT NULL,
+            category TEXT NOT NULL, knowledge_level TEXT NOT NULL, game_mode TEXT NOT NULL,
+            theme TEXT, question_text TEXT NOT NULL UNIQUE, answer_text TEXT NOT NULL,
+            explanation TEXT, subcategory TEXT, key_entities_json TEXT, options_json TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Table for the shared, preloaded questions cache
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS preloaded_questions_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category TEXT NOT NULL,
+            question_data_json TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Table for model performance statistics
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS model_stats (
+            model_name TEXT PRIMARY KEY,
+            generated_questions INTEGER DEFAULT 0,
+            errors INTEGER DEFAULT 0,
+            total_response_time REAL DEFAULT 0.0
+        )
+    """)
+    # Table for logging errors
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS error_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            endpoint TEXT,
+            error_details_json TEXT
+        )
+    """)
+    # Table for prompt history
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS prompt_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            model TEXT,
+            prompt TEXT,
+            raw_response TEXT
+        )
+    """)
+    # Table for storing question blueprints
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS question_blueprints (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category TEXT NOT NULL,
+            subcategory TEXT NOT NULL,
+            modifier TEXT,
+            target_answer TEXT NOT NULL,
+            is_used BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+async def _migrate_cache_key_columns(conn: aiosqlite.Connection):
+    """
+    Upgrades a category-only preloaded_questions_cache to the composite key.
+    Legacy rows don't record the language, level or mode they were generated for, so they are purged.
+    """
+    async with conn.execute("PRAGMA table_info(preloaded_questions_cache)") as cursor:
+        columns = {row['name'] for row in await cursor.fetchall()}
+    missing = [c for c in ("language", "knowledge_level", "game_mode", "theme") if c not in columns]
+    if missing:
+        for column in missing:
+            await conn.execute(f"ALTER TABLE preloaded_questions_cache ADD COLUMN {column} TEXT NOT NULL DEFAULT ''")
+        cursor = await conn.execute("DELETE FROM preloaded_questions_cache")
+        print(f"Migrated preloaded_questions_cache to the composite cache key ({cursor.rowcount} legacy rows purged).")
+    # Covering index for key lookups in FIFO order
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_cache_key
+        ON preloaded_questions_cache(category, language, knowledge_level, game_mode, theme, id)
+    """)
+
+async def _migrate_blueprint_rand_key(conn: aiosqlite.Connection):
+    """Adds and backfills the random claim key on blueprint tables created before it existed."""
+    async with conn.execute("PRAGMA table_info(question_blueprints)") as cursor:
+        columns = {row['name'] for row in await cursor.fetchall()}
+    if "rand_key" not in columns:
+        await conn.execute("ALTER TABLE question_blueprints ADD COLUMN rand_key REAL")
+    # abs(random()) spans [0, 2^63); scale it into [0, 1) like random.random()
+    await conn.execute("UPDATE question_blueprints SET rand_key = abs(random()) / 9223372036854775808.0 WHERE rand_key IS NULL")
+    # Index for random claims: seek to a random point instead of sorting all unused rows
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_blueprints_claim ON question_blueprints(category, is_used, rand_key)")
+
+async def _migrate_prompt_history_to_ring(conn: aiosqlite.Connection):
+    """
+    Converts the append-and-trim prompt_history table into a ring buffer of PROMPT_HISTORY_CAPACITY slots,
+    keeping the newest rows. id becomes the monotonically increasing sequence number, slot = id % capacity.
+    """
+    async with conn.execute("PRAGMA table_info(prompt_history)") as cursor:
+        columns = {row['name'] for row in await cursor.fetchall()}
+    if "slot" not in columns:
+        await conn.execute("ALTER TABLE prompt_history RENAME TO prompt_history_legacy")
         await conn.execute("""
-            CREATE TABLE IF NOT EXISTS prompt_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
+            CREATE TABLE prompt_history (
+                slot INTEGER PRIMARY KEY,
+                id INTEGER NOT NULL,
                 timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 model TEXT,
                 prompt TEXT,
                 raw_response TEXT
             )
         """)
-        
-        # Table for storing question blueprints
         await conn.execute("""
-            CREATE TABLE IF NOT EXISTS question_blueprints (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                category TEXT NOT NULL,
-                subcategory TEXT NOT NULL,
-                modifier TEXT,
-                target_answer TEXT NOT NULL,
-                is_used BOOLEAN DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Index for quick lookup of unused blueprints
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_blueprints_cat_used ON question_blueprints(category, is_used)")
-        
-        await conn.commit()
-    print("SQLite database and all tables initialized successfully.")
+            INSERT OR REPLACE INTO prompt_history (slot, id, timestamp, model, prompt, raw_response)
+            SELECT id % ?, id, timestamp, model, prompt, raw_response
+            FROM (SELECT * FROM prompt_history_legacy ORDER BY id DESC LIMIT ?)
+            ORDER BY id
+        """, (PROMPT_HISTORY_CAPACITY, PROMPT_HISTORY_CAPACITY))
+        await conn.execute("DROP TABLE prompt_history_legacy")
+        print("Migrated prompt_history to a ring buffer.")
+    await conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_prompt_history_id ON prompt_history(id)")
+
+async def _create_error_rollups(conn: aiosqlite.Connection):
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_error_logs_timestamp ON error_logs(timestamp)")
+    # Counters for identical errors (same endpoint, model and signature) per time bucket.
+    # Only the first occurrence in a bucket is kept as a full error_logs row.
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS error_rollups (
+            bucket_start INTEGER NOT NULL,
+            endpoint TEXT NOT NULL,
+            model TEXT NOT NULL,
+            error_signature TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            first_seen REAL NOT NULL,
+            last_seen REAL NOT NULL,
+            PRIMARY KEY (bucket_start, endpoint, model, error_signature)
+        )
+    """)
+
+async def _create_archive_index(conn: aiosqlite.Connection):
+    # Archive reuse: lookups by the full cache key, walked in id order
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_generated_lookup
+        ON generated_questions(category, language, knowledge_level, game_mode, theme, id)
+    """)
+
+async def _create_secondary_indexes(conn: aiosqlite.Connection):
+    # Per-model and time-range browsing of the archive
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_generated_model_created ON generated_questions(model, created_at)")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_generated_created ON generated_questions(created_at)")
+    # Admin error log filters, newest first
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_error_logs_endpoint ON error_logs(endpoint, id)")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_error_logs_model ON error_logs(json_extract(error_details_json, '$.model'), id)")
+    # Superseded by idx_blueprints_claim, which has the same (category, is_used) prefix
+    await conn.execute("DROP INDEX IF EXISTS idx_blueprints_cat_used")
+
+async def _create_latency_histograms(conn: aiosqlite.Connection):
+    # Per-minute latency histograms per model and endpoint; counts_json holds one count per bucket in metrics.LATENCY_BUCKETS_MS
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS latency_histograms (
+            bucket_start INTEGER NOT NULL,
+            model TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            errors INTEGER NOT NULL DEFAULT 0,
+            total_ms REAL NOT NULL DEFAULT 0,
+            counts_json TEXT NOT NULL,
+            PRIMARY KEY (bucket_start, model, endpoint)
+        )
+    """)
+
+async def _create_response_cache(conn: aiosqlite.Connection):
+    # Persistent tier of backend/response_cache.py; key is a hash of (model, prompt)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS response_cache (
+            key TEXT PRIMARY KEY,
+            endpoint TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            parsed_json TEXT NOT NULL,
+            raw_response TEXT
+        )
+    """)
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_expires ON response_cache(expires_at)")
+
+async def _create_token_usage(conn: aiosqlite.Connection):
+    # Per-minute token counts (backend/usage.py); game_id is '' for calls outside a game (e.g. blueprint batches)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS token_usage (
+            bucket_start INTEGER NOT NULL,
+            model TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            game_id TEXT NOT NULL,
+            calls INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            estimated_calls INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket_start, model, endpoint, game_id)
+        )
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS served_questions (
+            bucket_start INTEGER NOT NULL,
+            game_id TEXT NOT NULL,
+            questions INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket_start, game_id)
+        )
+    """)
+
+async def _rebuild_error_log_model_index(conn: aiosqlite.Connection):
+    # Route errors log the model under "request"; the index now follows ERROR_LOG_MODEL_EXPR
+    await conn.execute("DROP INDEX IF EXISTS idx_error_logs_model")
+    await conn.execute(f"CREATE INDEX idx_error_logs_model ON error_logs({ERROR_LOG_MODEL_EXPR}, id)")
+
+# (version, description, migration); append only, never reorder or edit an applied migration
+MIGRATIONS: List[Tuple[int, str, Callable[[aiosqlite.Connection], Awaitable[None]]]] = [
+    (1, "base schema", _create_base_schema),
+    (2, "composite preloaded cache key", _migrate_cache_key_columns),
+    (3, "random blueprint claim key", _migrate_blueprint_rand_key),
+    (4, "prompt history ring buffer", _migrate_prompt_history_to_ring),
+    (5, "error rollups", _create_error_rollups),
+    (6, "archive lookup index", _create_archive_index),
+    (7, "secondary indexes for admin and archive queries", _create_secondary_indexes),
+    (8, "latency histograms", _create_latency_histograms),
+    (9, "response cache", _create_response_cache),
+    (10, "token usage", _create_token_usage),
+    (11, "error log model index covering request models", _rebuild_error_log_model_index),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Version the open database was migrated to (set in init_db)
+schema_version = 0
+
+async def get_schema_version(conn: aiosqlite.Connection) -> int:
+    async with conn.execute("PRAGMA user_version") as cursor:
+        return (await cursor.fetchone())[0]
+
+async def _apply_migrations() -> int:
+    """Applies every migration newer than the database's user_version, in order. Returns the final version."""
+    async with write_connection() as conn:
+        version = await get_schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {version} is newer than this build supports ({SCHEMA_VERSION}).")
+    for target, description, migrate in MIGRATIONS:
+        if target <= version:
+            continue
+        async with write_connection() as conn:
+            # DDL doesn't open a transaction implicitly; make the migration and its version bump atomic
+            await conn.execute("BEGIN IMMEDIATE")
+            await migrate(conn)
+            await conn.execute(f"PRAGMA user_version = {target}")
+        print(f"Applied database migration {target}: {description}.")
+        version = target
+    return version
+
+# Last sequence number written to prompt_history (loaded in init_db, advanced under the write lock)
+_prompt_history_seq = 0
+
+async def _load_prompt_history_seq(conn: aiosqlite.Connection):
+    global _prompt_history_seq
+    # Slots beyond a reduced capacity would never be overwritten again
+    await conn.execute("DELETE FROM prompt_history WHERE slot >= ?", (PROMPT_HISTORY_CAPACITY,))
+    async with conn.execute("SELECT MAX(id) FROM prompt_history") as cursor:
+        row = await cursor.fetchone()
+    _prompt_history_seq = row[0] or 0
+
+async def _write_prompt_history(conn: aiosqlite.Connection, entries: List[Dict[str, Any]]):
+    """Overwrites ring slots with the given entries (oldest first). One write per entry, no counting."""
+    global _prompt_history_seq
+    # Anything older than one full lap would be overwritten within this batch anyway
+    entries = entries[-PROMPT_HISTORY_CAPACITY:]
+    rows = []
+    for entry in entries:
+        _prompt_history_seq += 1
+        rows.append((
+            _prompt_history_seq % PROMPT_HISTORY_CAPACITY, _prompt_history_seq,
+            entry['timestamp'], entry['model'], entry['prompt'], entry['raw_response']
+        ))
+    await conn.executemany("""
+        INSERT OR REPLACE INTO prompt_history (slot, id, timestamp, model, prompt, raw_response)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, rows)
+
+async def init_db():
+    """Opens the connection pool and brings the schema up to date by applying pending migrations."""
+    global _manager
+    if _manager is None:
+        manager = ConnectionManager(DATABASE_FILE, DB_READER_POOL_SIZE)
+        await manager.open()
+        _manager = manager
+    global schema_version
+    version = schema_version = await _apply_migrations()
+    async with write_connection() as conn:
+        await _load_prompt_history_seq(conn)
+    _blueprint_counts.clear()
+    print(f"SQLite database initialized successfully (schema version {version}, {_manager.reader_count} readers + 1 writer, WAL mode).")
+
+# Unused blueprint counts per category, maintained incrementally after the first COUNT(*)
+_blueprint_counts: Dict[str, int] = {}
 
 async def save_blueprints_batch(category: str, blueprints: List[Dict[str, str]]):
     """Saves a batch of generated blueprints to the database."""
-    async with get_db_connection() as conn:
+    async with write_connection() as conn:
         data_to_insert = [
-            (category, b['subcategory'], b.get('modifier', ''), b['target_answer'])
+            (category, b['subcategory'], b.get('modifier', ''), b['target_answer'], random.random())
             for b in blueprints
         ]
         await conn.executemany("""
-            INSERT INTO question_blueprints (category, subcategory, modifier, target_answer)
-            VALUES (?, ?, ?, ?)
+            INSERT INTO question_blueprints (category, subcategory, modifier, target_answer, rand_key)
+            VALUES (?, ?, ?, ?, ?)
         """, data_to_insert)
-        await conn.commit()
+        # Counts are only touched under the write lock, so they can't drift from the table
+        if category in _blueprint_counts:
+            _blueprint_counts[category] += len(data_to_insert)
+
+_CLAIM_BLUEPRINT_SQL = """
+    UPDATE question_blueprints SET is_used = 1
+    WHERE id = (
+        SELECT id FROM question_blueprints
+        WHERE category = ? AND is_used = 0 AND rand_key >= ?
+        ORDER BY rand_key LIMIT 1
+    )
+    RETURNING id, subcategory, modifier, target_answer
+"""
 
 async def get_unused_blueprint(category: str) -> Optional[Dict[str, Any]]:
-    """Retrieves one unused blueprint and marks it as used (atomically)."""
-    async with get_db_connection() as conn:
-        conn.row_factory = aiosqlite.Row
-        try:
-            # Get one random unused blueprint
+    """
+    Claims one random unused blueprint and marks it as used in a single UPDATE ... RETURNING statement.
+    The row is found by seeking idx_blueprints_claim to a random rand_key (wrapping around to 0),
+    so no sort is needed and concurrent callers can never claim the same blueprint.
+    """
+    blueprints = await claim_blueprints(category, 1)
+    return blueprints[0] if blueprints else None
+
+async def claim_blueprints(category: str, limit: int) -> List[Dict[str, Any]]:
+    """Claims up to `limit` random unused blueprints (see get_unused_blueprint) in one write transaction."""
+    if _blueprint_counts.get(category) == 0:
+        return []
+    try:
+        async with write_connection() as conn:
+            blueprints: List[Dict[str, Any]] = []
+            while len(blueprints) < limit:
+                blueprint = None
+                for start_key in (random.random(), 0.0):
+                    async with conn.execute(_CLAIM_BLUEPRINT_SQL, (category, start_key)) as cursor:
+                        rows = await cursor.fetchall()
+                    if rows:
+                        blueprint = dict(rows[0])
+                        break
+                if blueprint is None:
+                    _blueprint_counts[category] = 0
+                    break
+                blueprints.append(blueprint)
+                if category in _blueprint_counts:
+                    _blueprint_counts[category] = max(0, _blueprint_counts[category] - 1)
+        return blueprints
+    except Exception as e:
+        print(f"Error getting blueprint: {e}")
+        return []
+
+async def get_blueprint_count(category: str) -> int:
+    """Counts how many unused blueprints are available for a category (queried once, then tracked in memory)."""
+    if category in _blueprint_counts:
+        return _blueprint_counts[category]
+    # Counted on the writer so no save or claim can interleave with the initial count
+    async with write_connection() as conn:
+        if category not in _blueprint_counts:
             async with conn.execute("""
-                SELECT id, subcategory, modifier, target_answer
-                FROM question_blueprints
+                SELECT COUNT(*) FROM question_blueprints
                 WHERE category = ? AND is_used = 0
-                ORDER BY RANDOM() LIMIT 1
             """, (category,)) as cursor:
                 row = await cursor.fetchone()
-            
-            if row:
-                blueprint = dict(row)
-                # Mark as used
-                await conn.execute("UPDATE question_blueprints SET is_used = 1 WHERE id = ?", (blueprint['id'],))
-                await conn.commit()
-                return blueprint
-            return None
-        except Exception as e:
-            print(f"Error getting blueprint: {e}")
-            await conn.rollback()
-            return None
-
-async def get_blueprint_count(category: str) -> int:
-    """Counts how many unused blueprints are available for a category."""
-    async with get_db_connection() as conn:
-        async with conn.execute("""
-            SELECT COUNT(*) FROM question_blueprints
-            WHERE category = ? AND is_used = 0
-        """, (category,)) as cursor:
-            row = await cursor.fetchone()
-            return row[0] if row else 0
+                _blueprint_counts[category] = row[0] if row else 0
+        return _blueprint_counts[category]
 
-async def add_question(question_data: Dict[str, Any], inputs: Dict[str, Any]):
-    """Adds a new, generated question to the permanent storage table."""
+async def add_question(question_data: Dict[str, Any], inputs: Dict[str, Any]) -> Optional[int]:
+    """Adds a new, generated question to the permanent storage table. Returns its id, or None if it was not saved."""
     category_name = inputs.get('category', 'Unknown') # Default for safety
     try:
-        async with get_db_connection() as conn:
-            await conn.execute("""
+        async with write_connection() as conn:
+            cursor = await conn.execute("""
                 INSERT INTO generated_questions (
                     model, language, category, knowledge_level, game_mode, theme,
                     question_text, answer_text, explanation, subcategory,
@@ -152,62 +524,140 @@ async def add_question(question_data: Dict[str, Any], inputs: Dict[str, Any]):
                 json.dumps(question_data.get("key_entities", [])),
                 json.dumps(question_data.get("options", []))
             ))
-            await conn.commit()
-            print(f"Saved new question for '{category_name}' in the 'generated_questions' table.")
+        print(f"Saved new question for '{category_name}' in the 'generated_questions' table.")
+        return cursor.lastrowid
     except aiosqlite.IntegrityError:
         print(f"INFO: Question for '{category_name}' already existed in the permanent storage (IntegrityError).")
     except Exception as e:
         print(f"ERROR: Failed to save question to the 'generated_questions' table for category '{category_name}'. Reason: {e}")
+    return None
 
-async def cache_question(category: str, question_data: Dict[str, Any]):
-    """Adds a preloaded question to the shared cache table."""
-    try:
-        async with get_db_connection() as conn:
-            await conn.execute(
-                "INSERT INTO preloaded_questions_cache (category, question_data_json) VALUES (?, ?)",
-                (category, json.dumps(question_data))
-            )
-            await conn.commit()
-    except Exception as e:
-        print(f"ERROR: Failed to cache a question for category '{category}'. Reason: {e}")
+_INSERT_GENERATED_SQL = """
+    INSERT INTO generated_questions (
+        model, language, category, knowledge_level, game_mode, theme,
+        question_text, answer_text, explanation, subcategory,
+        key_entities_json, options_json
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (question_text) DO NOTHING
+    RETURNING id
+"""
 
-async def get_and_remove_cached_question(category: str) -> Optional[Dict[str, Any]]:
-    """Atomically retrieves and deletes one question for a category from the cache."""
-    async with get_db_connection() as conn:
-        conn.row_factory = aiosqlite.Row
-        try:
-            # Find the oldest question for the category
-            async with conn.execute(
-                "SELECT id, question_data_json FROM preloaded_questions_cache WHERE category = ? ORDER BY id LIMIT 1",
-                (category,)
-            ) as cursor:
+async def save_question_batch(questions: List[Dict[str, Any]], inputs: Dict[str, Any],
+                              cache_key: Tuple[str, str, str, str, str], cache_from: int = 0) -> List[Tuple[Optional[int], Optional[int]]]:
+    """
+    Stores a batch of validated questions in one write transaction: every question goes into generated_questions
+    (duplicates of archived questions are skipped), and questions[cache_from:] also go into the preloaded cache
+    with their archive id set. Returns (archive_id, cache_row_id) per question; the transaction is all or nothing.
+    """
+    theme = inputs.get("theme") if inputs.get("includeCategoryTheme") else None
+    saved: List[Tuple[Optional[int], Optional[int]]] = []
+    async with write_connection() as conn:
+        for index, question_data in enumerate(questions):
+            async with conn.execute(_INSERT_GENERATED_SQL, (
+                inputs.get("model"), inputs.get("language"), inputs.get("category", "Unknown"),
+                inputs.get("knowledgeLevel"), inputs.get("gameMode"), theme,
+                question_data.get("question"),
+                question_data.get("answer"),
+                question_data.get("explanation"),
+                question_data.get("subcategory"),
+                json.dumps(question_data.get("key_entities", [])),
+                json.dumps(question_data.get("options", []))
+            )) as cursor:
                 row = await cursor.fetchone()
+            archive_id = row[0] if row else None
+            if archive_id is not None:
+                question_data["archive_id"] = archive_id
+            cache_row_id = None
+            if index >= cache_from:
+                cursor = await conn.execute(
+                    "INSERT INTO preloaded_questions_cache (category, language, knowledge_level, game_mode, theme, question_data_json) VALUES (?, ?, ?, ?, ?, ?)",
+                    (*cache_key, json.dumps(question_data))
+                )
+                cache_row_id = cursor.lastrowid
+            saved.append((archive_id, cache_row_id))
+    return saved
 
-            if row:
-                question_id = row['id']
-                question_data = json.loads(row['question_data_json'])
-
-                # Delete the question that was just retrieved
-                await conn.execute("DELETE FROM preloaded_questions_cache WHERE id = ?", (question_id,))
-                await conn.commit()
-                return question_data
-            else:
-                return None
-        except Exception as e:
-            print(f"ERROR: Failed during get_and_remove_cached_question for '{category}'. Reason: {e}")
-            await conn.rollback() # Rollback transaction on error
+_PICK_ARCHIVED_SQL = """
+    SELECT id, question_text, answer_text, explanation, subcategory, key_entities_json, options_json
+    FROM generated_questions
+    WHERE category = ? AND language = ? AND knowledge_level = ? AND game_mode = ? AND theme IS ?
+      AND id {op} ? AND id NOT IN (SELECT value FROM json_each(?))
+    ORDER BY id LIMIT 1
+"""
+
+async def pick_archived_question(cache_key: Tuple[str, str, str, str, str], exclude_ids: Iterable[int]) -> Optional[Dict[str, Any]]:
+    """
+    Picks a random archived question for the key that is not in exclude_ids. Seeks idx_generated_lookup
+    to a random id and walks forward (wrapping around once) instead of sorting the matching rows.
+    """
+    category, language, knowledge_level, game_mode, theme = cache_key
+    excluded = json.dumps(list(exclude_ids))
+    async with read_connection() as conn:
+        async with conn.execute("SELECT MAX(id) FROM generated_questions") as cursor:
+            max_id = (await cursor.fetchone())[0]
+        if max_id is None:
             return None
+        pivot = random.randint(1, max_id)
+        row = None
+        for op in (">=", "<"):
+            params = (category, language, knowledge_level, game_mode, theme or None, pivot, excluded)
+            async with conn.execute(_PICK_ARCHIVED_SQL.format(op=op), params) as cursor:
+                row = await cursor.fetchone()
+            if row:
+                break
+    if not row:
+        return None
+    try:
+        key_entities = json.loads(row['key_entities_json'] or "[]")
+        options = json.loads(row['options_json'] or "[]")
+    except json.JSONDecodeError:
+        key_entities, options = [], []
+    return {
+        "archive_id": row['id'],
+        "question": row['question_text'],
+        "answer": row['answer_text'],
+        "options": options,
+        "explanation": row['explanation'],
+        "subcategory": row['subcategory'],
+        "key_entities": key_entities,
+    }
 
-async def get_cache_count_for_category(category: str) -> int:
-    """Counts how many questions are currently cached for a specific category."""
-    async with get_db_connection() as conn:
-        async with conn.execute("SELECT COUNT(*) FROM preloaded_questions_cache WHERE category = ?", (category,)) as cursor:
-            row = await cursor.fetchone()
-            return row[0] if row else 0
+async def cache_question(cache_key: Tuple[str, str, str, str, str], question_data: Dict[str, Any]) -> Optional[int]:
+    """
+    Adds a preloaded question to the shared cache table under its (category, language, knowledge_level,
+    game_mode, theme) key. Returns the new row id.
+    """
+    try:
+        async with write_connection() as conn:
+            cursor = await conn.execute(
+                "INSERT INTO preloaded_questions_cache (category, language, knowledge_level, game_mode, theme, question_data_json) VALUES (?, ?, ?, ?, ?, ?)",
+                (*cache_key, json.dumps(question_data))
+            )
+            return cursor.lastrowid
+    except Exception as e:
+        print(f"ERROR: Failed to cache a question for key {cache_key}. Reason: {e}")
+        return None
+
+async def load_cached_questions() -> List[Tuple[int, Tuple[str, str, str, str, str], Dict[str, Any]]]:
+    """Returns every cached question as (id, cache_key, question_data), oldest first."""
+    async with read_connection() as conn:
+        async with conn.execute("""
+            SELECT id, category, language, knowledge_level, game_mode, theme, question_data_json
+            FROM preloaded_questions_cache ORDER BY id
+        """) as cursor:
+            rows = await cursor.fetchall()
+    cached = []
+    for row in rows:
+        try:
+            cache_key = (row['category'], row['language'], row['knowledge_level'], row['game_mode'], row['theme'])
+            cached.append((row['id'], cache_key, json.loads(row['question_data_json'])))
+        except (json.JSONDecodeError, TypeError):
+            print(f"WARNING: Skipping unreadable cached question with id {row['id']}.")
+    return cached
 
 async def update_model_stats_db(model_name: str, success: bool, response_time: float):
     """Updates model statistics in the database."""
-    async with get_db_connection() as conn:
+    async with write_connection() as conn:
         if success:
             await conn.execute("""
                 INSERT INTO model_stats (model_name, generated_questions, total_response_time)
@@ -223,57 +673,312 @@ async def update_model_stats_db(model_name: str, success: bool, response_time: f
                 ON CONFLICT(model_name) DO UPDATE SET
                     errors = errors + 1
             """, (model_name,))
-        await conn.commit()
+
+# (endpoint, error_details_json, model, error_signature, logged_at)
+ErrorEntry = Tuple[str, str, str, str, float]
+
+_SIGNATURE_NOISE = re.compile(r"0x[0-9a-fA-F]+|\d+")
+
+def make_error_entry(endpoint: str, error_details: Dict[str, Any], logged_at: Optional[float] = None) -> ErrorEntry:
+    """Serializes an error and derives the (model, signature) it is rolled up under."""
+    # Ensure details are JSON serializable
+    try:
+        details_str = json.dumps(error_details)
+    except TypeError:
+        details_str = json.dumps(str(error_details)) # Fallback to string representation
+    details = error_details if isinstance(error_details, dict) else {}
+    request = details.get("request") if isinstance(details.get("request"), dict) else {}
+    model = str(details.get("model") or request.get("model") or "")
+    # Numbers and ids vary between otherwise identical errors
+    signature = _SIGNATURE_NOISE.sub("#", str(details.get("error") or endpoint))[:200]
+    return (endpoint, details_str, model, signature, logged_at if logged_at is not None else time.time())
+
+async def _write_errors(conn: aiosqlite.Connection, entries: List[ErrorEntry]):
+    """Counts every error in its rollup bucket; stores full details only for the first one per bucket."""
+    for endpoint, details_str, model, signature, logged_at in entries:
+        bucket_start = int(logged_at // ERROR_ROLLUP_BUCKET_SECONDS) * ERROR_ROLLUP_BUCKET_SECONDS
+        async with conn.execute("""
+            INSERT INTO error_rollups (bucket_start, endpoint, model, error_signature, count, first_seen, last_seen)
+            VALUES (?, ?, ?, ?, 1, ?, ?)
+            ON CONFLICT(bucket_start, endpoint, model, error_signature) DO UPDATE SET
+                count = count + 1,
+                last_seen = excluded.last_seen
+            RETURNING count
+        """, (bucket_start, endpoint, model, signature, logged_at, logged_at)) as cursor:
+            row = await cursor.fetchone()
+        if row and row[0] == 1:
+            await conn.execute(
+                "INSERT INTO error_logs (endpoint, error_details_json) VALUES (?, ?)",
+                (endpoint, details_str)
+            )
 
 async def log_error_db(endpoint: str, error_details: Dict[str, Any]):
     """Logs an error entry into the database."""
-    async with get_db_connection() as conn:
-        # Ensure details are JSON serializable
-        try:
-            details_str = json.dumps(error_details)
-        except TypeError:
-            details_str = json.dumps(str(error_details)) # Fallback to string representation
-
-        await conn.execute(
-            "INSERT INTO error_logs (endpoint, error_details_json) VALUES (?, ?)",
-            (endpoint, details_str)
-        )
-        await conn.commit()
+    async with write_connection() as conn:
+        await _write_errors(conn, [make_error_entry(endpoint, error_details)])
 
 async def add_prompt_history_db(history_entry: Dict[str, Any]):
-    """Adds a new prompt to the history and ensures the table does not exceed 50 entries."""
-    async with get_db_connection() as conn:
-        # Add the new entry
-        await conn.execute(
-            "INSERT INTO prompt_history (timestamp, model, prompt, raw_response) VALUES (?, ?, ?, ?)",
-            (history_entry['timestamp'], history_entry['model'], history_entry['prompt'], history_entry['raw_response'])
-        )
-        # Check count and delete the oldest if necessary
-        async with conn.execute("SELECT COUNT(*) FROM prompt_history") as cursor:
-            row = await cursor.fetchone()
-            count = row[0] if row else 0
-            
-        if count > 50:
-            await conn.execute("DELETE FROM prompt_history WHERE id IN (SELECT id FROM prompt_history ORDER BY id ASC LIMIT ?)", (count - 50,))
-        await conn.commit()
+    """Writes one prompt into the next prompt_history ring slot."""
+    async with write_connection() as conn:
+        await _write_prompt_history(conn, [history_entry])
+
+async def write_telemetry_batch(model_stats: Dict[str, Dict[str, Any]], prompts: List[Dict[str, Any]], errors: List[ErrorEntry], cache_deletes: List[int] = ()):
+    """
+    Group-commits a batch of coalesced telemetry in a single transaction:
+    - model_stats: {model_name: {"generated_questions": n, "errors": n, "total_response_time": s}}
+    - prompts: prompt history entries, oldest first
+    - errors: entries built by make_error_entry()
+    - cache_deletes: ids of preloaded_questions_cache rows already served from memory
+    """
+    async with write_connection() as conn:
+        if cache_deletes:
+            await conn.executemany("DELETE FROM preloaded_questions_cache WHERE id = ?", [(row_id,) for row_id in cache_deletes])
+        if model_stats:
+            await conn.executemany("""
+                INSERT INTO model_stats (model_name, generated_questions, errors, total_response_time)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(model_name) DO UPDATE SET
+                    generated_questions = generated_questions + excluded.generated_questions,
+                    errors = errors + excluded.errors,
+                    total_response_time = total_response_time + excluded.total_response_time
+            """, [
+                (name, s["generated_questions"], s["errors"], s["total_response_time"])
+                for name, s in model_stats.items()
+            ])
+        if errors:
+            await _write_errors(conn, errors)
+        if prompts:
+            await _write_prompt_history(conn, prompts)
 
 async def get_all_stats() -> List[Dict[str, Any]]:
-    async with get_db_connection() as conn:
-        conn.row_factory = aiosqlite.Row
+    async with read_connection() as conn:
         async with conn.execute("SELECT model_name, generated_questions, errors, total_response_time FROM model_stats ORDER BY model_name") as cursor:
             rows = await cursor.fetchall()
             return [dict(row) for row in rows]
 
-async def get_prompt_history() -> List[Dict[str, Any]]:
-    async with get_db_connection() as conn:
-        conn.row_factory = aiosqlite.Row
-        async with conn.execute("SELECT id, timestamp, model, prompt, raw_response FROM prompt_history ORDER BY id DESC") as cursor:
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+# Admin listings are read in chunks of this many rows, each on a briefly borrowed reader connection
+ADMIN_PAGE_CHUNK = 100
 
-async def get_error_logs() -> List[Dict[str, Any]]:
-    async with get_db_connection() as conn:
-        conn.row_factory = aiosqlite.Row
-        async with conn.execute("SELECT id, timestamp, endpoint, error_details_json FROM error_logs ORDER BY id DESC") as cursor:
+_PROMPT_HISTORY_SELECT = "SELECT id, timestamp, model, prompt, raw_response FROM prompt_history"
+_ERROR_LOGS_SELECT = "SELECT id, timestamp, endpoint, error_details_json FROM error_logs"
+
+def _keyset_sql(query: str, conditions: List[str], has_cursor: bool) -> str:
+    where = list(conditions) + (["id < ?"] if has_cursor else [])
+    return query + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY id DESC LIMIT ?"
+
+async def _iter_keyset(query: str, conditions: List[str], params: List[Any], limit: int, before_id: Optional[int]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yields up to `limit` rows newest-first using keyset pagination on id.
+    Memory stays constant per request and no reader is held while the caller streams rows to a client.
+    """
+    remaining = limit
+    cursor_id = before_id
+    while remaining > 0:
+        chunk = min(remaining, ADMIN_PAGE_CHUNK)
+        args = list(params)
+        if cursor_id is not None:
+            args.append(cursor_id)
+        sql = _keyset_sql(query, conditions, cursor_id is not None)
+        async with read_connection() as conn:
+            async with conn.execute(sql, (*args, chunk)) as cursor:
+                rows = [dict(row) for row in await cursor.fetchall()]
+        for row in rows:
+            yield row
+        if len(rows) < chunk:
+            return
+        remaining -= len(rows)
+        cursor_id = rows[-1]['id']
+
+def iter_prompt_history(limit: int, before_id: Optional[int] = None, model: Optional[str] = None,
+                        since: Optional[datetime] = None, until: Optional[datetime] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Prompt history newest-first; pass the last returned id as before_id for the next page."""
+    conditions, params = [], []
+    if model:
+        conditions.append("model = ?")
+        params.append(model)
+    # Prompt timestamps are stored as ISO 8601 strings
+    if since:
+        conditions.append("timestamp >= ?")
+        params.append(since.isoformat())
+    if until:
+        conditions.append("timestamp < ?")
+        params.append(until.isoformat())
+    return _iter_keyset(_PROMPT_HISTORY_SELECT, conditions, params, limit, before_id)
+
+def iter_error_logs(limit: int, before_id: Optional[int] = None, endpoint: Optional[str] = None, model: Optional[str] = None,
+                    since: Optional[datetime] = None, until: Optional[datetime] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Error logs newest-first; pass the last returned id as before_id for the next page."""
+    conditions, params = [], []
+    if endpoint:
+        conditions.append("endpoint = ?")
+        params.append(endpoint)
+    if model:
+        conditions.append(f"{ERROR_LOG_MODEL_EXPR} = ?")
+        params.append(model)
+    # Error timestamps use SQLite's CURRENT_TIMESTAMP format
+    if since:
+        conditions.append("timestamp >= ?")
+        params.append(since.strftime("%Y-%m-%d %H:%M:%S"))
+    if until:
+        conditions.append("timestamp < ?")
+        params.append(until.strftime("%Y-%m-%d %H:%M:%S"))
+    return _iter_keyset(_ERROR_LOGS_SELECT, conditions, params, limit, before_id)
+
+
+async def compact_error_logs(max_age_days: float = ERROR_LOG_MAX_AGE_DAYS, max_rows: int = ERROR_LOG_MAX_ROWS,
+                             rollup_retention_days: float = ERROR_ROLLUP_RETENTION_DAYS) -> Dict[str, int]:
+    """Enforces error retention: drops raw rows past max age or beyond max_rows, and expired rollup buckets."""
+    now = time.time()
+    cutoff = datetime.fromtimestamp(now - max_age_days * 86400, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    async with write_connection() as conn:
+        cursor = await conn.execute("DELETE FROM error_logs WHERE timestamp < ?", (cutoff,))
+        expired = cursor.rowcount
+        cursor = await conn.execute(
+            "DELETE FROM error_logs WHERE id <= (SELECT id FROM error_logs ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (max_rows,)
+        )
+        overflow = cursor.rowcount
+        cursor = await conn.execute("DELETE FROM error_rollups WHERE bucket_start < ?", (now - rollup_retention_days * 86400,))
+        rollups = cursor.rowcount
+    return {"expired_rows": expired, "overflow_rows": overflow, "expired_rollups": rollups}
+
+async def get_error_summary(window_seconds: int) -> Dict[str, Any]:
+    """Error counts and rates over the window, grouped by endpoint, by model and by signature."""
+    since = time.time() - window_seconds
+    # Buckets overlapping the window start are included whole
+    bucket_floor = int(since // ERROR_ROLLUP_BUCKET_SECONDS) * ERROR_ROLLUP_BUCKET_SECONDS
+    hours = window_seconds / 3600
+    async with read_connection() as conn:
+        async with conn.execute("""
+            SELECT endpoint, SUM(count) AS errors, MAX(last_seen) AS last_seen
+            FROM error_rollups WHERE bucket_start >= ?
+            GROUP BY endpoint ORDER BY errors DESC
+        """, (bucket_floor,)) as cursor:
+            by_endpoint = [dict(row) for row in await cursor.fetchall()]
+        async with conn.execute("""
+            SELECT r.model, SUM(r.count) AS errors, s.generated_questions AS total_successes, s.errors AS total_errors
+            FROM error_rollups r LEFT JOIN model_stats s ON s.model_name = r.model
+            WHERE r.bucket_start >= ?
+            GROUP BY r.model ORDER BY errors DESC
+        """, (bucket_floor,)) as cursor:
+            by_model = [dict(row) for row in await cursor.fetchall()]
+        async with conn.execute("""
+            SELECT endpoint, model, error_signature, SUM(count) AS errors
+            FROM error_rollups WHERE bucket_start >= ?
+            GROUP BY endpoint, model, error_signature ORDER BY errors DESC LIMIT 20
+        """, (bucket_floor,)) as cursor:
+            top_signatures = [dict(row) for row in await cursor.fetchall()]
+    for row in by_endpoint:
+        row["errors_per_hour"] = round(row["errors"] / hours, 3)
+    for row in by_model:
+        row["errors_per_hour"] = round(row["errors"] / hours, 3)
+        # model_stats only keeps lifetime totals
+        total_errors = row.pop("total_errors") or 0
+        total_calls = (row.pop("total_successes") or 0) + total_errors
+        row["lifetime_error_rate"] = round(total_errors / total_calls, 4) if total_calls else None
+    return {
+        "window_seconds": window_seconds,
+        "bucket_seconds": ERROR_ROLLUP_BUCKET_SECONDS,
+        "by_endpoint": by_endpoint,
+        "by_model": by_model,
+        "top_signatures": top_signatures,
+    }
+
+# (bucket_start, model, endpoint, requests, errors, total_ms, counts)
+LatencyRow = Tuple[int, str, str, int, int, float, List[int]]
+
+async def write_latency_buckets(rows: List[LatencyRow], retention_days: float = LATENCY_RETENTION_DAYS):
+    """Merges histogram rows into latency_histograms and drops rows past retention."""
+    async with write_connection() as conn:
+        for bucket_start, model, endpoint, requests, errors, total_ms, counts in rows:
+            # A bucket is normally written once; merge in case it was flushed partially (e.g. across a restart)
+            async with conn.execute(
+                "SELECT requests, errors, total_ms, counts_json FROM latency_histograms WHERE bucket_start = ? AND model = ? AND endpoint = ?",
+                (bucket_start, model, endpoint)
+            ) as cursor:
+                existing = await cursor.fetchone()
+            if existing:
+                old_counts = json.loads(existing['counts_json'])
+                if len(old_counts) == len(counts):
+                    counts = [a + b for a, b in zip(old_counts, counts)]
+                requests += existing['requests']
+                errors += existing['errors']
+                total_ms += existing['total_ms']
+            await conn.execute("""
+                INSERT OR REPLACE INTO latency_histograms (bucket_start, model, endpoint, requests, errors, total_ms, counts_json)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (bucket_start, model, endpoint, requests, errors, total_ms, json.dumps(counts)))
+        await conn.execute("DELETE FROM latency_histograms WHERE bucket_start < ?", (time.time() - retention_days * 86400,))
+
+async def load_latency_buckets(since: float) -> List[LatencyRow]:
+    """Histogram rows whose bucket starts at or after `since` (unix seconds)."""
+    async with read_connection() as conn:
+        async with conn.execute("""
+            SELECT bucket_start, model, endpoint, requests, errors, total_ms, counts_json
+            FROM latency_histograms WHERE bucket_start >= ?
+        """, (since,)) as cursor:
             rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+    return [
+        (row['bucket_start'], row['model'], row['endpoint'], row['requests'], row['errors'], row['total_ms'], json.loads(row['counts_json']))
+        for row in rows
+    ]
+
+# (bucket_start, model, endpoint, game_id, calls, prompt_tokens, completion_tokens, estimated_calls)
+UsageRow = Tuple[int, str, str, str, int, int, int, int]
+# (bucket_start, game_id, questions)
+ServedRow = Tuple[int, str, int]
+
+async def write_usage_buckets(usage_rows: List[UsageRow], served_rows: List[ServedRow], retention_days: float = USAGE_RETENTION_DAYS):
+    """Adds token usage and served question counts to their minute rows and drops rows past retention."""
+    async with write_connection() as conn:
+        if usage_rows:
+            await conn.executemany("""
+                INSERT INTO token_usage (bucket_start, model, endpoint, game_id, calls, prompt_tokens, completion_tokens, estimated_calls)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (bucket_start, model, endpoint, game_id) DO UPDATE SET
+                    calls = calls + excluded.calls,
+                    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                    completion_tokens = completion_tokens + excluded.completion_tokens,
+                    estimated_calls = estimated_calls + excluded.estimated_calls
+            """, usage_rows)
+        if served_rows:
+            await conn.executemany("""
+                INSERT INTO served_questions (bucket_start, game_id, questions) VALUES (?, ?, ?)
+                ON CONFLICT (bucket_start, game_id) DO UPDATE SET questions = questions + excluded.questions
+            """, served_rows)
+        cutoff = time.time() - retention_days * 86400
+        await conn.execute("DELETE FROM token_usage WHERE bucket_start < ?", (cutoff,))
+        await conn.execute("DELETE FROM served_questions WHERE bucket_start < ?", (cutoff,))
+
+async def load_usage_buckets(since: float) -> Tuple[List[UsageRow], List[ServedRow]]:
+    """Token usage and served question rows whose bucket starts at or after `since` (unix seconds)."""
+    async with read_connection() as conn:
+        async with conn.execute("""
+            SELECT bucket_start, model, endpoint, game_id, calls, prompt_tokens, completion_tokens, estimated_calls
+            FROM token_usage WHERE bucket_start >= ?
+        """, (since,)) as cursor:
+            usage_rows = [tuple(row) for row in await cursor.fetchall()]
+        async with conn.execute("SELECT bucket_start, game_id, questions FROM served_questions WHERE bucket_start >= ?", (since,)) as cursor:
+            served_rows = [tuple(row) for row in await cursor.fetchall()]
+    return usage_rows, served_rows
+
+async def get_cached_response(key: str, now: float) -> Optional[Tuple[float, str, str]]:
+    """Returns (expires_at, parsed_json, raw_response) for an unexpired response cache entry."""
+    async with read_connection() as conn:
+        async with conn.execute(
+            "SELECT expires_at, parsed_json, raw_response FROM response_cache WHERE key = ? AND expires_at > ?", (key, now)
+        ) as cursor:
+            row = await cursor.fetchone()
+    return tuple(row) if row else None
+
+async def put_cached_response(key: str, endpoint: str, expires_at: float, parsed_json: str, raw_response: str):
+    async with write_connection() as conn:
+        await conn.execute("""
+            INSERT OR REPLACE INTO response_cache (key, endpoint, expires_at, parsed_json, raw_response)
+            VALUES (?, ?, ?, ?, ?)
+        """, (key, endpoint, expires_at, parsed_json, raw_response))
+
+async def purge_expired_responses() -> int:
+    async with write_connection() as conn:
+        cursor = await conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
+        return cursor.rowcount
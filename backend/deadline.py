@@ -0,0 +1,83 @@
+"""
+@file deadline.py
+End-to-end time budgets for generation requests.
+
+A Deadline is created once per piece of work: when an interactive request arrives (GENERATION_DEADLINE_SECONDS),
+per live quiz question and per preloaded question (PRELOAD_TIMEOUT_SECONDS). It is passed down to every stage
+that can wait: the preload wait, the blueprint batch, each call_generative_model attempt (queueing for a
+limiter slot, the provider call and its hedge), the backoff sleeps between attempts, database reads and a
+streamed explanation's wait for its limiter slot and first delta (streaming text is never cut off). Each stage gets at most the time left. A stage that would start with nothing left, or a sleep that would end
+past the deadline, raises DeadlineExceeded straight away; an awaited stage still running when time is up is
+cancelled, which releases its limiter slot and cancels a hedged duplicate with it. Routes answer
+DeadlineExceeded with a 504 (the explanation stream with an error event carrying status_code 504).
+"""
+
+import time
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+
+deadline_stats: Dict[str, Any] = {"started": 0, "exceeded": 0, "exceeded_by_stage": {}}
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage: str, budget: float):
+        super().__init__(f"Time budget of {budget:g}s used up during {stage}")
+        self.stage = stage
+        self.budget = budget
+
+class Deadline:
+    def __init__(self, seconds: Optional[float]):
+        """A budget of `seconds` from now; None never expires."""
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+        if seconds is not None:
+            deadline_stats["started"] += 1
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return float("inf")
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def cap(self, seconds: float) -> float:
+        """`seconds`, or less if the deadline comes sooner."""
+        return min(seconds, self.remaining())
+
+    def exceeded(self, stage: str) -> DeadlineExceeded:
+        deadline_stats["exceeded"] += 1
+        by_stage = deadline_stats["exceeded_by_stage"]
+        by_stage[stage] = by_stage.get(stage, 0) + 1
+        return DeadlineExceeded(stage, self.budget)
+
+    def check(self, stage: str):
+        """Raises DeadlineExceeded if there is no time left to start `stage`."""
+        if self.expired:
+            raise self.exceeded(stage)
+
+    async def run(self, awaitable: Awaitable[Any], stage: str) -> Any:
+        """Awaits `awaitable` for at most the time left, cancelling it when the deadline passes."""
+        if self.expires_at is None:
+            return await awaitable
+        remaining = self.remaining()
+        if remaining <= 0:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise self.exceeded(stage)
+        try:
+            return await asyncio.wait_for(awaitable, remaining)
+        except asyncio.TimeoutError:
+            # A timeout of the awaited work itself is not ours to translate
+            if not self.expired:
+                raise
+            raise self.exceeded(stage) from None
+
+    async def sleep(self, seconds: float, stage: str):
+        """Sleeps, unless waking up would already be past the deadline."""
+        if seconds >= self.remaining():
+            raise self.exceeded(stage)
+        await asyncio.sleep(seconds)
+
+# For callers without a budget
+NO_DEADLINE = Deadline(None)
@@ -1,148 +1,269 @@
-import asyncio
 import time
 import random
-from typing import Any, Tuple, List, Dict, Optional
+import asyncio
+import contextlib
+from typing import Any, AsyncIterator, Callable, Tuple, List, Dict, Optional
 from datetime import datetime
 
-from . import database
-from .config import client, DEBUG_MODE, GEN_CALL_MAX_ATTEMPTS, FALLBACK_MODEL, generative_api_limiter, GENERATIVE_CONCURRENCY_SEMAPHORE, PROMPTS
+from . import database, telemetry
+from .metrics import latency_histograms
+from .usage import token_usage
+from .singleflight import blueprint_flights
+from .response_cache import response_cache
+from .limiter import generative_limiter, is_rate_limit_error, retry_after_seconds, PRIORITY_CLASSES, PRIORITY_RANK
+from .hedging import hedge_policy
+from .model_health import model_health, ModelUnavailableError
+from .deadline import Deadline, DeadlineExceeded, NO_DEADLINE
+from .config import client, DEBUG_MODE, GEN_CALL_MAX_ATTEMPTS
+from .prompts import prompt_registry
 from .utils import extract_json_from_response, validate_model
 
+async def _send_request(request_params: Dict[str, Any], priority: str, endpoint: str,
+                        admitted: Optional[asyncio.Event] = None) -> Any:
+    """Sends one provider request under a limiter slot; `admitted` is set once the slot is held."""
+    model = request_params["model"]
+    model_health.acquire(model)
+    try:
+        # Only the provider call holds a limiter slot, so its latency is what the limiter adapts to
+        async with generative_limiter.slot(priority):
+            if admitted is not None:
+                admitted.set()
+            started = time.time()
+            response = await client.chat.completions.create(**request_params)
+    except BaseException as e:
+        model_health.record_failure(model, e)
+        raise
+    elapsed = time.time() - started
+    model_health.record_success(model, elapsed)
+    hedge_policy.observe(endpoint, elapsed)
+    return response
+
+def _parses(parsed: Any) -> bool:
+    return not (isinstance(parsed, dict) and list(parsed) == ["error"])
+
+def _usable_by(check: Callable[[Any], bool], parse: Callable[[str], Any]) -> Callable[[Any], bool]:
+    """Whether a response is worth keeping over a hedged duplicate: its parsed content passes the caller's check."""
+    return lambda response: check(parse(response.choices[0].message.content))
+
 # Rate-limit / retry aware call to generative model
-async def call_generative_model(prompt: str, model_name: str, return_raw=False) -> Any:
+async def call_generative_model(prompt: str, model_name: str, return_raw=False, endpoint: str = "unknown",
+                                cache_validator: Optional[Callable[[Any], bool]] = None, priority: str = "interactive",
+                                hedge: bool = False, validator: Optional[Callable[[Any], bool]] = None,
+                                game_id: Optional[str] = None, deadline: Optional[Deadline] = None,
+                                parse: Callable[[str], Any] = extract_json_from_response) -> Any:
     """
     Robust wrapper with:
-    - global concurrency semaphore (to limit simultaneous external calls)
-    - time-based AsyncLimiter (to shape requests per minute)
-    - exponential backoff on detected rate limits (429)
-    - fallback-to-other-model logic (but not used for rate limit retries)
+    - the shared adaptive limiter (simultaneous external calls and requests per minute, see limiter.py)
+    - Retry-After aware retries on detected rate limits (429), exponential backoff when there is none
+    - per-model circuit breakers: a model whose circuit is open is not called, and a failed attempt moves to
+      the fallback model or the healthiest available one (see model_health.py; not used for rate limit retries)
+    End-to-end latency is recorded in the latency histograms under `endpoint` (the calling feature).
+    `priority` is the scheduler class the call queues in (limiter.PRIORITY_CLASSES). hedge=True lets a slow
+    request be duplicated (see hedging.py); the first response that passes the check below wins.
+    Passing cache_validator opts into the response cache: a cached response for the same (model, prompt)
+    is returned without a call, and fresh responses are cached when cache_validator accepts them.
+    Whether the response was usable (validator, else cache_validator, else "it parses") feeds the model's health.
+    Token usage of every response is accounted to the model, endpoint and game_id (see usage.py).
+    With a deadline, attempts, waits for a limiter slot and backoff sleeps stop when it is used up: a call still
+    running is cancelled and DeadlineExceeded is raised (see deadline.py).
+    `parse` turns the response text into the returned data (utils.extract_question_batch_from_response for batches).
     """
     validate_model(model_name)
+    deadline = deadline or NO_DEADLINE
+    if cache_validator is not None:
+        cached = await response_cache.get(model_name, prompt, endpoint)
+        if cached is not None:
+            return cached if return_raw else cached[0]
     last_exception = None
     start_time = time.time()
     current_model = model_name
     raw_response = None
+    failed_models = set()
+    check = validator or cache_validator or _parses
 
     max_attempts = max(1, GEN_CALL_MAX_ATTEMPTS)
 
     for attempt in range(1, max_attempts + 1):
-        # check semaphores (initialized during startup)
+        deadline.check("model_call")
+        if not model_health.available(current_model):
+            alternative = model_health.fallback_for(current_model, failed_models)
+            if alternative is None:
+                print(f"ERROR: Model '{current_model}' is unavailable and no healthy alternative is left.")
+                last_exception = ModelUnavailableError(current_model, model_health.retry_in(current_model))
+                break
+            print(f"INFO: Model '{current_model}' is unavailable (circuit open), using '{alternative}'.")
+            current_model = alternative
         try:
-            concurrency_sem = GENERATIVE_CONCURRENCY_SEMAPHORE
-            if concurrency_sem is None:
-                # fallback to a no-op async context if not initialized (shouldn't happen after startup)
-                class _NoOp:
-                    async def __aenter__(self): pass
-                    async def __aexit__(self, exc_type, exc, tb): pass
-                concurrency_ctx = _NoOp()
+            messages = [{"role": "user", "content": prompt}]
+            request_params = {"model": current_model, "messages": messages, "response_format": {"type": "json_object"}}
+            if hedge:
+                response, current_model = await deadline.run(hedge_policy.run(
+                    endpoint, current_model,
+                    lambda model, admitted: _send_request({**request_params, "model": model}, priority, endpoint, admitted),
+                    _usable_by(check, parse)
+                ), "model_call")
             else:
-                concurrency_ctx = concurrency_sem
-
-            limiter = generative_api_limiter
-            if limiter is None:
-                # fallback no-op limiter
-                class _NoOp:
-                    async def __aenter__(self): pass
-                    async def __aexit__(self, exc_type, exc, tb): pass
-                limiter_ctx = _NoOp()
-            else:
-                limiter_ctx = limiter
-
-            async with concurrency_ctx:
-                async with limiter_ctx:
-                    messages = [{"role": "user", "content": prompt}]
-                    request_params = {"model": current_model, "messages": messages, "response_format": {"type": "json_object"}}
-                    response = await client.chat.completions.create(**request_params)
-                    response_text = response.choices[0].message.content
-                    raw_response = response_text
-                    if DEBUG_MODE:
-                        print(f"Raw response: {raw_response}")
-                    response_time = time.time() - start_time
-                    await database.update_model_stats_db(model_name=current_model, success=True, response_time=response_time)
-                    history_entry = {
-                        "timestamp": datetime.utcnow().isoformat(),
-                        "model": current_model, "prompt": prompt, "raw_response": response_text
-                    }
-                    await database.add_prompt_history_db(history_entry)
-                    parsed_data = extract_json_from_response(response_text)
-                    if return_raw:
-                        return parsed_data, response_text
-                    return parsed_data
+                response = await deadline.run(_send_request(request_params, priority, endpoint), "model_call")
+            response_text = response.choices[0].message.content
+            raw_response = response_text
+            if DEBUG_MODE:
+                print(f"Raw response: {raw_response}")
+            response_time = time.time() - start_time
+            telemetry.record_model_stats(model_name=current_model, success=True, response_time=response_time)
+            latency_histograms.observe(current_model, endpoint, response_time, success=True)
+            token_usage.record_response(current_model, endpoint, game_id, response, prompt, response_text)
+            history_entry = {
+                "timestamp": datetime.utcnow().isoformat(),
+                "model": current_model, "prompt": prompt, "raw_response": response_text
+            }
+            telemetry.record_prompt_history(history_entry)
+            parsed_data = parse(response_text)
+            is_valid = check(parsed_data)
+            model_health.record_validation(current_model, is_valid)
+            if cache_validator is not None and (is_valid if check is cache_validator else cache_validator(parsed_data)):
+                await response_cache.put(model_name, prompt, endpoint, parsed_data, response_text)
+            if return_raw:
+                return parsed_data, response_text
+            return parsed_data
+        except DeadlineExceeded:
+            # Not the model's failure: no fallback, no retry
+            raise
         except Exception as e:
             last_exception = e
-            err_text = str(e).lower()
-            is_rate_limit = False
-            try:
-                # heuristics to detect 429 or rate-limit
-                if '429' in err_text or 'rate limit' in err_text or 'ratelimit' in err_text or 'too many requests' in err_text:
-                    is_rate_limit = True
-                elif hasattr(e, 'status_code') and int(getattr(e, 'status_code', 0)) == 429:
-                    is_rate_limit = True
-                elif hasattr(e, 'status') and int(getattr(e, 'status', 0)) == 429:
-                    is_rate_limit = True
-            except Exception:
-                is_rate_limit = False
-
-            # Rate-limit specific handling: exponential backoff + jitter, do NOT immediately switch model
-            if is_rate_limit:
-                backoff = min(60, (2 ** attempt)) + random.random()
-                print(f"Rate-limited by API. Backing off {backoff:.1f}s (attempt {attempt}/{max_attempts}).")
-                await asyncio.sleep(backoff)
+
+            # Rate-limit specific handling: wait as told (or back off), do NOT immediately switch model
+            if is_rate_limit_error(e):
+                retry_after = retry_after_seconds(e)
+                if retry_after is not None:
+                    # The limiter already holds every caller back until Retry-After has passed
+                    print(f"Rate-limited by API. Retrying after {retry_after:.1f}s (attempt {attempt}/{max_attempts}).")
+                else:
+                    backoff = min(60, (2 ** attempt)) + random.random()
+                    print(f"Rate-limited by API. Backing off {backoff:.1f}s (attempt {attempt}/{max_attempts}).")
+                    await deadline.sleep(backoff, "backoff")
                 # continue trying the same model after backoff
                 continue
 
             print(f"ERROR: Attempt with model '{current_model}' failed: {e}")
-            # If not rate limit, consider fallback model once
-            if FALLBACK_MODEL and current_model != FALLBACK_MODEL:
-                print(f"INFO: Attempting fallback to model: {FALLBACK_MODEL}")
-                current_model = FALLBACK_MODEL
+            # If not rate limit, move to the fallback model (or the healthiest other model) if one is available
+            failed_models.add(current_model)
+            alternative = model_health.fallback_for(current_model, failed_models)
+            if alternative is not None:
+                print(f"INFO: Attempting fallback to model: {alternative}")
+                current_model = alternative
                 # proceed to next iteration to try fallback
                 continue
             else:
                 # small delay before next attempt to avoid hot-looping
-                await asyncio.sleep(min(5, 0.5 * attempt))
+                await deadline.sleep(min(5, 0.5 * attempt), "backoff")
                 continue
 
     # All attempts exhausted
     response_time = time.time() - start_time
-    try:
-        await database.update_model_stats_db(model_name=current_model, success=False, response_time=response_time)
-    except Exception:
-        pass
-    await database.log_error_db("call_generative_model", {"model": current_model, "error": str(last_exception), "raw_response_snippet": raw_response[:200] if raw_response else "None"})
+    telemetry.record_model_stats(model_name=current_model, success=False, response_time=response_time)
+    latency_histograms.observe(current_model, endpoint, response_time, success=False)
+    telemetry.log_error("call_generative_model", {"model": current_model, "error": str(last_exception), "raw_response_snippet": raw_response[:200] if raw_response else "None"})
     raise last_exception if last_exception else Exception("Unknown error in call_generative_model")
 
 
-async def ensure_blueprints_exist(category: str, language: str, theme: str, model: str = "trivia") -> None:
+async def stream_generative_model(prompt: str, model_name: str, endpoint: str = "unknown", priority: str = "interactive",
+                                  game_id: Optional[str] = None, deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+    """
+    Yields the completion's text deltas as they arrive (OpenAI-compatible stream=True), under the same
+    adaptive limiter as call_generative_model. There are no retries or model fallback:
+    text already shown to a player can't be taken back, so callers fall back to call_generative_model when
+    the stream fails before the first delta. Stats, latency and prompt history are recorded for the full text;
+    time to first token is recorded under "<endpoint>:first_token". Streamed responses carry no usage block,
+    so their tokens are estimated.
+    With a deadline, the wait for a limiter slot and for the first delta stop when it is used up
+    (DeadlineExceeded); once text is streaming it is not cut off.
+    """
+    validate_model(model_name)
+    deadline = deadline or NO_DEADLINE
+    model_health.acquire(model_name)
+    start_time = time.time()
+    chunks: List[str] = []
+    try:
+        async with contextlib.AsyncExitStack() as stack:
+            await deadline.run(stack.enter_async_context(generative_limiter.slot(priority)), "queue")
+            messages = [{"role": "user", "content": prompt}]
+            stream = await deadline.run(client.chat.completions.create(
+                model=model_name, messages=messages, response_format={"type": "json_object"}, stream=True
+            ), "first_token")
+            stream_iter = aiter(stream)
+            while True:
+                next_chunk = anext(stream_iter, None)
+                chunk = await (next_chunk if chunks else deadline.run(next_chunk, "first_token"))
+                if chunk is None:
+                    break
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                if not chunks:
+                    latency_histograms.observe(model_name, f"{endpoint}:first_token", time.time() - start_time)
+                chunks.append(delta)
+                yield delta
+    except DeadlineExceeded:
+        # Like a cancelled call_generative_model attempt: not the model's failure
+        model_health.record_failure(model_name, asyncio.CancelledError())
+        raise
+    except BaseException as e:
+        model_health.record_failure(model_name, e)
+        if not isinstance(e, Exception):
+            raise
+        response_time = time.time() - start_time
+        telemetry.record_model_stats(model_name=model_name, success=False, response_time=response_time)
+        latency_histograms.observe(model_name, endpoint, response_time, success=False)
+        telemetry.log_error("stream_generative_model", {"model": model_name, "error": str(e), "streamed_chars": sum(len(c) for c in chunks)})
+        raise
+    response_text = "".join(chunks)
+    if DEBUG_MODE:
+        print(f"Raw streamed response: {response_text}")
+    response_time = time.time() - start_time
+    model_health.record_success(model_name, response_time)
+    telemetry.record_model_stats(model_name=model_name, success=True, response_time=response_time)
+    latency_histograms.observe(model_name, endpoint, response_time, success=True)
+    token_usage.record_response(model_name, endpoint, game_id, None, prompt, response_text)
+    telemetry.record_prompt_history({
+        "timestamp": datetime.utcnow().isoformat(),
+        "model": model_name, "prompt": prompt, "raw_response": response_text
+    })
+
+async def ensure_blueprints_exist(category: str, language: str, theme: str, model: str = "trivia", coalesce: bool = True,
+                                  priority: str = "bulk", deadline: Optional[Deadline] = None) -> None:
     """
     Ensure there are enough unused blueprints for the given category.
     If the count is less than 5, generate a batch of 20 blueprints and save them.
+    Concurrent callers for the same (category, language, theme) share one batch unless coalesce=False. A caller
+    only joins a batch queued at its own priority class or a better one, so a player waiting on a question never
+    waits behind a "bulk" batch; it starts its own instead. A caller's deadline limits how long it waits for the
+    batch, not the shared batch itself.
     """
-    count = await database.get_blueprint_count(category)
+    deadline = deadline or NO_DEADLINE
+    count = await deadline.run(database.get_blueprint_count(category), "database")
     if count >= 5:
         if DEBUG_MODE:
             print(f"Sufficient blueprints for '{category}' ({count} available).")
         return
+    keys = [(category, language, theme, better) for better in PRIORITY_CLASSES[:PRIORITY_RANK[priority] + 1]]
+    key = next((k for k in keys if blueprint_flights.pending(k) is not None), keys[-1])
+    await deadline.run(blueprint_flights.do(
+        key,
+        lambda: _generate_blueprints(category, language, theme, model, priority),
+        share=coalesce
+    ), "blueprints")
+
+async def _generate_blueprints(category: str, language: str, theme: str, model: str, priority: str) -> None:
+    # Another batch for this category (e.g. for a different theme) may have landed while we waited
+    count = await database.get_blueprint_count(category)
+    if count >= 5:
+        return
 
     print(f"Generating new blueprints for category: {category}")
-    prompt_struct = PROMPTS["generate_blueprints"][language]
-    # Build prompt - handle different key names for generate_blueprints
-    if "persona" in prompt_struct:
-        persona = prompt_struct["persona"]
-        instructions_key = "static_instructions"
-    else:
-        persona = prompt_struct.get("system", "")
-        instructions_key = "instruction"
-    static_part = [
-        persona,
-        "\n".join(prompt_struct[instructions_key])
-    ]
-    static_content = "\n\n".join(static_part)
-    dynamic_content = prompt_struct["task_template"].format(category=category, theme=theme)
-    full_prompt = f"{static_content}\n\n{dynamic_content}"
+    full_prompt = prompt_registry.get("generate_blueprints", language).render(category=category, theme=theme)
 
     try:
-        response_json = await call_generative_model(full_prompt, model)
+        response_json = await call_generative_model(full_prompt, model, endpoint="blueprints", priority=priority)
         # Expect response_json to be a list of objects or a dict with a key "topics"
         blueprints = response_json.get("topics", []) if isinstance(response_json, dict) else response_json
         if not isinstance(blueprints, list):
@@ -154,4 +275,4 @@ async def ensure_blueprints_exist(category: str, language: str, theme: str, mode
             print(f"Warning: No blueprints generated for '{category}'.")
     except Exception as e:
         print(f"Error generating blueprints for '{category}': {e}")
-        await database.log_error_db("ensure_blueprints_exist", {"category": category, "error": str(e)})
\ No newline at end of file
+        telemetry.log_error("ensure_blueprints_exist", {"category": category, "error": str(e)})
\ No newline at end of file
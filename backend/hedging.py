@@ -0,0 +1,151 @@
+"""
+@file hedging.py
+Hedged requests for latency-sensitive generative calls.
+
+A hedged call sends the request and, if no response has arrived after the HEDGE_PERCENTILE latency of recent
+requests for the same endpoint (counted from when the request holds a limiter slot), sends a duplicate (to
+HEDGE_ALTERNATE_MODEL, or the same model). The first acceptable response (one the caller's validator takes)
+wins and the other request is cancelled. Hedges are limited by a budget: every hedgeable call earns
+HEDGE_BUDGET of a hedge, so at most that share of calls is duplicated. No hedge is sent for an endpoint until HEDGE_MIN_SAMPLES latencies have been observed for it.
+"""
+
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from .config import (
+    HEDGE_ENABLED, HEDGE_PERCENTILE, HEDGE_BUDGET, HEDGE_MIN_SAMPLES, HEDGE_MIN_DELAY_MS, HEDGE_ALTERNATE_MODEL,
+)
+
+# Recent latencies kept per endpoint, and how often the hedge delay is recomputed from them
+LATENCY_WINDOW = 200
+DELAY_REFRESH_EVERY = 10
+# Unused budget carried over, in hedges
+MAX_BUDGET_CREDIT = 5.0
+
+class HedgePolicy:
+    def __init__(self, enabled: bool = HEDGE_ENABLED, percentile: float = HEDGE_PERCENTILE, budget: float = HEDGE_BUDGET,
+                 min_samples: int = HEDGE_MIN_SAMPLES, min_delay_ms: int = HEDGE_MIN_DELAY_MS,
+                 alternate_model: str = HEDGE_ALTERNATE_MODEL):
+        self.enabled = enabled
+        self.percentile = min(0.999, max(0.5, percentile))
+        self.budget = max(0.0, budget)
+        self.min_samples = max(1, min_samples)
+        self.min_delay = max(0, min_delay_ms) / 1000
+        self.alternate_model = alternate_model or None
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._delays: Dict[str, Optional[float]] = {}
+        self._since_refresh: Dict[str, int] = {}
+        self._credit = 1.0
+        self.stats_by_endpoint: Dict[str, Dict[str, int]] = {}
+
+    def _stats(self, endpoint: str) -> Dict[str, int]:
+        stats = self.stats_by_endpoint.get(endpoint)
+        if stats is None:
+            stats = self.stats_by_endpoint[endpoint] = {
+                "calls": 0, "hedges_sent": 0, "hedge_wins": 0, "primary_wins": 0, "budget_denied": 0, "no_baseline": 0,
+            }
+        return stats
+
+    def observe(self, endpoint: str, seconds: float):
+        """Records the latency of one successful provider request."""
+        latencies = self._latencies.get(endpoint)
+        if latencies is None:
+            latencies = self._latencies[endpoint] = deque(maxlen=LATENCY_WINDOW)
+        latencies.append(seconds)
+        count = self._since_refresh.get(endpoint, DELAY_REFRESH_EVERY) + 1
+        if count >= DELAY_REFRESH_EVERY:
+            count = 0
+            self._delays[endpoint] = self._compute_delay(latencies)
+        self._since_refresh[endpoint] = count
+
+    def _compute_delay(self, latencies: Deque[float]) -> Optional[float]:
+        if len(latencies) < self.min_samples:
+            return None
+        ordered = sorted(latencies)
+        return max(self.min_delay, ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))])
+
+    def delay_for(self, endpoint: str) -> Optional[float]:
+        return self._delays.get(endpoint)
+
+    def _try_spend(self) -> bool:
+        if self._credit >= 1:
+            self._credit -= 1
+            return True
+        return False
+
+    async def run(self, endpoint: str, model: str, send: Callable[[str, asyncio.Event], Awaitable[Any]],
+                  accept: Callable[[Any], bool]) -> Tuple[Any, str]:
+        """
+        Runs send(model, admitted), hedging it with send(alternate model, ...) when it is slow. send sets
+        `admitted` once its request holds a limiter slot. Returns (response, model) of the first response
+        accept() takes; if neither is acceptable, the primary's outcome is returned or raised.
+        """
+        if not self.enabled:
+            return await send(model, asyncio.Event()), model
+        stats = self._stats(endpoint)
+        stats["calls"] += 1
+        self._credit = min(MAX_BUDGET_CREDIT, self._credit + self.budget)
+
+        admitted = asyncio.Event()
+        primary = asyncio.ensure_future(send(model, admitted))
+        delay = self.delay_for(endpoint)
+        if delay is None:
+            stats["no_baseline"] += 1
+            return await primary, model
+        admission = asyncio.ensure_future(admitted.wait())
+        try:
+            # The delay counts from when the primary holds its limiter slot: time queued for one is not provider
+            # slowness, and a duplicate would only queue behind it
+            await asyncio.wait({primary, admission}, return_when=asyncio.FIRST_COMPLETED)
+            if not primary.done():
+                await asyncio.wait({primary}, timeout=delay)
+        except BaseException:
+            primary.cancel()
+            raise
+        finally:
+            admission.cancel()
+        if primary.done():
+            return primary.result(), model
+        if not self._try_spend():
+            stats["budget_denied"] += 1
+            return await primary, model
+
+        stats["hedges_sent"] += 1
+        hedge_model = self.alternate_model or model
+        hedge = asyncio.ensure_future(send(hedge_model, asyncio.Event()))
+        models = {primary: model, hedge: hedge_model}
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and accept(task.result()):
+                        stats["hedge_wins" if task is hedge else "primary_wins"] += 1
+                        return task.result(), models[task]
+            # Neither was acceptable: surface the primary's own result or error
+            stats["primary_wins"] += 1
+            return primary.result(), model
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint, stats in self.stats_by_endpoint.items():
+            delay = self._delays.get(endpoint)
+            endpoints[endpoint] = {
+                **stats,
+                "hedge_rate": round(stats["hedges_sent"] / stats["calls"], 4) if stats["calls"] else None,
+                "hedge_win_rate": round(stats["hedge_wins"] / stats["hedges_sent"], 4) if stats["hedges_sent"] else None,
+                "delay_ms": round(delay * 1000, 1) if delay is not None else None,
+            }
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "budget": self.budget,
+            "alternate_model": self.alternate_model,
+            "endpoints": endpoints,
+        }
+
+hedge_policy = HedgePolicy()
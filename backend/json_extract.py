@@ -0,0 +1,223 @@
+"""
+@file json_extract.py
+Single-pass, string-aware extraction of the JSON value in a model response.
+
+Nearly every response is exactly one JSON value (the calls ask for response_format=json_object), so
+extract_json tries json.loads on it first; one wrapped in prose or a ``` fence is handed to the C decoder
+from where its value starts. JsonScanner handles the rest in one pass, jumping from token to token (a whole
+string or a structural character) with a regex instead of looking at every character:
+- leading whitespace and ``` fences are skipped; a response starting with prose is searched for its first '{'
+- quotes and escapes are tracked, so braces, brackets and commas inside strings don't count
+- the outermost value ends where its last container closes; anything after it is ignored
+- commas directly before a closing '}' or ']' are dropped before parsing
+- output that stops early (max_tokens, a dropped stream) is an error (JsonTruncatedError) unless the caller
+  asks for repair: it is then cut back to the last complete member or element and closed; a string value cut
+  off mid-way is kept as far as it goes, a scalar at the very end is dropped. Only stream previews
+  (string_field) and batch salvage (utils.extract_question_batch_from_response) repair; a cut-off question
+  must not look like a whole one
+The scanner keeps its state between feed() calls, so a streamed response is scanned once in total.
+"""
+
+import re
+import json
+from typing import Any, List, Optional
+
+_LEAD = re.compile(r'(?:\s+|```[A-Za-z]*)+')
+# A whole string (group 1 is its closing quote, empty while it is still arriving) or a structural character
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*("?)|[{}\[\],:]', re.S)
+_STRING_REST = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*("?)', re.S)
+_ESCAPE = re.compile(r'\\(?:u[0-9a-fA-F]{0,4}|.)', re.S)
+_BLANK = re.compile(r'\s*')
+_CLOSERS = {"{": "}", "[": "]"}
+_DECODER = json.JSONDecoder(strict=False)
+
+class JsonExtractError(ValueError):
+    pass
+
+class JsonTruncatedError(JsonExtractError):
+    pass
+
+class JsonScanner:
+    def __init__(self):
+        self.text = ""
+        # Span of the outermost value in text (end stays -1 until it is complete)
+        self.start = -1
+        self.end = -1
+        self._pos = 0
+        self._prose = False
+        self._stack: List[str] = []
+        self._in_string = False
+        self._in_key = False
+        self._string_start = -1
+        self._expect_key = False
+        self._last_comma = -1
+        self._trailing_commas: List[int] = []
+        # Where the value can be cut and closed, and how many containers are open there
+        self._cut = -1
+        self._cut_depth = 0
+
+    @property
+    def complete(self) -> bool:
+        return self.end >= 0
+
+    def feed(self, chunk: str) -> bool:
+        """Appends the next part of the response and scans it. Returns whether the value is complete."""
+        if chunk:
+            self.text += chunk
+            if not self.complete and (self.start >= 0 or self._locate()):
+                self._scan()
+        return self.complete
+
+    def _open(self, index: int):
+        self.start = index
+        self._pos = index + 1
+        self._stack = [self.text[index]]
+        self._expect_key = self.text[index] == "{"
+        self._cut, self._cut_depth = index + 1, 1
+
+    def _locate(self) -> bool:
+        """Finds where the value starts. Returns False while it hasn't arrived."""
+        text, n = self.text, len(self.text)
+        pos = self._pos
+        if not self._prose:
+            match = _LEAD.match(text, pos)
+            lead_end = match.end() if match else pos
+            # Only whitespace or a fence so far; the fence's language tag may still be arriving
+            if lead_end == n or (text[lead_end] == "`" and n - lead_end < 3):
+                return False
+            if text[lead_end] in "{[":
+                self._open(lead_end)
+                return True
+            self._prose = True
+            pos = lead_end
+        index = text.find("{", pos)
+        if index < 0:
+            self._pos = n
+            return False
+        self._open(index)
+        return True
+
+    def _scan(self):
+        text, n = self.text, len(self.text)
+        stack = self._stack
+        pos = self._pos
+        # The loop runs once per token: its state lives in locals and is stored back at the end
+        in_string, in_key, expect_key = self._in_string, self._in_key, self._expect_key
+        cut, cut_depth, last_comma = self._cut, self._cut_depth, self._last_comma
+        token_search, string_rest = _TOKEN.search, _STRING_REST.match
+        while pos < n:
+            if in_string:
+                match = string_rest(text, pos)
+                pos = match.end()
+                if not match.group(1):
+                    # Still open (pos stops before a lone backslash, to be read with the next chunk)
+                    break
+                in_string = False
+                if not in_key:
+                    cut, cut_depth = pos, len(stack)
+                continue
+            match = token_search(text, pos)
+            if match is None:
+                pos = n
+                break
+            i = match.start()
+            ch = text[i]
+            pos = match.end()
+            if ch == '"':
+                if not match.group(1):
+                    in_string, in_key, self._string_start = True, expect_key, i
+                    pos = i + 1
+                elif not expect_key:
+                    cut, cut_depth = pos, len(stack)
+            elif ch == ",":
+                last_comma = i
+                expect_key = stack[-1] == "{"
+                cut, cut_depth = i, len(stack)
+            elif ch == ":":
+                expect_key = False
+            elif ch == "{" or ch == "[":
+                stack.append(ch)
+                expect_key = ch == "{"
+                cut, cut_depth = pos, len(stack)
+            else:
+                if last_comma >= 0 and _BLANK.fullmatch(text, last_comma + 1, i):
+                    self._trailing_commas.append(last_comma)
+                stack.pop()
+                expect_key = False
+                if not stack:
+                    self.end = pos
+                    break
+                cut, cut_depth = pos, len(stack)
+        self._pos = pos
+        self._in_string, self._in_key, self._expect_key = in_string, in_key, expect_key
+        self._cut, self._cut_depth, self._last_comma = cut, cut_depth, last_comma
+
+    def _slice(self, end: int) -> str:
+        """text[start:end] without the trailing commas."""
+        parts, last = [], self.start
+        for comma in self._trailing_commas:
+            if comma >= end:
+                break
+            parts.append(self.text[last:comma])
+            last = comma + 1
+        parts.append(self.text[last:end])
+        return "".join(parts)
+
+    def value(self) -> Any:
+        """
+        The outermost value: parsed whole once complete, otherwise repaired from what has arrived.
+        Raises JsonExtractError when no object or array has started, json.JSONDecodeError when it is malformed.
+        """
+        if self.start < 0:
+            raise JsonExtractError("No JSON object or array in the response")
+        if self.complete:
+            return _DECODER.decode(self._slice(self.end))
+        if self._in_string and not self._in_key:
+            end, depth, suffix = self._pos, len(self._stack), '"'
+            # Leave out a \u escape that is still arriving
+            last = None
+            for last in _ESCAPE.finditer(self.text, self._string_start + 1, end):
+                pass
+            if last is not None and last.end() == end and last.group()[1] == "u" and len(last.group()) < 6:
+                end = last.start()
+        else:
+            end, depth, suffix = self._cut, self._cut_depth, ""
+        closers = "".join(_CLOSERS[ch] for ch in reversed(self._stack[:depth]))
+        return _DECODER.decode(self._slice(end) + suffix + closers)
+
+    def string_field(self, field: str) -> Optional[str]:
+        """
+        The string value of a top-level field in what has arrived so far (as far as it goes while it is
+        still arriving), or None if it hasn't started.
+        """
+        try:
+            value = self.value()
+        except ValueError:
+            return None
+        part = value.get(field) if isinstance(value, dict) else None
+        return part if isinstance(part, str) else None
+
+def extract_json(text: str, repair: bool = False) -> Any:
+    """
+    The JSON value in a model response. Raises ValueError when there is none, JsonTruncatedError when it was
+    cut off and repair is False.
+    """
+    stripped = text.strip()
+    # One C-speed parse for the usual bare value; output that can't be one (prose or a fence around it,
+    # truncation) goes straight to the scanner
+    if stripped[:1] not in ("{", "[") or stripped[-1:] in ("}", "]"):
+        try:
+            return _DECODER.decode(stripped)
+        except ValueError:
+            pass
+    scanner = JsonScanner()
+    scanner.text = text
+    if scanner._locate():
+        # Prose or a fence around a well-formed value: let the C decoder parse it from where it starts
+        try:
+            return _DECODER.raw_decode(text, scanner.start)[0]
+        except ValueError:
+            scanner._scan()
+    if scanner.start >= 0 and not scanner.complete and not repair:
+        raise JsonTruncatedError("The JSON value in the response is cut off")
+    return scanner.value()
@@ -0,0 +1,331 @@
+"""
+@file limiter.py
+Adaptive (AIMD) concurrency and rate limiter for calls to the generative API.
+
+Every provider call holds a slot: a concurrency permit plus a token from a rate bucket. Callers waiting
+for one are admitted by priority class rather than FIFO (see PRIORITY_CLASSES): a share of the slots is
+reserved for the foreground classes, and waiting work ages one class per SCHEDULER_AGING_SECONDS so
+background work is never starved. While calls succeed
+with healthy latency (the short-term latency average stays within GENERATIVE_LATENCY_TOLERANCE of the
+long-term baseline) and a low error rate, the limits grow additively: about one extra concurrent call per
+round of `limit` successes, and a tenth of the configured rate per round, but only while that limit is the
+one callers actually queue on. A 429 halves both the concurrency limit and the rate, a timeout halves the
+concurrency limit; decreases happen at most once per baseline latency so a burst of failures from the same
+round counts once. A Retry-After (or retry-after-ms) header holds every caller back until it has passed.
+
+With GENERATIVE_ADAPTIVE_LIMITS=false the limits stay at their configured values (Retry-After is still honored).
+"""
+
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from openai import APITimeoutError
+
+from .config import (
+    GENERATIVE_ADAPTIVE_LIMITS, GENERATIVE_INFLIGHT_LIMIT, GENERATIVE_INFLIGHT_MIN, GENERATIVE_INFLIGHT_MAX,
+    GENERATIVE_RATE_LIMIT_COUNT, GENERATIVE_RATE_LIMIT_PERIOD, GENERATIVE_RATE_LIMIT_MAX_COUNT,
+    GENERATIVE_LATENCY_TOLERANCE, SCHEDULER_RESERVED_SHARE, SCHEDULER_AGING_SECONDS,
+)
+
+# Priority classes, best first: a player waiting on a response, live game questions, speculative preloads,
+# blueprint batches. The foreground classes may use the slots reserved by SCHEDULER_RESERVED_SHARE.
+PRIORITY_CLASSES = ("interactive", "live", "prefetch", "bulk")
+PRIORITY_RANK = {name: rank for rank, name in enumerate(PRIORITY_CLASSES)}
+FOREGROUND_CLASSES = frozenset(("interactive", "live"))
+
+DECREASE_FACTOR = 0.5
+# Smoothing of the short-term latency, the long-term baseline and the error rate
+FAST_ALPHA = 0.3
+SLOW_ALPHA = 0.02
+ERROR_ALPHA = 0.1
+# No increases while more than this share of recent calls failed
+HEALTHY_ERROR_RATE = 0.1
+# A broken Retry-After must not stall generation for long
+RETRY_AFTER_MAX_SECONDS = 120.0
+
+def is_rate_limit_error(e: BaseException) -> bool:
+    """Heuristics to detect a 429 / rate-limit error from any OpenAI-compatible provider."""
+    err_text = str(e).lower()
+    try:
+        if '429' in err_text or 'rate limit' in err_text or 'ratelimit' in err_text or 'too many requests' in err_text:
+            return True
+        if hasattr(e, 'status_code') and int(getattr(e, 'status_code', 0)) == 429:
+            return True
+        if hasattr(e, 'status') and int(getattr(e, 'status', 0)) == 429:
+            return True
+    except Exception:
+        pass
+    return False
+
+def is_timeout_error(e: BaseException) -> bool:
+    return isinstance(e, (APITimeoutError, asyncio.TimeoutError, TimeoutError))
+
+def retry_after_seconds(e: BaseException) -> Optional[float]:
+    """Seconds to wait according to the error response's retry-after-ms / Retry-After header, if it has one."""
+    headers = getattr(getattr(e, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        value = headers.get('retry-after-ms')
+        if value is not None:
+            return min(RETRY_AFTER_MAX_SECONDS, max(0.0, float(value) / 1000))
+        value = headers.get('retry-after')
+        if value is None:
+            return None
+        try:
+            seconds = float(value)
+        except ValueError:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        return min(RETRY_AFTER_MAX_SECONDS, max(0.0, seconds))
+    except (TypeError, ValueError):
+        return None
+
+class _Waiter:
+    __slots__ = ("priority", "enqueued", "future", "slot_bound", "token_bound")
+
+    def __init__(self, priority: str, enqueued: float, future: asyncio.Future):
+        self.priority = priority
+        self.enqueued = enqueued
+        self.future = future
+        self.slot_bound = False
+        self.token_bound = False
+
+def _ewma(current: Optional[float], value: float, alpha: float) -> float:
+    return value if current is None else current + alpha * (value - current)
+
+class AdaptiveLimiter:
+    def __init__(self, initial_limit: int = GENERATIVE_INFLIGHT_LIMIT, min_limit: int = GENERATIVE_INFLIGHT_MIN,
+                 max_limit: int = GENERATIVE_INFLIGHT_MAX, rate_count: int = GENERATIVE_RATE_LIMIT_COUNT,
+                 rate_period: int = GENERATIVE_RATE_LIMIT_PERIOD, max_rate_count: int = GENERATIVE_RATE_LIMIT_MAX_COUNT,
+                 adaptive: bool = GENERATIVE_ADAPTIVE_LIMITS, latency_tolerance: float = GENERATIVE_LATENCY_TOLERANCE,
+                 reserved_share: float = SCHEDULER_RESERVED_SHARE, aging_seconds: float = SCHEDULER_AGING_SECONDS):
+        self.adaptive = adaptive
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial_limit)))
+        self.rate_period = max(1, rate_period)
+        # Requests per second; the bucket holds up to one period's worth of tokens
+        self.rate = max(1, rate_count) / self.rate_period
+        self.min_rate = 1 / self.rate_period
+        self.max_rate = max(self.rate, max_rate_count / self.rate_period)
+        self.rate_step = self.rate / 10
+        self.latency_tolerance = latency_tolerance
+        self._tokens = self._capacity()
+        self._refilled_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.reserved_share = reserved_share
+        self.aging_seconds = max(0.1, aging_seconds)
+        self.inflight = 0
+        self._inflight_by_class = {name: 0 for name in PRIORITY_CLASSES}
+        self._class_stats = {name: {"admitted": 0, "wait_total": 0.0, "wait_max": 0.0, "wait_recent": None} for name in PRIORITY_CLASSES}
+        self._waiters: List[_Waiter] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._latency_fast: Optional[float] = None
+        self._latency_slow: Optional[float] = None
+        self._error_rate = 0.0
+        self._last_decrease = 0.0
+        self.acquired = 0
+        self.increases = 0
+        self.decreases = 0
+        self.rate_limited = 0
+        self.timeouts = 0
+
+    def _capacity(self) -> float:
+        return max(1.0, self.rate * self.rate_period)
+
+    def _refill(self, now: float):
+        self._tokens = min(self._capacity(), self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _reserved_slots(self) -> int:
+        # Background work always keeps at least one slot
+        return min(int(self.limit) - 1, round(self.limit * self.reserved_share))
+
+    def _may_start(self, priority: str) -> bool:
+        if priority in FOREGROUND_CLASSES:
+            return True
+        background = sum(self._inflight_by_class[name] for name in PRIORITY_CLASSES if name not in FOREGROUND_CLASSES)
+        return background < int(self.limit) - self._reserved_slots()
+
+    def _schedule_dispatch(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _dispatch(self):
+        """Admits queued callers while there is a free slot and a token, best effective priority first."""
+        self._timer = None
+        # Drop callers cancelled while queued
+        self._waiters = [w for w in self._waiters if not w.future.done()]
+        while self._waiters:
+            now = time.monotonic()
+            if self.blocked_until > now:
+                self._schedule_dispatch(self.blocked_until - now)
+                return
+            if self.inflight >= int(self.limit):
+                for waiter in self._waiters:
+                    waiter.slot_bound = True
+                return
+            # Rank minus one class per aging period waited, so old background work eventually goes first
+            candidates = [w for w in self._waiters if self._may_start(w.priority)]
+            if not candidates:
+                return
+            waiter = min(candidates, key=lambda w: (PRIORITY_RANK[w.priority] - (now - w.enqueued) / self.aging_seconds, w.enqueued))
+            self._refill(now)
+            if self._tokens < 1:
+                waiter.token_bound = True
+                self._schedule_dispatch((1 - self._tokens) / self.rate)
+                return
+            self._tokens -= 1
+            self._waiters.remove(waiter)
+            self._admit(waiter.priority, now - waiter.enqueued)
+            waiter.future.set_result(None)
+
+    def _admit(self, priority: str, waited: float):
+        self.inflight += 1
+        self._inflight_by_class[priority] += 1
+        self.acquired += 1
+        stats = self._class_stats[priority]
+        stats["admitted"] += 1
+        stats["wait_total"] += waited
+        stats["wait_max"] = max(stats["wait_max"], waited)
+        stats["wait_recent"] = _ewma(stats["wait_recent"], waited, FAST_ALPHA)
+
+    def _release(self, priority: str):
+        self.inflight -= 1
+        self._inflight_by_class[priority] -= 1
+        self._dispatch()
+
+    async def acquire(self, priority: str = "interactive") -> Tuple[bool, bool]:
+        """
+        Waits until the scheduler admits the caller: a free concurrency slot (background classes can't take
+        the reserved ones), a rate token, no Retry-After hold and no better-ranked caller waiting.
+        Returns (waited_for_slot, waited_for_token) so the outcome can tell which limit was binding.
+        """
+        if priority not in PRIORITY_RANK:
+            raise ValueError(f"Unknown priority class: {priority}")
+        now = time.monotonic()
+        if not self._waiters and self.blocked_until <= now and self.inflight < int(self.limit) and self._may_start(priority):
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self._admit(priority, 0.0)
+                return False, False
+        waiter = _Waiter(priority, now, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Cancelled after being admitted: give the slot back
+                self._release(priority)
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._dispatch()
+            raise
+        return waiter.slot_bound, waiter.token_bound
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive") -> AsyncIterator[None]:
+        """Holds a slot for one provider call and feeds its latency or failure back into the limits."""
+        waited_for_slot, waited_for_token = await self.acquire(priority)
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self._release(priority)
+            self.on_failure(e)
+            raise
+        except BaseException:
+            # Cancelled / abandoned (e.g. a stream the client disconnected from): says nothing about the provider
+            self._release(priority)
+            raise
+        self._release(priority)
+        self.on_success(time.monotonic() - start, waited_for_slot, waited_for_token)
+
+    def on_success(self, latency: float, waited_for_slot: bool = False, waited_for_token: bool = False):
+        self._latency_fast = _ewma(self._latency_fast, latency, FAST_ALPHA)
+        self._latency_slow = _ewma(self._latency_slow, latency, SLOW_ALPHA)
+        self._error_rate *= 1 - ERROR_ALPHA
+        if not self.adaptive:
+            return
+        healthy = (self._latency_fast <= self._latency_slow * self.latency_tolerance
+                   and self._error_rate < HEALTHY_ERROR_RATE)
+        if not healthy:
+            return
+        # Grow only the limit callers are actually bounded by
+        if waited_for_slot or self.inflight + 1 >= int(self.limit):
+            previous = int(self.limit)
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            if int(self.limit) > previous:
+                self.increases += 1
+                self._dispatch()
+        if waited_for_token:
+            self.rate = min(self.max_rate, self.rate + self.rate_step / max(1.0, self.limit))
+
+    def on_failure(self, e: BaseException):
+        self._error_rate += ERROR_ALPHA * (1 - self._error_rate)
+        now = time.monotonic()
+        if is_rate_limit_error(e):
+            self.rate_limited += 1
+            retry_after = retry_after_seconds(e)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            self._decrease(now, rate_too=True)
+        elif is_timeout_error(e):
+            self.timeouts += 1
+            self._decrease(now, rate_too=False)
+
+    def _decrease(self, now: float, rate_too: bool):
+        if not self.adaptive or now - self._last_decrease < max(1.0, self._latency_slow or 0.0):
+            return
+        self._last_decrease = now
+        self.decreases += 1
+        self.limit = max(float(self.min_limit), self.limit * DECREASE_FACTOR)
+        if rate_too:
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+            self._tokens = min(self._tokens, self._capacity())
+
+    def stats(self) -> Dict[str, Any]:
+        blocked_for = self.blocked_until - time.monotonic()
+        return {
+            "adaptive": self.adaptive,
+            "limit": int(self.limit),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "inflight": self.inflight,
+            "queued": len(self._waiters),
+            "reserved_slots": self._reserved_slots(),
+            "rate_per_minute": round(self.rate * 60, 2),
+            "retry_after_remaining_seconds": round(max(0.0, blocked_for), 2),
+            "latency_recent_ms": round(self._latency_fast * 1000, 1) if self._latency_fast is not None else None,
+            "latency_baseline_ms": round(self._latency_slow * 1000, 1) if self._latency_slow is not None else None,
+            "error_rate": round(self._error_rate, 3),
+            "acquired": self.acquired,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "rate_limited": self.rate_limited,
+            "timeouts": self.timeouts,
+            "classes": {name: self._class_stats_row(name) for name in PRIORITY_CLASSES},
+        }
+
+    def _class_stats_row(self, name: str) -> Dict[str, Any]:
+        stats = self._class_stats[name]
+        admitted = stats["admitted"]
+        return {
+            "queued": sum(1 for w in self._waiters if w.priority == name),
+            "inflight": self._inflight_by_class[name],
+            "admitted": admitted,
+            "wait_mean_ms": round(stats["wait_total"] / admitted * 1000, 1) if admitted else None,
+            "wait_recent_ms": round(stats["wait_recent"] * 1000, 1) if stats["wait_recent"] is not None else None,
+            "wait_max_ms": round(stats["wait_max"] * 1000, 1),
+        }
+
+# Shared by every call to the generative API
+generative_limiter = AdaptiveLimiter()
@@ -16,6 +16,7 @@ from .live_quiz_models import (
     RoomStatus
 )
 from .state import LIVE_QUIZ_GAMES, ROOM_CODES
+from .archive import question_archive
 from .services.live_game_service import (
     broadcast_to_game, generate_room_code, generate_player_id, generate_game_id,
     start_question, show_question_results
@@ -73,6 +74,7 @@ async def cleanup_stale_games():
                     # Clean up SSE queues
                     if game_id in ACTIVE_SSE_QUEUES:
                         del ACTIVE_SSE_QUEUES[game_id]
+                    question_archive.forget(game_id)
 
                     print(f"Cleaned up stale game: {game_id} (room: {room_code})")
 
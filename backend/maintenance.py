@@ -0,0 +1,52 @@
+"""
+@file maintenance.py
+Background database housekeeping.
+
+The error compactor periodically enforces the error_logs retention policy (ERROR_LOG_MAX_AGE_DAYS,
+ERROR_LOG_MAX_ROWS) and drops error_rollups buckets older than ERROR_ROLLUP_RETENTION_DAYS, so the
+table and the admin queries on it stay small regardless of uptime. The same pass deletes expired rows
+from the persistent response cache.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from . import database
+from .config import ERROR_COMPACTION_INTERVAL_SECONDS
+
+compaction_task: Optional[asyncio.Task] = None
+compaction_stats: Dict[str, Any] = {"runs": 0, "expired_rows": 0, "overflow_rows": 0, "expired_rollups": 0, "expired_responses": 0, "last_run": None}
+
+async def compact_errors_once() -> Dict[str, int]:
+    result = await database.compact_error_logs()
+    result["expired_responses"] = await database.purge_expired_responses()
+    compaction_stats["runs"] += 1
+    for key, value in result.items():
+        compaction_stats[key] += value
+    compaction_stats["last_run"] = datetime.now().isoformat()
+    if any(result.values()):
+        print(f"Compacted error logs: {result}")
+    return result
+
+async def periodic_error_compaction():
+    while True:
+        try:
+            await compact_errors_once()
+        except Exception as e:
+            print(f"Error during error log compaction: {e}")
+        await asyncio.sleep(ERROR_COMPACTION_INTERVAL_SECONDS)
+
+def start_compaction_task():
+    """Start the background error log compactor."""
+    global compaction_task
+    if compaction_task is None or compaction_task.done():
+        compaction_task = asyncio.create_task(periodic_error_compaction())
+        print("Started error log compaction task")
+
+def stop_compaction_task():
+    """Stop the background error log compactor."""
+    global compaction_task
+    if compaction_task and not compaction_task.done():
+        compaction_task.cancel()
+        print("Stopped error log compaction task")
@@ -0,0 +1,136 @@
+"""
+@file metrics.py
+Latency histograms for generative model calls, per model and endpoint.
+
+Observations land in fixed-bucket histograms held in memory per one-minute time bucket: recording one is a
+bisect and a few integer increments with no I/O, so it is cheap enough for call_generative_model. A
+background task writes completed minutes to the latency_histograms table every METRICS_FLUSH_INTERVAL_SECONDS.
+Percentiles, throughput and error rates for a window are computed by merging the stored minutes with the
+ones still in memory.
+"""
+
+import time
+import asyncio
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import database
+from .config import METRICS_FLUSH_INTERVAL_SECONDS
+
+# Upper bounds (ms) of the histogram buckets; one extra overflow bucket counts everything slower
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 750, 1000, 1500, 2000, 3000, 4000, 5000, 7500, 10000, 15000, 20000, 30000, 60000)
+HISTOGRAM_BUCKET_SECONDS = 60
+STATS_WINDOWS = {"1m": 60, "1h": 3600, "24h": 86400}
+
+# (bucket_start, model, endpoint)
+HistogramKey = Tuple[int, str, str]
+
+def _new_entry() -> List[Any]:
+    # [requests, errors, total_ms, counts]
+    return [0, 0, 0.0, [0] * (len(LATENCY_BUCKETS_MS) + 1)]
+
+def estimate_percentile(counts: List[int], q: float) -> Optional[float]:
+    """Estimates the q-quantile (0..1) in ms by interpolating linearly inside the bucket that contains it."""
+    total = sum(counts)
+    if not total:
+        return None
+    target = q * total
+    cumulative = 0
+    for i, count in enumerate(counts):
+        if count and cumulative + count >= target:
+            lower = LATENCY_BUCKETS_MS[i - 1] if i > 0 else 0
+            # Nothing is known above the last bound; report it as the estimate
+            upper = LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else lower
+            return round(lower + (upper - lower) * (target - cumulative) / count, 1)
+        cumulative += count
+    return float(LATENCY_BUCKETS_MS[-1])
+
+class LatencyHistograms:
+    def __init__(self, flush_interval_seconds: int = METRICS_FLUSH_INTERVAL_SECONDS):
+        self.flush_interval = max(1, flush_interval_seconds)
+        self._pending: Dict[HistogramKey, List[Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.failed_flushes = 0
+
+    def observe(self, model: str, endpoint: str, seconds: float, success: bool = True):
+        ms = seconds * 1000
+        bucket_start = int(time.time()) // HISTOGRAM_BUCKET_SECONDS * HISTOGRAM_BUCKET_SECONDS
+        entry = self._pending.get((bucket_start, model, endpoint))
+        if entry is None:
+            entry = self._pending[(bucket_start, model, endpoint)] = _new_entry()
+        entry[0] += 1
+        if not success:
+            entry[1] += 1
+        entry[2] += ms
+        entry[3][bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+
+    async def flush(self, everything: bool = False) -> int:
+        """Writes finished minutes (or everything, on shutdown) to SQLite. Returns the number of rows written."""
+        now = time.time()
+        keys = [key for key in self._pending if everything or key[0] + HISTOGRAM_BUCKET_SECONDS <= now]
+        if not keys:
+            return 0
+        rows = [(*key, *self._pending.pop(key)) for key in keys]
+        try:
+            await database.write_latency_buckets(rows)
+        except Exception as e:
+            self.failed_flushes += 1
+            print(f"ERROR: Flushing {len(rows)} latency histogram rows failed. Reason: {e}")
+        return len(rows)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            print("Started latency metrics flush task")
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self._task = None
+        await self.flush(everything=True)
+
+    async def window_stats(self, window_seconds: int) -> List[Dict[str, Any]]:
+        """Latency percentiles, throughput and error rate per (model, endpoint), plus an endpoint "all" row per model."""
+        now = time.time()
+        # Minutes overlapping the window start are included whole
+        since = int(now - window_seconds) // HISTOGRAM_BUCKET_SECONDS * HISTOGRAM_BUCKET_SECONDS
+        rows = await database.load_latency_buckets(since)
+        rows += [(*key, *entry) for key, entry in self._pending.items() if key[0] >= since]
+
+        merged: Dict[Tuple[str, str], List[Any]] = {}
+        for _, model, endpoint, requests, errors, total_ms, counts in rows:
+            for group in ((model, endpoint), (model, "all")):
+                entry = merged.setdefault(group, _new_entry())
+                entry[0] += requests
+                entry[1] += errors
+                entry[2] += total_ms
+                entry[3] = [a + b for a, b in zip(entry[3], counts)]
+
+        span_minutes = max(now - since, 1) / 60
+        return [
+            {
+                "model": model, "endpoint": endpoint,
+                "requests": requests, "errors": errors,
+                "error_rate": round(errors / requests, 4) if requests else None,
+                "requests_per_minute": round(requests / span_minutes, 3),
+                "mean_ms": round(total_ms / requests, 1) if requests else None,
+                "p50_ms": estimate_percentile(counts, 0.50),
+                "p95_ms": estimate_percentile(counts, 0.95),
+                "p99_ms": estimate_percentile(counts, 0.99),
+            }
+            for (model, endpoint), (requests, errors, total_ms, counts) in sorted(merged.items())
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_rows": len(self._pending),
+            "failed_flushes": self.failed_flushes,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+latency_histograms = LatencyHistograms()
@@ -0,0 +1,259 @@
+"""
+@file model_health.py
+Per-model health tracking, circuit breakers and health-based model routing.
+
+Every provider request feeds its model's health: a smoothed error rate, a smoothed invalid-response rate
+(responses the caller's validator rejected) and a latency average. A model's circuit opens after
+MODEL_CIRCUIT_FAILURE_THRESHOLD bad outcomes in a row, or when either rate reaches MODEL_CIRCUIT_FAILURE_RATE
+over enough recent samples. An open model gets no requests for MODEL_CIRCUIT_COOLDOWN_SECONDS, after which
+the circuit is half-open and a single trial request is let through: success closes the circuit, failure
+reopens it with twice the cooldown (up to MODEL_CIRCUIT_MAX_COOLDOWN_SECONDS).
+
+Rate limits (429) and cancellations say nothing about a model's health and are not counted; the adaptive
+limiter deals with those. Fallback and "random-pl"/"random-en" choices go to available models, weighted by
+their health score.
+"""
+
+import time
+import random
+from typing import Any, Dict, Iterable, List, Optional
+
+from . import config
+from .config import (
+    MODEL_CIRCUIT_ENABLED, MODEL_CIRCUIT_FAILURE_THRESHOLD, MODEL_CIRCUIT_FAILURE_RATE,
+    MODEL_CIRCUIT_COOLDOWN_SECONDS, MODEL_CIRCUIT_MAX_COOLDOWN_SECONDS,
+)
+from .limiter import is_rate_limit_error
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+# Smoothing of the error, invalid-response and latency averages
+HEALTH_ALPHA = 0.2
+# Outcomes needed before the rates alone may open a circuit
+MIN_RATE_SAMPLES = 10
+# Model choices from MODELS_BY_LANGUAGE, keyed by the selection the frontend sends
+RANDOM_SELECTIONS = {"random-pl": "pl", "random-en": "en"}
+
+class ModelUnavailableError(Exception):
+    """Raised instead of calling a model whose circuit is open."""
+    def __init__(self, model: str, retry_in: float):
+        super().__init__(f"Model '{model}' is unavailable (circuit open, retry in {retry_in:.0f}s)")
+        self.model = model
+        self.retry_in = retry_in
+
+class _ModelHealth:
+    __slots__ = ("state", "error_rate", "invalid_rate", "latency", "samples", "consecutive_failures",
+                 "open_until", "cooldown", "probe_inflight", "requests", "failures", "invalid", "opens", "rejected")
+
+    def __init__(self):
+        self.state = CLOSED
+        self.error_rate = 0.0
+        self.invalid_rate = 0.0
+        self.latency: Optional[float] = None
+        self.samples = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.cooldown = 0.0
+        self.probe_inflight = False
+        self.requests = 0
+        self.failures = 0
+        self.invalid = 0
+        self.opens = 0
+        self.rejected = 0
+
+class ModelHealthTracker:
+    def __init__(self, enabled: bool = MODEL_CIRCUIT_ENABLED, failure_threshold: int = MODEL_CIRCUIT_FAILURE_THRESHOLD,
+                 failure_rate: float = MODEL_CIRCUIT_FAILURE_RATE, cooldown_seconds: float = MODEL_CIRCUIT_COOLDOWN_SECONDS,
+                 max_cooldown_seconds: float = MODEL_CIRCUIT_MAX_COOLDOWN_SECONDS):
+        self.enabled = enabled
+        self.failure_threshold = max(1, failure_threshold)
+        self.failure_rate = min(1.0, max(0.05, failure_rate))
+        self.cooldown_seconds = max(0.0, cooldown_seconds)
+        self.max_cooldown_seconds = max(self.cooldown_seconds, max_cooldown_seconds)
+        self._models: Dict[str, _ModelHealth] = {}
+
+    def _health(self, model: str) -> _ModelHealth:
+        health = self._models.get(model)
+        if health is None:
+            health = self._models[model] = _ModelHealth()
+        return health
+
+    # --- circuit ---
+
+    def available(self, model: str) -> bool:
+        """Whether a request to the model would be let through right now (without reserving the trial)."""
+        health = self._models.get(model)
+        if not self.enabled or health is None or health.state == CLOSED:
+            return True
+        if health.state == OPEN:
+            return time.monotonic() >= health.open_until
+        return not health.probe_inflight
+
+    def retry_in(self, model: str) -> float:
+        """Seconds until an open circuit lets a trial request through (0 if it would now)."""
+        health = self._models.get(model)
+        if health is None or health.state != OPEN:
+            return 0.0
+        return max(0.0, health.open_until - time.monotonic())
+
+    def acquire(self, model: str):
+        """Lets one request to the model through, or raises ModelUnavailableError. A half-open model admits one trial."""
+        health = self._models.get(model)
+        if not self.enabled or health is None or health.state == CLOSED:
+            return
+        now = time.monotonic()
+        if health.state == OPEN:
+            if now < health.open_until:
+                health.rejected += 1
+                raise ModelUnavailableError(model, health.open_until - now)
+            health.state = HALF_OPEN
+            health.probe_inflight = False
+        if health.probe_inflight:
+            health.rejected += 1
+            raise ModelUnavailableError(model, 0)
+        health.probe_inflight = True
+        print(f"INFO: Sending a trial request to model '{model}' (circuit half-open).")
+
+    def _open(self, model: str, health: _ModelHealth):
+        if health.state == HALF_OPEN:
+            health.cooldown = min(self.max_cooldown_seconds, max(self.cooldown_seconds, health.cooldown * 2))
+        else:
+            health.cooldown = self.cooldown_seconds
+        health.state = OPEN
+        health.open_until = time.monotonic() + health.cooldown
+        health.probe_inflight = False
+        health.opens += 1
+        print(f"WARNING: Circuit for model '{model}' opened for {health.cooldown:.0f}s "
+              f"(error rate {health.error_rate:.2f}, invalid rate {health.invalid_rate:.2f}, "
+              f"{health.consecutive_failures} failures in a row).")
+
+    def _close(self, model: str, health: _ModelHealth):
+        # A recovered model starts over: its old rates would reopen the circuit on the next outcome
+        health.state = CLOSED
+        health.probe_inflight = False
+        health.error_rate = health.invalid_rate = 0.0
+        health.samples = health.consecutive_failures = 0
+        health.cooldown = 0.0
+        print(f"INFO: Circuit for model '{model}' closed after a successful trial request.")
+
+    def _check_trip(self, model: str, health: _ModelHealth):
+        if health.state != CLOSED:
+            return
+        if health.consecutive_failures >= self.failure_threshold or (
+                health.samples >= MIN_RATE_SAMPLES and max(health.error_rate, health.invalid_rate) >= self.failure_rate):
+            self._open(model, health)
+
+    # --- outcomes ---
+
+    def record_success(self, model: str, seconds: float):
+        """A provider request that returned a response (its content is judged by record_validation)."""
+        health = self._health(model)
+        health.requests += 1
+        health.samples += 1
+        health.error_rate *= 1 - HEALTH_ALPHA
+        health.latency = seconds if health.latency is None else health.latency + HEALTH_ALPHA * (seconds - health.latency)
+        if health.state == HALF_OPEN:
+            self._close(model, health)
+
+    def record_failure(self, model: str, error: BaseException):
+        """A provider request that raised. Rate limits, cancellations and rejected requests are not the model's fault."""
+        if isinstance(error, ModelUnavailableError):
+            return
+        health = self._health(model)
+        if not isinstance(error, Exception) or is_rate_limit_error(error):
+            if health.state == HALF_OPEN:
+                health.probe_inflight = False
+            return
+        health.requests += 1
+        health.failures += 1
+        health.samples += 1
+        health.consecutive_failures += 1
+        health.error_rate += HEALTH_ALPHA * (1 - health.error_rate)
+        if health.state == HALF_OPEN:
+            self._open(model, health)
+        else:
+            self._check_trip(model, health)
+
+    def record_validation(self, model: str, valid: bool):
+        """Whether the caller could use the model's response."""
+        health = self._health(model)
+        if valid:
+            health.consecutive_failures = 0
+            health.invalid_rate *= 1 - HEALTH_ALPHA
+            return
+        health.invalid += 1
+        health.consecutive_failures += 1
+        health.invalid_rate += HEALTH_ALPHA * (1 - health.invalid_rate)
+        self._check_trip(model, health)
+
+    # --- routing ---
+
+    def score(self, model: str, fastest: Optional[float] = None) -> float:
+        """Health in (0, 1]: success and valid-response rates, scaled by latency relative to `fastest`."""
+        health = self._models.get(model)
+        if health is None:
+            return 1.0
+        score = (1 - health.error_rate) * (1 - health.invalid_rate)
+        if fastest and health.latency:
+            score *= min(1.0, fastest / health.latency)
+        return max(0.01, score)
+
+    def _fastest(self, models: Iterable[str]) -> Optional[float]:
+        latencies = [self._models[m].latency for m in models if m in self._models and self._models[m].latency]
+        return min(latencies) if latencies else None
+
+    def _scored(self, candidates: Iterable[str]) -> Dict[str, float]:
+        """Health scores of the available candidates, best first."""
+        available = [model for model in dict.fromkeys(candidates) if self.available(model)]
+        fastest = self._fastest(available)
+        return dict(sorted(((model, self.score(model, fastest)) for model in available), key=lambda item: -item[1]))
+
+    def choose(self, candidates: List[str]) -> str:
+        """A random pick among the available candidates, weighted by health score."""
+        scored = self._scored(candidates)
+        if not scored:
+            return random.choice(candidates)
+        return random.choices(list(scored), weights=list(scored.values()))[0]
+
+    def fallback_for(self, model: str, exclude: Iterable[str] = ()) -> Optional[str]:
+        """
+        The model to use instead of `model`: the configured FALLBACK_MODEL while it is available, otherwise
+        the healthiest available allowed model. None if there is none besides `model` and `exclude`.
+        """
+        skip = set(exclude) | {model}
+        if config.FALLBACK_MODEL and config.FALLBACK_MODEL not in skip and self.available(config.FALLBACK_MODEL):
+            return config.FALLBACK_MODEL
+        pool = [m for m in list(config.ALLOWED_MODELS) + list(config.DYNAMIC_MODELS or []) if m not in skip]
+        scored = self._scored(sorted(pool))
+        return next(iter(scored), None)
+
+    def resolve_selection(self, selection: str) -> str:
+        """Turns "random-pl"/"random-en" into a concrete model; other selections are returned as they are."""
+        language = RANDOM_SELECTIONS.get(selection)
+        if language is None or not config.MODELS_BY_LANGUAGE.get(language):
+            return selection
+        return self.choose(config.MODELS_BY_LANGUAGE[language])
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        fastest = self._fastest(self._models)
+        return {
+            "enabled": self.enabled,
+            "models": {
+                model: {
+                    "state": health.state,
+                    "score": round(self.score(model, fastest), 3),
+                    "error_rate": round(health.error_rate, 3),
+                    "invalid_rate": round(health.invalid_rate, 3),
+                    "latency_ms": round(health.latency * 1000, 1) if health.latency is not None else None,
+                    "requests": health.requests,
+                    "failures": health.failures,
+                    "invalid": health.invalid,
+                    "opens": health.opens,
+                    "rejected": health.rejected,
+                    "open_for_s": round(health.open_until - now, 1) if health.state == OPEN and health.open_until > now else 0,
+                }
+                for model, health in sorted(self._models.items())
+            },
+        }
+
+model_health = ModelHealthTracker()
@@ -90,4 +90,27 @@ class PreloadRequest(BaseModelWithModel):
             return v
         if not is_theme_valid(v):
             raise ValueError("Theme must be at most 8 words and contain only letters, numbers, spaces, and -.,<>")
-        return v
\ No newline at end of file
+        return v
+
+class UpcomingCategory(BaseModel):
+    category: str
+    probability: float
+
+class PreloadPlanRequest(BaseModelWithModel):
+    categories: List[str]
+    # Chance of landing on each category in the next turns; categories left out count as unlikely
+    upcoming: List[UpcomingCategory] = []
+    gameMode: str
+    knowledgeLevel: str
+    language: str
+    theme: Optional[str] = None
+    includeCategoryTheme: bool
+
+    @field_validator('theme')
+    @classmethod
+    def validate_theme(cls, v: Optional[str]) -> Optional[str]:
+        if not v:
+            return v
+        if not is_theme_valid(v):
+            raise ValueError("Theme must be at most 8 words and contain only letters, numbers, spaces, and -.,<>")
+        return v
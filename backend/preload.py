@@ -1,121 +1,78 @@
-import asyncio
-import random
-from datetime import datetime
+import contextlib
 from typing import Dict, Any
 
-from . import database
-from .config import MODELS_BY_LANGUAGE, DEBUG_MODE, PROMPTS
-from .state import PRELOAD_CONCURRENCY_SEMAPHORE, MAX_QUESTIONS_PER_CATEGORY_IN_CACHE
+from . import database, telemetry, state
+from .config import DEBUG_MODE, PRELOAD_BATCH_SIZE
 from .generative import call_generative_model, ensure_blueprints_exist
 from .utils import build_question_prompt, is_question_valid, format_explanation_part, update_generation_history
-from .models import PreloadRequest
+from .question_cache import question_cache, make_cache_key
+from .archive import ARCHIVE_ID_FIELD
+from .question_batch import generate_question_batch
+from .model_health import model_health
+from .deadline import Deadline, DeadlineExceeded
 
-# Background preload task with concurrency limits and safe status handling
-async def _preload_task(game_id: str, model_selection: str, request_data: PreloadRequest):
-    # Mark as running and acquire global preload concurrency semaphore
-    from .state import get_preload_status
-    status = get_preload_status(game_id)
-    if not status:
-        # if status was removed meanwhile, create a fallback to ensure the event exists
-        from .state import set_preload_status
-        set_preload_status(game_id, {"state": "running", "event": asyncio.Event(), "last_scheduled": datetime.utcnow().timestamp()})
+PRELOAD_TIMEOUT_SECONDS = 30.0
 
-    status["state"] = "running"
-    status["started_at"] = datetime.utcnow().isoformat()
+def preload_slot():
+    """A slot of the global preload concurrency limit (no limit before startup has created the semaphore)."""
+    # Looked up on every call: the semaphore is created in initialize_async_resources, after this module is imported
+    return state.PRELOAD_CONCURRENCY_SEMAPHORE or contextlib.nullcontext()
 
-    # local helper to pick model
-    def get_model_for_generation():
-        if model_selection == "random-pl" and MODELS_BY_LANGUAGE["pl"]:
-            return random.choice(MODELS_BY_LANGUAGE["pl"])
-        if model_selection == "random-en" and MODELS_BY_LANGUAGE["en"]:
-            return random.choice(MODELS_BY_LANGUAGE["en"])
-        return model_selection
-
-    async def generate_one_for_category(category: str):
-        model_to_use = get_model_for_generation()
-        if DEBUG_MODE:
-            print(f"[{game_id}] Preloading for '{category}' using model '{model_to_use}'...")
+# Generates questions for one category into the preload cache; returns whether any question was stored
+async def preload_category(game_id: str, model_selection: str, params: Dict[str, Any], category: str) -> bool:
+    # "random-pl"/"random-en" favor the healthiest models
+    model_to_use = model_health.resolve_selection(model_selection)
+    if DEBUG_MODE:
+        print(f"[{game_id}] Preloading for '{category}' using model '{model_to_use}'...")
+    try:
+        language = params.get("language", "pl")
+        theme = params.get("theme", "General knowledge")
+        # Ensure blueprints exist
         try:
-            params = request_data.model_dump()
-            language = params.get("language", "pl")
-            theme = params.get("theme", "General knowledge")
-            # Ensure blueprints exist
-            try:
-                await ensure_blueprints_exist(category, language, theme, model_to_use)
-            except Exception as e:
-                print(f"Warning: Could not ensure blueprints for '{category}': {e}. Falling back to old generation.")
-            
-            blueprint = await database.get_unused_blueprint(category)
-            if blueprint:
-                if DEBUG_MODE:
-                    print(f"Using blueprint for preload '{category}': subcategory={blueprint['subcategory']}, modifier={blueprint['modifier']}")
-                # Build prompt from blueprint
-                prompt_struct = PROMPTS["generate_question_from_blueprint"][language]
-                static_part = [
-                    prompt_struct["persona"],
-                    "\n".join(prompt_struct["static_instructions"])
-                ]
-                static_content = "\n\n".join(static_part)
-                knowledge_key = params.get("knowledgeLevel", "basic")
-                knowledge_prompt = PROMPTS["knowledge_prompts"][knowledge_key][language]
-                game_mode_key = params.get("gameMode", "mcq")
-                game_mode_prompt = PROMPTS["game_mode_prompts"][game_mode_key][language]
-                dynamic_content = prompt_struct["task_template"].format(
-                    category=category,
-                    subcategory=blueprint['subcategory'],
-                    modifier=blueprint['modifier'] or '',
-                    target_answer=blueprint['target_answer'],
-                    knowledge_level=knowledge_prompt,
-                    game_mode=game_mode_prompt
-                )
-                prompt = f"{static_content}\n\n{dynamic_content}"
-            else:
-                # Fallback to old prompt
-                prompt = build_question_prompt(params, category)
-            
-            # call with timeout to avoid long blocking
-            data, raw_response = await asyncio.wait_for(call_generative_model(prompt, model_to_use, return_raw=True), timeout=30.0)
-            is_valid, error_msg = is_question_valid(data, params.get("gameMode"))
-            if is_valid:
-                explanation_parts = [format_explanation_part(data.get(key)) for key in ["explanation_correct", "explanation_distractors"]]
-                data["explanation"] = "\n\n".join(filter(None, explanation_parts))
-                inputs_for_db = {**params, 'model': model_to_use, 'category': category}
-                await database.add_question(data, inputs_for_db)
-                await database.cache_question(category, data)
-                update_generation_history(category, data.get("subcategory"), data.get("key_entities"))
-            else:
-                print(f"WARNING: Preloaded question for '{category}' was invalid. Reason: {error_msg}. Raw response snippet: '{raw_response[:300]}...'")
-                await database.log_error_db("preload_task_validation", {"category": category, "error": error_msg, "raw_response_snippet": raw_response[:300]})
-        except asyncio.TimeoutError:
-            print(f"ERROR: Preload timed out for category '{category}'")
-            await database.log_error_db("preload_task_timeout", {"category": category})
+            await ensure_blueprints_exist(category, language, theme, model_to_use)
         except Exception as e:
-            detailed_error = repr(e)
-            print(f"ERROR: Preloading one question for '{category}' failed. Reason: {detailed_error}.")
-            await database.log_error_db("preload_task_exception", {"category": category, "error": detailed_error})
+            print(f"Warning: Could not ensure blueprints for '{category}': {e}. Falling back to old generation.")
 
-    try:
-        # Acquire global preload concurrency semaphore
-        sem = PRELOAD_CONCURRENCY_SEMAPHORE
-        if sem is None:
-            class _NoOp:
-                async def __aenter__(self): pass
-                async def __aexit__(self, exc_type, exc, tb): pass
-            sem_ctx = _NoOp()
-        else:
-            sem_ctx = sem
+        if PRELOAD_BATCH_SIZE > 1:
+            # Every valid question of the batch lands in the cache; allow extra time for the longer answer
+            deadline = Deadline(PRELOAD_TIMEOUT_SECONDS * (1 + 0.5 * (PRELOAD_BATCH_SIZE - 1)))
+            await generate_question_batch(params, category, model_to_use, PRELOAD_BATCH_SIZE,
+                                          endpoint="preload", priority="prefetch", game_id=game_id, deadline=deadline)
+            return True
 
-        async with sem_ctx:
-            # check if the category still needs caching
-            category = request_data.category
-            if await database.get_cache_count_for_category(category) < MAX_QUESTIONS_PER_CATEGORY_IN_CACHE:
-                await generate_one_for_category(category)
+        deadline = Deadline(PRELOAD_TIMEOUT_SECONDS)
+        blueprint = await deadline.run(database.get_unused_blueprint(category), "database")
+        if blueprint:
+            if DEBUG_MODE:
+                print(f"Using blueprint for preload '{category}': subcategory={blueprint['subcategory']}, modifier={blueprint['modifier']}")
+            # Build prompt from blueprint
+            prompt = build_question_prompt(params, category, blueprint)
+        else:
+            # Fallback to old prompt
+            prompt = build_question_prompt(params, category)
 
-    finally:
-        # mark finished and notify waiters
-        status["state"] = "done"
-        status["finished_at"] = datetime.utcnow().isoformat()
-        try:
-            status["event"].set()
-        except Exception:
-            pass
\ No newline at end of file
+        # The deadline keeps retries and backoff from blocking the preload slot for long
+        data, raw_response = await call_generative_model(prompt, model_to_use, return_raw=True, endpoint="preload", priority="prefetch",
+                                                         validator=lambda d: is_question_valid(d, params.get("gameMode"))[0],
+                                                         game_id=game_id, deadline=deadline)
+        is_valid, error_msg = is_question_valid(data, params.get("gameMode"))
+        if is_valid:
+            explanation_parts = [format_explanation_part(data.get(key)) for key in ["explanation_correct", "explanation_distractors"]]
+            data["explanation"] = "\n\n".join(filter(None, explanation_parts))
+            inputs_for_db = {**params, 'model': model_to_use, 'category': category}
+            archive_id = await database.add_question(data, inputs_for_db)
+            if archive_id is not None:
+                data[ARCHIVE_ID_FIELD] = archive_id
+            await question_cache.put(make_cache_key(category, params), data)
+            update_generation_history(category, data.get("subcategory"), data.get("key_entities"))
+            return True
+        print(f"WARNING: Preloaded question for '{category}' was invalid. Reason: {error_msg}. Raw response snippet: '{raw_response[:300]}...'")
+        telemetry.log_error("preload_task_validation", {"category": category, "error": error_msg, "raw_response_snippet": raw_response[:300]})
+    except DeadlineExceeded:
+        print(f"ERROR: Preload timed out for category '{category}'")
+        telemetry.log_error("preload_task_timeout", {"category": category})
+    except Exception as e:
+        detailed_error = repr(e)
+        print(f"ERROR: Preloading one question for '{category}' failed. Reason: {detailed_error}.")
+        telemetry.log_error("preload_task_exception", {"category": category, "error": detailed_error})
+    return False
@@ -0,0 +1,106 @@
+"""
+@file prompts.py
+Prompt registry compiled once from prompts.json.
+
+Every entry with a task_template is compiled per language into a PromptTemplate: the persona (or system line)
+and the static instructions are joined once into a prefix, and the template's placeholders are checked
+against the values the code supplies, so a bad edit to prompts.json fails at startup instead of on a request.
+Rendering is one str.format_map of the short task part appended to the prefix. The prefix is the same
+byte string for every request of that prompt, so provider-side prompt caching can match it.
+"""
+
+import string
+from typing import Any, Dict, FrozenSet, Mapping, Tuple
+
+from .config import PROMPTS
+
+# Placeholders each template may use: the values its call site passes to render()
+TEMPLATE_FIELDS: Dict[str, FrozenSet[str]] = {
+    "generate_categories": frozenset({"theme"}),
+    "mutate_category": frozenset({"old_category", "theme", "existing_categories"}),
+    "explain_incorrect": frozenset({"question", "correct_answer", "player_answer"}),
+    "generate_blueprints": frozenset({"category", "theme"}),
+    "generate_question": frozenset({"category", "subcategory_suggestion", "knowledge_prompt", "game_mode_prompt",
+                                    "theme_context", "subcategory_history_prompt", "entity_history_prompt"}),
+    "generate_question_from_blueprint": frozenset({"category", "subcategory", "modifier", "target_answer",
+                                                   "knowledge_level", "knowledge_prompt", "game_mode", "game_mode_prompt",
+                                                   "theme_context", "subcategory_history_prompt", "entity_history_prompt"}),
+}
+
+def template_fields(template: str) -> FrozenSet[str]:
+    """Returns the placeholder names of a str.format template; positional or compound fields are rejected."""
+    fields = set()
+    for _, field, _, _ in string.Formatter().parse(template):
+        if field is None:
+            continue
+        if not field.isidentifier():
+            raise ValueError(f"Unsupported placeholder '{{{field}}}' in prompt template")
+        fields.add(field)
+    return frozenset(fields)
+
+class PromptTemplate:
+    __slots__ = ("name", "language", "prefix", "task_template", "fields", "_head")
+
+    def __init__(self, name: str, language: str, struct: Mapping[str, Any], allowed_fields: FrozenSet[str]):
+        self.name = name
+        self.language = language
+        persona = struct.get("persona", struct.get("system", ""))
+        instructions = struct.get("static_instructions", struct.get("instruction", []))
+        self.prefix = "\n\n".join(part for part in (persona, "\n".join(instructions)) if part)
+        self.task_template = struct["task_template"]
+        try:
+            self.fields = template_fields(self.task_template)
+        except ValueError as e:
+            raise ValueError(f"Prompt '{name}' ({language}): {e}") from None
+        unknown = self.fields - allowed_fields
+        if unknown:
+            raise ValueError(f"Prompt '{name}' ({language}) uses unknown placeholders: {sorted(unknown)}")
+        self._head = f"{self.prefix}\n\n" if self.prefix else ""
+
+    def render_task(self, **values: Any) -> str:
+        """Renders only the task part (e.g. one item of a batch that shares the prefix)."""
+        try:
+            return self.task_template.format_map(values)
+        except KeyError as e:
+            raise ValueError(f"Prompt '{self.name}' ({self.language}) is missing a value for {e}") from None
+
+    def render(self, **values: Any) -> str:
+        """The static prefix followed by the rendered task."""
+        try:
+            return self._head + self.task_template.format_map(values)
+        except KeyError as e:
+            raise ValueError(f"Prompt '{self.name}' ({self.language}) is missing a value for {e}") from None
+
+class PromptRegistry:
+    def __init__(self, prompts: Mapping[str, Any]):
+        self._templates: Dict[Tuple[str, str], PromptTemplate] = {}
+        for name, allowed_fields in TEMPLATE_FIELDS.items():
+            for language, struct in prompts[name].items():
+                self._templates[(name, language)] = PromptTemplate(name, language, struct, allowed_fields)
+        self.knowledge_prompts: Dict[Tuple[str, str], str] = {
+            (level, language): text for level, texts in prompts["knowledge_prompts"].items() for language, text in texts.items()
+        }
+        self.game_mode_prompts: Dict[Tuple[str, str], str] = {
+            (mode, language): text for mode, texts in prompts["game_mode_prompts"].items() for language, text in texts.items()
+        }
+        self.batch_instructions: Dict[str, str] = {
+            language: "\n".join(struct["batch_instructions"]) for language, struct in prompts["generate_question_batch"].items()
+        }
+        self.blueprint_headers: Dict[str, str] = {
+            language: struct["blueprint_header"] for language, struct in prompts["generate_question_batch"].items()
+        }
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def get(self, name: str, language: str) -> PromptTemplate:
+        return self._templates[(name, language)]
+
+    def knowledge_prompt(self, level: str, language: str) -> str:
+        return self.knowledge_prompts[(level, language)]
+
+    def game_mode_prompt(self, mode: str, language: str) -> str:
+        return self.game_mode_prompts[(mode, language)]
+
+prompt_registry = PromptRegistry(PROMPTS)
+print(f"Prompt registry compiled: {len(prompt_registry)} templates.")
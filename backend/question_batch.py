@@ -0,0 +1,79 @@
+"""
+@file question_batch.py
+Batched question generation: several questions for one category from a single model call.
+
+The persona and static instructions are sent once per batch instead of once per question, and the model
+answers with {"questions": [...]}. Every item is validated on its own with is_question_valid; invalid items
+are dropped without failing the batch. A response that was cut off keeps its complete questions and loses the
+last one. The valid ones are archived in generated_questions and put in the preloaded cache in one transaction,
+except the first `serve` items, which go straight to the caller.
+When the category has unused blueprints, the batch is built from them (one task per blueprint).
+"""
+
+from typing import Any, Dict, List, Optional
+
+from . import database, telemetry
+from .config import DEBUG_MODE
+from .generative import call_generative_model
+from .deadline import Deadline
+from .question_cache import question_cache, make_cache_key
+from .utils import build_question_batch_prompt, extract_question_batch, extract_question_batch_from_response, is_question_valid, format_explanation_part, update_generation_history
+
+batch_stats = {"batches": 0, "requested": 0, "valid": 0, "dropped": 0, "failed": 0}
+
+def _has_valid_item(game_mode: str):
+    # A batch counts against the model's health only when none of its items is usable
+    return lambda data: any(is_question_valid(item, game_mode)[0] for item in extract_question_batch(data))
+
+async def generate_question_batch(params: Dict[str, Any], category: str, model: str, count: int, endpoint: str,
+                                  priority: str, serve: int = 0, use_blueprints: bool = True, hedge: bool = False,
+                                  game_id: Optional[str] = None, deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+    """
+    Generates up to `count` questions for the category in one call and stores them (see module docstring).
+    Returns the first `serve` valid questions; raises ValueError if the batch had no valid question at all.
+    """
+    blueprints = await database.claim_blueprints(category, count) if use_blueprints else []
+    if blueprints:
+        count = len(blueprints)
+    prompt = build_question_batch_prompt(params, category, count, blueprints)
+    batch_stats["batches"] += 1
+    batch_stats["requested"] += count
+    try:
+        data, raw_response = await call_generative_model(prompt, model, return_raw=True, endpoint=endpoint,
+                                                         priority=priority, hedge=hedge, validator=_has_valid_item(params.get("gameMode")),
+                                                         game_id=game_id, deadline=deadline, parse=extract_question_batch_from_response)
+    except Exception:
+        batch_stats["failed"] += 1
+        raise
+
+    game_mode = params.get("gameMode")
+    valid: List[Dict[str, Any]] = []
+    reasons: List[str] = []
+    for item in extract_question_batch(data)[:count]:
+        is_valid, error_msg = is_question_valid(item, game_mode)
+        if not is_valid:
+            reasons.append(error_msg)
+            continue
+        explanation_parts = [format_explanation_part(item.get(key)) for key in ["explanation_correct", "explanation_distractors"]]
+        item["explanation"] = "\n\n".join(filter(None, explanation_parts))
+        valid.append(item)
+    dropped = count - len(valid)
+    batch_stats["valid"] += len(valid)
+    batch_stats["dropped"] += dropped
+    if dropped:
+        print(f"WARNING: {dropped} of {count} batched questions for '{category}' were dropped. Reasons: {reasons}")
+        telemetry.log_error(f"{endpoint}_batch_validation", {
+            "category": category, "model": model, "requested": count, "valid": len(valid),
+            "error": reasons[0] if reasons else "Fewer questions than requested", "raw_response_snippet": raw_response[:300]
+        })
+    if not valid:
+        batch_stats["failed"] += 1
+        raise ValueError(f"Batch for '{category}' contained no valid question")
+
+    inputs_for_db = {**params, "model": model, "category": category}
+    served = await question_cache.store_batch(make_cache_key(category, params), valid, inputs_for_db, serve=serve)
+    for item in valid:
+        update_generation_history(category, item.get("subcategory"), item.get("key_entities"))
+    if DEBUG_MODE:
+        print(f"Batch for '{category}': {len(valid)}/{count} valid, {len(served)} served directly, {len(valid) - len(served)} cached.")
+    return served
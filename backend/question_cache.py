@@ -0,0 +1,97 @@
+"""
+@file question_cache.py
+In-process tier in front of the preloaded_questions_cache table.
+
+Entries are keyed by (category, language, knowledge_level, game_mode, theme) so every hit matches what
+the player asked for. Questions are held in per-key deques so serving one is an O(1) popleft with no
+disk I/O: the matching row is deleted later by the telemetry writer. New questions are written through to SQLite before they become
+visible in memory, and the whole tier is rebuilt from the table on startup.
+"""
+
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from . import database
+from .telemetry import telemetry_writer
+
+# (category, language, knowledge_level, game_mode, theme)
+CacheKey = Tuple[str, str, str, str, str]
+
+def make_cache_key(category: str, params: Dict[str, Any]) -> CacheKey:
+    """Builds the cache key for a question request. The theme only counts when it is part of the prompt."""
+    theme = params.get("theme") if params.get("includeCategoryTheme") else None
+    return (category, params.get("language") or "", params.get("knowledgeLevel") or "", params.get("gameMode") or "", theme or "")
+
+class PreloadedQuestionCache:
+    def __init__(self):
+        self._entries: Dict[CacheKey, Deque[Tuple[int, Dict[str, Any]]]] = {}
+        self._hits: Dict[CacheKey, int] = {}
+        self._misses: Dict[CacheKey, int] = {}
+
+    async def load(self):
+        """Rebuilds the in-memory tier from SQLite (oldest questions are served first)."""
+        self._entries.clear()
+        rows = await database.load_cached_questions()
+        for row_id, key, question_data in rows:
+            self._entries.setdefault(key, deque()).append((row_id, question_data))
+        print(f"Preloaded question cache rebuilt: {len(rows)} questions across {len(self._entries)} keys.")
+
+    async def put(self, key: CacheKey, question_data: Dict[str, Any]) -> bool:
+        """Writes the question through to SQLite, then makes it available in memory."""
+        row_id = await database.cache_question(key, question_data)
+        if row_id is None:
+            return False
+        self._entries.setdefault(key, deque()).append((row_id, question_data))
+        return True
+
+    async def store_batch(self, key: CacheKey, questions: List[Dict[str, Any]], inputs: Dict[str, Any],
+                          serve: int = 0) -> List[Dict[str, Any]]:
+        """
+        Archives a batch of generated questions and caches all but the first `serve` of them in one transaction,
+        then makes the cached ones available in memory. Returns the first `serve` questions for the caller to use.
+        """
+        saved = await database.save_question_batch(questions, inputs, key, cache_from=serve)
+        entries = self._entries.setdefault(key, deque())
+        for question_data, (_, row_id) in zip(questions[serve:], saved[serve:]):
+            entries.append((row_id, question_data))
+        if not entries:
+            del self._entries[key]
+        return questions[:serve]
+
+    def pop(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        """Removes and returns the oldest question for the key, or None. Never awaits, so it is atomic."""
+        entries = self._entries.get(key)
+        if not entries:
+            self._misses[key] = self._misses.get(key, 0) + 1
+            return None
+        row_id, question_data = entries.popleft()
+        if not entries:
+            del self._entries[key]
+        self._hits[key] = self._hits.get(key, 0) + 1
+        telemetry_writer.record_cache_delete(row_id)
+        return question_data
+
+    def count(self, key: CacheKey) -> int:
+        entries = self._entries.get(key)
+        return len(entries) if entries else 0
+
+    def stats(self) -> Dict[str, Any]:
+        keys = set(self._entries) | set(self._hits) | set(self._misses)
+        per_key = [
+            {
+                "category": key[0], "language": key[1], "knowledge_level": key[2], "game_mode": key[3], "theme": key[4],
+                "depth": self.count(key), "hits": self._hits.get(key, 0), "misses": self._misses.get(key, 0)
+            }
+            for key in sorted(keys)
+        ]
+        hits = sum(self._hits.values())
+        misses = sum(self._misses.values())
+        return {
+            "total_depth": sum(len(entries) for entries in self._entries.values()),
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+            "keys": per_key,
+        }
+
+question_cache = PreloadedQuestionCache()
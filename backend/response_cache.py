@@ -0,0 +1,102 @@
+"""
+@file response_cache.py
+Opt-in cache of generative model responses for idempotent prompts (categories, category mutations,
+explanations of incorrect answers).
+
+Entries are keyed by a hash of (model, prompt) and live in a size-bounded LRU with a TTL per endpoint
+(RESPONSE_CACHE_TTLS; 0 disables caching for that endpoint). With RESPONSE_CACHE_PERSIST the entries are
+also written to the response_cache table, so they survive restarts. Only responses that passed the
+caller's validator are stored.
+"""
+
+import copy
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from . import database
+from .config import RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTLS, RESPONSE_CACHE_PERSIST
+
+def make_response_key(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\x00{prompt}".encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, ttls: Dict[str, float] = RESPONSE_CACHE_TTLS, persist: bool = RESPONSE_CACHE_PERSIST):
+        self.max_entries = max(1, max_entries)
+        self.ttls = dict(ttls)
+        self.persist = persist
+        # key -> (expires_at, parsed_data, raw_response)
+        self._entries: "OrderedDict[str, Tuple[float, Any, str]]" = OrderedDict()
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+        self.persistent_hits = 0
+        self.evictions = 0
+
+    def enabled_for(self, endpoint: str) -> bool:
+        return self.ttls.get(endpoint, 0) > 0
+
+    async def get(self, model: str, prompt: str, endpoint: str) -> Optional[Tuple[Any, str]]:
+        """Returns a copy of the cached (parsed_data, raw_response), or None."""
+        if not self.enabled_for(endpoint):
+            return None
+        key = make_response_key(model, prompt)
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= now:
+            del self._entries[key]
+            entry = None
+        if entry is None and self.persist:
+            try:
+                row = await database.get_cached_response(key, now)
+            except Exception as e:
+                print(f"ERROR: Reading the persistent response cache failed. Reason: {e}")
+                row = None
+            if row is not None:
+                expires_at, parsed_json, raw_response = row
+                entry = (expires_at, json.loads(parsed_json), raw_response)
+                self._store(key, entry)
+                self.persistent_hits += 1
+        if entry is None:
+            self._misses[endpoint] = self._misses.get(endpoint, 0) + 1
+            return None
+        self._entries.move_to_end(key)
+        self._hits[endpoint] = self._hits.get(endpoint, 0) + 1
+        # Callers may modify what they get back
+        return copy.deepcopy(entry[1]), entry[2]
+
+    def _store(self, key: str, entry: Tuple[float, Any, str]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def put(self, model: str, prompt: str, endpoint: str, parsed_data: Any, raw_response: str):
+        """Caches a validated response for the endpoint's TTL."""
+        if not self.enabled_for(endpoint):
+            return
+        key = make_response_key(model, prompt)
+        expires_at = time.time() + self.ttls[endpoint]
+        self._store(key, (expires_at, copy.deepcopy(parsed_data), raw_response))
+        if self.persist:
+            try:
+                await database.put_cached_response(key, endpoint, expires_at, json.dumps(parsed_data), raw_response)
+            except Exception as e:
+                print(f"ERROR: Writing the persistent response cache failed. Reason: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        endpoints = sorted(set(self._hits) | set(self._misses))
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "persistent_hits": self.persistent_hits,
+            "endpoints": {
+                endpoint: {"hits": self._hits.get(endpoint, 0), "misses": self._misses.get(endpoint, 0)}
+                for endpoint in endpoints
+            },
+        }
+
+response_cache = ResponseCache()
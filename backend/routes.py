@@ -1,26 +1,126 @@
 import json
 import asyncio
-from datetime import datetime
-from fastapi import Request, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse
-
-from . import database
-from .config import CATEGORY_MODELS, EXPLANATION_MODELS, FALLBACK_MODEL, PROMPTS, MAX_PRELOAD_CATEGORIES, MIN_PRELOAD_INTERVAL, DEBUG_MODE
-from .state import PRELOAD_STATUS_LOCK, PRELOAD_TASK_STATUS
-from .generative import call_generative_model, ensure_blueprints_exist
-from .preload import _preload_task
-from .utils import build_question_prompt, is_question_valid, format_explanation_part, update_generation_history
-from .models import GenerateCategoriesRequest, QuestionRequest, ExplanationRequest, MutationRequest, PreloadRequest
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Optional
+from fastapi import Request, HTTPException, Query
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+
+from . import database, telemetry, maintenance
+from .config import CATEGORY_MODELS, EXPLANATION_MODELS, DEBUG_MODE, GENERATION_DEADLINE_SECONDS
+from .generative import call_generative_model, stream_generative_model, ensure_blueprints_exist
+from .warm_pool import warm_pool
+from .question_cache import question_cache, make_cache_key
+from .archive import question_archive
+from .metrics import latency_histograms, LATENCY_BUCKETS_MS, STATS_WINDOWS
+from .usage import token_usage
+from .singleflight import blueprint_flights, preload_flights
+from .response_cache import response_cache
+from .limiter import generative_limiter
+from .hedging import hedge_policy
+from .deadline import Deadline, DeadlineExceeded, deadline_stats
+from .model_health import model_health
+from .prompts import prompt_registry
+from .question_batch import batch_stats
+from .utils import build_question_prompt, is_question_valid, format_explanation_part, update_generation_history, are_categories_valid, are_mutation_choices_valid, is_explanation_valid, extract_json_from_response
+from .json_extract import JsonScanner
+from .models import BaseModelWithModel, GenerateCategoriesRequest, QuestionRequest, ExplanationRequest, MutationRequest, PreloadRequest, PreloadPlanRequest
 
 # --- API Endpoints ---
 async def get_db_stats():
-    return JSONResponse(content=await database.get_all_stats())
+    latency = {name: await latency_histograms.window_stats(seconds) for name, seconds in STATS_WINDOWS.items()}
+    return JSONResponse(content={
+        "models": await database.get_all_stats(),
+        "latency": latency,
+        "latency_buckets_ms": list(LATENCY_BUCKETS_MS)
+    })
+
+ADMIN_PAGE_DEFAULT_LIMIT = 100
+ADMIN_PAGE_MAX_LIMIT = 500
+
+def _parse_time_filter(name: str, value: Optional[str]) -> Optional[datetime]:
+    """Parses an ISO 8601 filter value into a naive UTC datetime (the format stored in the database)."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"'{name}' must be an ISO 8601 timestamp.")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def _stream_rows(rows: AsyncIterator[Dict[str, Any]], fmt: str) -> StreamingResponse:
+    """Streams rows as NDJSON or as one chunked JSON array, one row at a time."""
+    if fmt == "ndjson":
+        async def ndjson_body():
+            async for row in rows:
+                yield json.dumps(row) + "\n"
+        return StreamingResponse(ndjson_body(), media_type="application/x-ndjson")
+
+    async def json_array_body():
+        yield "["
+        first = True
+        async for row in rows:
+            yield ("" if first else ",") + json.dumps(row)
+            first = False
+        yield "]"
+    return StreamingResponse(json_array_body(), media_type="application/json")
 
-async def get_db_prompts():
-    return JSONResponse(content=await database.get_prompt_history())
+async def get_db_prompts(
+    limit: int = Query(ADMIN_PAGE_DEFAULT_LIMIT, ge=1, le=ADMIN_PAGE_MAX_LIMIT),
+    before_id: Optional[int] = None,
+    model: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
+    rows = database.iter_prompt_history(
+        limit, before_id=before_id, model=model,
+        since=_parse_time_filter("since", since), until=_parse_time_filter("until", until)
+    )
+    return _stream_rows(rows, fmt)
 
-async def get_db_errors():
-    return JSONResponse(content=await database.get_error_logs())
+async def get_db_errors(
+    limit: int = Query(ADMIN_PAGE_DEFAULT_LIMIT, ge=1, le=ADMIN_PAGE_MAX_LIMIT),
+    before_id: Optional[int] = None,
+    endpoint: Optional[str] = None,
+    model: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
+    rows = database.iter_error_logs(
+        limit, before_id=before_id, endpoint=endpoint, model=model,
+        since=_parse_time_filter("since", since), until=_parse_time_filter("until", until)
+    )
+    return _stream_rows(rows, fmt)
+
+ERROR_SUMMARY_WINDOWS = {"1h": 3600, "24h": 86400, "7d": 7 * 86400, "30d": 30 * 86400}
+
+async def get_db_error_summary(window: str = Query("24h", pattern="^(1h|24h|7d|30d)$")):
+    return JSONResponse(content=await database.get_error_summary(ERROR_SUMMARY_WINDOWS[window]))
+
+async def get_db_usage(window: str = Query("24h", pattern="^(1h|24h|7d|30d)$")):
+    return JSONResponse(content=await token_usage.window_summary(ERROR_SUMMARY_WINDOWS[window]))
+
+async def get_db_runtime():
+    return JSONResponse(content={
+        "schema_version": database.schema_version,
+        "telemetry": telemetry.telemetry_writer.stats(),
+        "question_cache": question_cache.stats(),
+        "error_compaction": maintenance.compaction_stats,
+        "archive": question_archive.stats(),
+        "latency_histograms": latency_histograms.stats(),
+        "token_usage": token_usage.stats(),
+        "response_cache": response_cache.stats(),
+        "singleflight": {flight.name: flight.stats() for flight in (blueprint_flights, preload_flights)},
+        "generative_limiter": generative_limiter.stats(),
+        "question_batches": batch_stats,
+        "hedging": hedge_policy.stats(),
+        "model_health": model_health.stats(),
+        "deadlines": deadline_stats,
+        "warm_pool": warm_pool.stats()
+    })
 
 async def get_question_models():
     from .config import QUESTION_MODELS
@@ -34,7 +134,26 @@ async def get_category_models():
     from .config import CATEGORY_MODELS
     return JSONResponse(content=CATEGORY_MODELS)
 
-async def preload_questions(req: PreloadRequest, background_tasks: BackgroundTasks):
+def _preload_params(req: BaseModelWithModel) -> Dict[str, Any]:
+    """The question settings of a preload request, as the question prompts and the cache key read them."""
+    return req.model_dump(include={"model", "gameId", "gameMode", "knowledgeLevel", "language", "theme", "includeCategoryTheme"})
+
+async def preload_plan(req: PreloadPlanRequest):
+    # Basic validation
+    if not req.gameId:
+        raise HTTPException(status_code=400, detail="gameId is required")
+    if not any(category.strip() for category in req.categories):
+        raise HTTPException(status_code=400, detail="categories are required")
+
+    # Hardcode model to "trivia" router
+    req.model = "trivia"
+    upcoming = {}
+    for item in req.upcoming:
+        upcoming[item.category] = max(upcoming.get(item.category, 0.0), item.probability)
+    status = warm_pool.plan(req.gameId, "trivia", _preload_params(req), req.categories, upcoming)
+    return JSONResponse(content=status, status_code=202)
+
+async def preload_questions(req: PreloadRequest):
     # Basic validation
     if not req.gameId:
         raise HTTPException(status_code=400, detail="gameId is required")
@@ -43,48 +162,44 @@ async def preload_questions(req: PreloadRequest, background_tasks: BackgroundTas
 
     # Hardcode model to "trivia" router
     req.model = "trivia"
-
-    # signature for deduplication
-    req_signature = json.dumps(req.model_dump(), sort_keys=True)
-
-    # Use a lock to avoid race conditions when scheduling multiple preload tasks concurrently
-    from .state import PRELOAD_STATUS_LOCK
-    if PRELOAD_STATUS_LOCK is None:
-        # Initialize if not done yet (fallback for race conditions)
-        import asyncio
-        PRELOAD_STATUS_LOCK = asyncio.Lock()
-    async with PRELOAD_STATUS_LOCK:
-        status = PRELOAD_TASK_STATUS.get(req.gameId)
-        now_ts = datetime.utcnow().timestamp()
-        if status:
-            # If same payload already scheduled or running => dedupe
-            if status.get("req_signature") == req_signature and status.get("state") in ("scheduled", "running"):
-                return JSONResponse(content={"message": "Preloading is already in progress."}, status_code=202)
-
-            # If last schedule attempt was too recent, throttle
-            last = status.get("last_scheduled", 0)
-            if now_ts - last < MIN_PRELOAD_INTERVAL:
-                raise HTTPException(status_code=429, detail="Too many preload requests. Try again later.")
-
-        # reserve the slot / mark as scheduled so other concurrent requests won't spawn duplicates
-        PRELOAD_TASK_STATUS[req.gameId] = {
-            "state": "scheduled",
-            "event": asyncio.Event(),
-            "last_scheduled": now_ts,
-            "req_signature": req_signature
-        }
-
-        # schedule background task
-        background_tasks.add_task(_preload_task, req.gameId, "trivia", req)
-        return JSONResponse(content={"message": "Preloading started."}, status_code=202)
+    # One category: the game's next landing in its warm pool plan
+    status = warm_pool.add_category(req.gameId, "trivia", _preload_params(req), req.category)
+    return JSONResponse(content=status, status_code=202)
 
 async def generate_question(req: QuestionRequest):
+    deadline = Deadline(GENERATION_DEADLINE_SECONDS)
+    try:
+        response = await _generate_question(req, deadline)
+    except DeadlineExceeded as e:
+        response = await _question_deadline_response(req, e)
+    if response.status_code == 200:
+        token_usage.record_served(req.gameId)
+    # Top the game's warm pool up again after what this question took from it
+    warm_pool.refill(req.gameId)
+    return response
+
+async def _question_deadline_response(req: QuestionRequest, error: DeadlineExceeded) -> JSONResponse:
+    print(f"[{req.gameId}] Question for '{req.category}' ran out of time: {error}")
+    telemetry.log_error("generate_question_deadline", {"request": req.model_dump(), "error": str(error), "raw_response_snippet": ""})
+    # An archived question beats a timeout, whatever the reuse ratio
+    archived_question = await question_archive.take(req.gameId, make_cache_key(req.category, req.model_dump()))
+    if archived_question:
+        return JSONResponse(content=archived_question)
+    return JSONResponse(status_code=504, content={
+        "detail": f"Question generation timed out: {error}", "stage": error.stage, "budget_seconds": error.budget
+    })
+
+def _deadline_http_error(what: str, error: DeadlineExceeded) -> HTTPException:
+    return HTTPException(status_code=504, detail=f"{what} timed out: {error}")
+
+async def _generate_question(req: QuestionRequest, deadline: Deadline):
     # Hardcode model to "trivia" router
     req.model = "trivia"
     
-    cached_question = await database.get_and_remove_cached_question(req.category)
+    cache_key = make_cache_key(req.category, req.model_dump())
+    cached_question = question_cache.pop(cache_key)
     if cached_question:
-        if DEBUG_MODE: print(f"Serving question for '{req.category}' from DB cache.")
+        if DEBUG_MODE: print(f"Serving question for '{req.category}' from the preload cache.")
         
         # Format explanations for cached questions too, in case they were stored with old format
         if "explanation" in cached_question and isinstance(cached_question["explanation"], str):
@@ -117,52 +232,48 @@ async def generate_question(req: QuestionRequest):
                  
                 cached_question["explanation"] = "\n\n".join(explanation_parts)
          
-        return JSONResponse(content=cached_question)
+        return JSONResponse(content=question_archive.mark_served(req.gameId, cached_question))
+
+    # Reuse a stored question this game has not seen before paying for an LLM call
+    if question_archive.should_reuse():
+        archived_question = await deadline.run(question_archive.take(req.gameId, cache_key), "database")
+        if archived_question:
+            if DEBUG_MODE: print(f"Serving question for '{req.category}' from the archive.")
+            return JSONResponse(content=archived_question)
 
-    # If a preload is scheduled/running for this gameId, wait a short time for it to finish
-    if status := PRELOAD_TASK_STATUS.get(req.gameId):
+    # If the warm pool is filling this category right now, wait a short time for the fill to finish
+    # (at most half the time left, keeping the rest for generating on the fly)
+    if fill := preload_flights.pending(cache_key):
         try:
-            await asyncio.wait_for(status["event"].wait(), timeout=30.0)
-            cached_question = await database.get_and_remove_cached_question(req.category)
-            if cached_question:
-                if DEBUG_MODE: print(f"Serving question for '{req.category}' from cache after waiting.")
-                return JSONResponse(content=cached_question)
+            await asyncio.wait_for(asyncio.shield(fill), timeout=min(30.0, deadline.remaining() / 2))
         except asyncio.TimeoutError:
             if DEBUG_MODE: print(f"[{req.gameId}] Preload wait timed out for '{req.category}'. Generating on the fly.")
+        except Exception:
+            # The fill failed; generating on the fly below
+            pass
+        cached_question = question_cache.pop(cache_key)
+        if cached_question:
+            if DEBUG_MODE: print(f"Serving question for '{req.category}' from cache after waiting.")
+            return JSONResponse(content=question_archive.mark_served(req.gameId, cached_question))
 
     # Ensure we have blueprints for this category
     language = req.language if hasattr(req, 'language') else 'pl'
     theme = req.theme if hasattr(req, 'theme') else 'General knowledge'
     try:
-        await ensure_blueprints_exist(req.category, language, theme, "trivia")
+        # A player is waiting on this batch
+        await ensure_blueprints_exist(req.category, language, theme, "trivia", priority="interactive", deadline=deadline)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Warning: Could not ensure blueprints for '{req.category}': {e}. Falling back to old generation.")
         # Continue with old method
 
-    blueprint = await database.get_unused_blueprint(req.category)
+    blueprint = await deadline.run(database.get_unused_blueprint(req.category), "database")
     if blueprint:
         if DEBUG_MODE:
             print(f"Using blueprint for '{req.category}': subcategory={blueprint['subcategory']}, modifier={blueprint['modifier']}, target_answer={blueprint['target_answer']}")
         # Build prompt from blueprint
-        prompt_struct = PROMPTS["generate_question_from_blueprint"][language]
-        static_part = [
-            prompt_struct["persona"],
-            "\n".join(prompt_struct["static_instructions"])
-        ]
-        static_content = "\n\n".join(static_part)
-        knowledge_key = req.knowledgeLevel if hasattr(req, 'knowledgeLevel') else 'basic'
-        knowledge_prompt = PROMPTS["knowledge_prompts"][knowledge_key][language]
-        game_mode_key = req.gameMode if hasattr(req, 'gameMode') else 'mcq'
-        game_mode_prompt = PROMPTS["game_mode_prompts"][game_mode_key][language]
-        dynamic_content = prompt_struct["task_template"].format(
-            category=req.category,
-            subcategory=blueprint['subcategory'],
-            modifier=blueprint['modifier'] or '',
-            target_answer=blueprint['target_answer'],
-            knowledge_level=knowledge_prompt,
-            game_mode=game_mode_prompt
-        )
-        full_prompt = f"{static_content}\n\n{dynamic_content}"
+        full_prompt = build_question_prompt(req.model_dump(), req.category, blueprint)
         
         MAX_RETRIES = 2
         last_error = None
@@ -170,7 +281,9 @@ async def generate_question(req: QuestionRequest):
         for attempt in range(MAX_RETRIES):
             try:
                 if DEBUG_MODE: print(f"--- Blueprint-based generation attempt {attempt + 1}/{MAX_RETRIES} for '{req.category}' ---")
-                data, raw_response = await call_generative_model(full_prompt, "trivia", return_raw=True)
+                data, raw_response = await call_generative_model(full_prompt, "trivia", return_raw=True, endpoint="generate_question", hedge=True,
+                                                              validator=lambda d: is_question_valid(d, req.gameMode)[0], game_id=req.gameId,
+                                                              deadline=deadline)
                 raw_response_last = raw_response
                 is_valid, error_message = is_question_valid(data, req.gameMode)
                 if is_valid:
@@ -192,20 +305,22 @@ async def generate_question(req: QuestionRequest):
                         else:
                             explanation_parts.append(f"Explanation of incorrect answers:\n{distractors_explanation}")
                     data["explanation"] = "\n\n".join(explanation_parts)
-                    await database.add_question(data, req.model_dump())
+                    question_archive.remember(req.gameId, await database.add_question(data, req.model_dump()))
                     update_generation_history(req.category, data.get("subcategory"), data.get("key_entities"))
                     return JSONResponse(content=data)
                 else:
                     last_error = ValueError(error_message)
                     print(f"WARNING: Validation failed on attempt {attempt + 1}: {error_message}. Raw response snippet: '{raw_response[:300]}...'")
-                    await database.log_error_db("generate_question_validation", {"request": req.model_dump(), "error": error_message, "raw_response_snippet": raw_response[:300]})
+                    telemetry.log_error("generate_question_validation", {"request": req.model_dump(), "error": error_message, "raw_response_snippet": raw_response[:300]})
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 last_error = e
                 raw_response_last = raw_response_last or "No raw response captured."
                 print(f"Exception on attempt {attempt + 1}/{MAX_RETRIES} for '{req.category}': {e}. Raw response snippet: '{raw_response_last[:300]}...'")
-                await database.log_error_db("generate_question_exception", {"request": req.model_dump(), "error": str(e), "raw_response_snippet": raw_response_last[:300]})
+                telemetry.log_error("generate_question_exception", {"request": req.model_dump(), "error": str(e), "raw_response_snippet": raw_response_last[:300]})
                 if attempt < MAX_RETRIES - 1:
-                    await asyncio.sleep(1)
+                    await deadline.sleep(1, "retry")
         # If we reach here, blueprint generation failed
         print(f"Blueprint generation failed for '{req.category}'. Falling back to old method.")
         # Mark blueprint as unused? We'll keep it used for now.
@@ -224,7 +339,9 @@ async def generate_question(req: QuestionRequest):
                 req.includeCategoryTheme = not req.includeCategoryTheme  # Toggle theme inclusion for variation
 
             prompt = build_question_prompt(req.model_dump(), req.category)
-            data, raw_response = await call_generative_model(prompt, "trivia", return_raw=True)
+            data, raw_response = await call_generative_model(prompt, "trivia", return_raw=True, endpoint="generate_question", hedge=True,
+                                                          validator=lambda d: is_question_valid(d, req.gameMode)[0], game_id=req.gameId,
+                                                              deadline=deadline)
             raw_response_last = raw_response
             is_valid, error_message = is_question_valid(data, req.gameMode)
             if is_valid:
@@ -252,29 +369,36 @@ async def generate_question(req: QuestionRequest):
                   
                   
                 data["explanation"] = "\n\n".join(explanation_parts)
-                await database.add_question(data, req.model_dump())
+                question_archive.remember(req.gameId, await database.add_question(data, req.model_dump()))
                 update_generation_history(req.category, data.get("subcategory"), data.get("key_entities"))
                 return JSONResponse(content=data)
             else:
                 last_error = ValueError(error_message)
                 print(f"WARNING: Validation failed on attempt {attempt + 1}: {error_message}. Raw response snippet: '{raw_response[:300]}...'")
-                await database.log_error_db("generate_question_validation", {"request": req.model_dump(), "error": error_message, "raw_response_snippet": raw_response[:300]})
+                telemetry.log_error("generate_question_validation", {"request": req.model_dump(), "error": error_message, "raw_response_snippet": raw_response[:300]})
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             last_error = e
             raw_response_last = raw_response_last or "No raw response captured."
             print(f"Exception on attempt {attempt + 1}/{MAX_RETRIES} for '{req.category}': {e}. Raw response snippet: '{raw_response_last[:300]}...'")
-            await database.log_error_db("generate_question_exception", {"request": req.model_dump(), "error": str(e), "raw_response_snippet": raw_response_last[:300]})
+            telemetry.log_error("generate_question_exception", {"request": req.model_dump(), "error": str(e), "raw_response_snippet": raw_response_last[:300]})
             if attempt < MAX_RETRIES - 1:
-                await asyncio.sleep(1)
+                await deadline.sleep(1, "retry")
 
     error_message = f"Failed to generate a valid question for category '{req.category}' after {MAX_RETRIES} attempts. Final error: {last_error}"
     print(f"{error_message}. Last raw response snippet: '{raw_response_last[:300]}...'")
-    await database.log_error_db("generate_question", {"request": req.model_dump(), "error": str(last_error), "raw_response_snippet": raw_response_last[:300]})
+    telemetry.log_error("generate_question", {"request": req.model_dump(), "error": str(last_error), "raw_response_snippet": raw_response_last[:300]})
+    # Generation failed: an archived question beats an error, whatever the reuse ratio
+    archived_question = await question_archive.take(req.gameId, cache_key)
+    if archived_question:
+        return JSONResponse(content=archived_question)
     fallback_response = {"question": "Wystąpił błąd podczas generowania pytania.", "options": [], "answer": "", "explanation": "Błąd serwera.", "subcategory": "Błąd", "key_entities": []}
     return JSONResponse(content=fallback_response, status_code=500)
 
 async def generate_categories(req: GenerateCategoriesRequest):
     MAX_RETRIES = 2
+    deadline = Deadline(GENERATION_DEADLINE_SECONDS)
     for attempt in range(MAX_RETRIES + 1):
         try:
             # Hardcode model to "trivia" router
@@ -283,54 +407,59 @@ async def generate_categories(req: GenerateCategoriesRequest):
             # Use the helper function to build the prompt properly
             from .utils import build_categories_prompt
             prompt = build_categories_prompt(req.language, req.theme)
-            response_data, raw_response = await call_generative_model(prompt, model_to_use, return_raw=True)
+            response_data, raw_response = await call_generative_model(prompt, model_to_use, return_raw=True, endpoint="generate_categories", cache_validator=are_categories_valid,
+                                                                          game_id=req.gameId, deadline=deadline)
             if response_data and isinstance(response_data, dict):
                 return JSONResponse(content=response_data)
             else:
                 if isinstance(response_data, dict) and response_data.get("error"):
                     print(f"Attempt {attempt + 1} failed: {response_data['error']}. Raw snippet: '{raw_response[:300]}...'")
-                    await database.log_error_db("generate_categories_error", {"request": req.__dict__, "error": response_data['error'], "raw_response_snippet": raw_response[:300]})
+                    telemetry.log_error("generate_categories_error", {"request": req.__dict__, "error": response_data['error'], "raw_response_snippet": raw_response[:300]})
+        except DeadlineExceeded as e:
+            telemetry.log_error("generate_categories_deadline", {"request": req.__dict__, "error": str(e), "raw_response_snippet": ""})
+            raise _deadline_http_error("Generating categories", e)
         except Exception as e:
             raw_response = raw_response if 'raw_response' in locals() else "No response captured."
             print(f"Attempt {attempt + 1} failed for generate-categories: {e}. Raw snippet: '{raw_response[:300]}...'")
-            await database.log_error_db("generate_categories_exception", {"request": req.__dict__, "error": str(e), "raw_response_snippet": raw_response[:300]})
+            telemetry.log_error("generate_categories_exception", {"request": req.__dict__, "error": str(e), "raw_response_snippet": raw_response[:300]})
             if attempt == MAX_RETRIES:
                 raise HTTPException(status_code=500, detail=f"Failed to generate categories: {e}")
-            await asyncio.sleep(1)
+            try:
+                await deadline.sleep(1, "retry")
+            except DeadlineExceeded as e:
+                raise _deadline_http_error("Generating categories", e)
 
 async def get_category_mutation(req: MutationRequest):
     try:
         # Hardcode model to "trivia" router
         model_to_use = "trivia"
-        prompt_struct = PROMPTS["mutate_category"][req.language]
-        prompt = prompt_struct["task_template"].format(old_category=req.old_category, theme=req.theme or "general", existing_categories=req.existing_categories)
-         
-        # Combine with static instructions if available
-        if "static_instructions" in prompt_struct:
-            static_content = "\n".join(prompt_struct["static_instructions"])
-            prompt = f"{static_content}\n\n{prompt}"
-             
-        response_data, raw_response = await call_generative_model(prompt, model_to_use, return_raw=True)
+        prompt = prompt_registry.get("mutate_category", req.language).render(
+            old_category=req.old_category, theme=req.theme or "general", existing_categories=req.existing_categories
+        )
+        response_data, raw_response = await call_generative_model(prompt, model_to_use, return_raw=True, endpoint="category_mutation", cache_validator=are_mutation_choices_valid,
+                                                                      game_id=req.gameId, deadline=Deadline(GENERATION_DEADLINE_SECONDS))
         return JSONResponse(content=response_data) if isinstance(response_data, dict) else {"error": "Invalid response", "raw_snippet": raw_response[:300]}
+    except DeadlineExceeded as e:
+        telemetry.log_error("mutate_category_deadline", {"request": req.__dict__, "error": str(e), "raw_response_snippet": ""})
+        raise _deadline_http_error("Mutating the category", e)
     except Exception as e:
         raw_response = raw_response if 'raw_response' in locals() else "No response captured."
         print(f"ERROR in mutate-category: {e}. Raw snippet: '{raw_response[:300]}...'")
-        await database.log_error_db("mutate_category", {"request": req.__dict__, "error": str(e), "raw_response_snippet": raw_response[:300]})
+        telemetry.log_error("mutate_category", {"request": req.__dict__, "error": str(e), "raw_response_snippet": raw_response[:300]})
         raise HTTPException(status_code=500, detail=f"Failed to mutate category: {e}")
 
+def build_explanation_prompt(req: ExplanationRequest) -> str:
+    return prompt_registry.get("explain_incorrect", req.language).render(
+        question=req.question, correct_answer=req.correct_answer, player_answer=req.player_answer
+    )
+
 async def get_incorrect_explanation(req: ExplanationRequest):
     try:
         # Hardcode model to "trivia" router
         model_to_use = "trivia"
-        prompt_struct = PROMPTS["explain_incorrect"][req.language]
-        prompt = prompt_struct["task_template"].format(question=req.question, correct_answer=req.correct_answer, player_answer=req.player_answer)
-         
-        # Combine with static instructions if available
-        if "static_instructions" in prompt_struct:
-            static_content = "\n".join(prompt_struct["static_instructions"])
-            prompt = f"{static_content}\n\n{prompt}"
-         
-        response_data, raw_response = await call_generative_model(prompt, model_to_use, return_raw=True)
+        prompt = build_explanation_prompt(req)
+        response_data, raw_response = await call_generative_model(prompt, model_to_use, return_raw=True, endpoint="incorrect_explanation", cache_validator=is_explanation_valid,
+                                                                  game_id=req.gameId, deadline=Deadline(GENERATION_DEADLINE_SECONDS))
         if isinstance(response_data, str):
             response_data = {"explanation": response_data}
         if isinstance(response_data, dict):
@@ -338,12 +467,84 @@ async def get_incorrect_explanation(req: ExplanationRequest):
         else:
             print(f"ERROR: Invalid response format. Raw snippet: '{raw_response[:300]}...'")
             raise ValueError("Response from model could not be processed into a valid format.")
+    except DeadlineExceeded as e:
+        telemetry.log_error("explain_incorrect_deadline", {"request": req.__dict__, "error": str(e), "raw_response_snippet": ""})
+        raise _deadline_http_error("Explaining the answer", e)
     except Exception as e:
         raw_response = raw_response if 'raw_response' in locals() else "No response captured."
         print(f"ERROR in explain-incorrect: {e}. Raw snippet: '{raw_response[:300]}...'")
-        await database.log_error_db("explain_incorrect", {"request": req.__dict__, "error": str(e), "raw_response_snippet": raw_response[:300]})
+        telemetry.log_error("explain_incorrect", {"request": req.__dict__, "error": str(e), "raw_response_snippet": raw_response[:300]})
         raise HTTPException(status_code=500, detail=f"Failed to get explanation: {e}")
 
+def _sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _sse_deadline_event(req: ExplanationRequest, error: DeadlineExceeded) -> str:
+    """The streamed counterpart of the 504 /api/explain-incorrect answers when its budget runs out."""
+    telemetry.log_error("explain_incorrect_deadline", {"request": req.__dict__, "error": str(error), "raw_response_snippet": ""})
+    return _sse_event("error", {"detail": _deadline_http_error("Explaining the answer", error).detail, "status_code": 504})
+
+async def stream_incorrect_explanation(req: ExplanationRequest):
+    """
+    Same result as /api/explain-incorrect, delivered as server-sent events: "delta" events carry explanation
+    text as the model produces it, then one "result" event carries the validated JSON (or an "error" event).
+    """
+    model_to_use = "trivia"
+    prompt = build_explanation_prompt(req)
+
+    async def events() -> AsyncIterator[str]:
+        cached = await response_cache.get(model_to_use, prompt, "incorrect_explanation")
+        if cached is not None:
+            yield _sse_event("result", cached[0])
+            return
+        # Bounds the wait for the first delta and the non-streamed fallback; text already streamed is never cut off
+        deadline = Deadline(GENERATION_DEADLINE_SECONDS)
+        raw_response = ""
+        streamed = ""
+        scanner = JsonScanner()
+        try:
+            async for delta in stream_generative_model(prompt, model_to_use, endpoint="incorrect_explanation", game_id=req.gameId,
+                                                     deadline=deadline):
+                raw_response += delta
+                scanner.feed(delta)
+                explanation = scanner.string_field("explanation")
+                if explanation and len(explanation) > len(streamed):
+                    yield _sse_event("delta", {"text": explanation[len(streamed):]})
+                    streamed = explanation
+            response_data = extract_json_from_response(raw_response)
+        except DeadlineExceeded as e:
+            yield _sse_deadline_event(req, e)
+            return
+        except Exception as e:
+            if raw_response:
+                print(f"ERROR in explain-incorrect stream: {e}. Raw snippet: '{raw_response[:300]}...'")
+                yield _sse_event("error", {"detail": f"Failed to get explanation: {e}"})
+                return
+            # Nothing was sent yet: a regular call (with retries and fallback) can still answer
+            try:
+                response_data, raw_response = await call_generative_model(prompt, model_to_use, return_raw=True, endpoint="incorrect_explanation", cache_validator=is_explanation_valid,
+                                                                          game_id=req.gameId, deadline=deadline)
+            except DeadlineExceeded as e:
+                yield _sse_deadline_event(req, e)
+                return
+            except Exception as e:
+                telemetry.log_error("explain_incorrect", {"request": req.__dict__, "error": str(e), "raw_response_snippet": ""})
+                yield _sse_event("error", {"detail": f"Failed to get explanation: {e}"})
+                return
+        else:
+            if is_explanation_valid(response_data):
+                await response_cache.put(model_to_use, prompt, "incorrect_explanation", response_data, raw_response)
+        if isinstance(response_data, str):
+            response_data = {"explanation": response_data}
+        if not isinstance(response_data, dict):
+            telemetry.log_error("explain_incorrect", {"request": req.__dict__, "error": "Invalid response format", "raw_response_snippet": raw_response[:300]})
+            yield _sse_event("error", {"detail": "Response from model could not be processed into a valid format."})
+            return
+        yield _sse_event("result", response_data)
+
+    # X-Accel-Buffering stops reverse proxies from holding back the deltas
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # --- Static Files ---
 async def root(request: Request):
     from .server import templates
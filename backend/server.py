@@ -7,14 +7,19 @@ from fastapi.responses import FileResponse
 from fastapi.templating import Jinja2Templates
 
 from . import database
-from .config import initialize_async_resources, fetch_models_from_api, initialize_models, DEBUG_MODE, MAX_CONCURRENT_PRELOAD_TASKS, MAX_PRELOAD_CATEGORIES, GENERATIVE_RATE_LIMIT_COUNT, GENERATIVE_RATE_LIMIT_PERIOD, GENERATIVE_INFLIGHT_LIMIT
+from .telemetry import telemetry_writer
+from .question_cache import question_cache
+from .metrics import latency_histograms
+from .usage import token_usage
+from .warm_pool import warm_pool
+from .config import initialize_async_resources, fetch_models_from_api, initialize_models, DEBUG_MODE, MAX_CONCURRENT_PRELOAD_TASKS, MAX_PRELOAD_CATEGORIES, GENERATIVE_RATE_LIMIT_COUNT, GENERATIVE_RATE_LIMIT_PERIOD, GENERATIVE_INFLIGHT_LIMIT, GENERATIVE_ADAPTIVE_LIMITS
 
 # Import routes to register them
 from .routes import (
-    get_db_stats, get_db_prompts, get_db_errors, get_question_models,
+    get_db_stats, get_db_prompts, get_db_errors, get_db_error_summary, get_db_usage, get_db_runtime, get_question_models,
     get_explanation_models, get_category_models,
-    preload_questions, generate_question, generate_categories,
-    get_category_mutation, get_incorrect_explanation,
+    preload_plan, preload_questions, generate_question, generate_categories,
+    get_category_mutation, get_incorrect_explanation, stream_incorrect_explanation,
     root
 )
 
@@ -29,20 +34,26 @@ templates = Jinja2Templates(directory="templates")
 
 # Import cleanup functions
 from .live_quiz_routes import start_cleanup_task, stop_cleanup_task
+from .maintenance import start_compaction_task, stop_compaction_task
 from .state import load_state_from_disk, save_state_to_disk, periodic_save_task
 
 # Register API routes
 app.get("/api/db/stats")(get_db_stats)
 app.get("/api/db/prompts")(get_db_prompts)
 app.get("/api/db/errors")(get_db_errors)
+app.get("/api/db/errors/summary")(get_db_error_summary)
+app.get("/api/db/usage")(get_db_usage)
+app.get("/api/db/runtime")(get_db_runtime)
 app.get("/api/models/questions")(get_question_models)
 app.get("/api/models/explanations")(get_explanation_models)
 app.get("/api/models/categories")(get_category_models)
+app.post("/api/preload-plan")(preload_plan)
 app.post("/api/preload-questions")(preload_questions)
 app.post("/api/generate-question")(generate_question)
 app.post("/api/generate-categories")(generate_categories)
 app.post("/api/mutate-category")(get_category_mutation)
 app.post("/api/explain-incorrect")(get_incorrect_explanation)
+app.post("/api/explain-incorrect/stream")(stream_incorrect_explanation)
 
 # Live Quiz API routes
 app.post("/api/live-quiz/create-room")(create_room)
@@ -72,7 +83,11 @@ async def db_browser(request: Request):
 @app.on_event("startup")
 async def startup_event():
     await database.init_db()
+    await question_cache.load()
     initialize_async_resources()
+    telemetry_writer.start()
+    latency_histograms.start()
+    token_usage.start()
 
     # Fetch models from API and initialize
     dynamic_models = await fetch_models_from_api()
@@ -80,10 +95,11 @@ async def startup_event():
 
     # Start background cleanup task for live quiz games
     start_cleanup_task()
+    start_compaction_task()
 
     if DEBUG_MODE:
         print("Startup completed. Rate limiter and semaphores initialized.")
-        print(f"Generative rate limit: {GENERATIVE_RATE_LIMIT_COUNT}/{GENERATIVE_RATE_LIMIT_PERIOD}s, inflight: {GENERATIVE_INFLIGHT_LIMIT}")
+        print(f"Generative rate limit: {GENERATIVE_RATE_LIMIT_COUNT}/{GENERATIVE_RATE_LIMIT_PERIOD}s, inflight: {GENERATIVE_INFLIGHT_LIMIT} (adaptive: {GENERATIVE_ADAPTIVE_LIMITS})")
         print(f"Preload concurrency limit: {MAX_CONCURRENT_PRELOAD_TASKS}, max categories per preload: {MAX_PRELOAD_CATEGORIES}")
         print("Live quiz cleanup task started.")
 
@@ -91,8 +107,15 @@ async def startup_event():
 async def shutdown_event():
     # Stop background cleanup task
     stop_cleanup_task()
+    stop_compaction_task()
+    warm_pool.stop()
     # Save game state to disk
     save_state_to_disk()
+    # Drain queued telemetry, then close pooled database connections
+    await telemetry_writer.stop()
+    await latency_histograms.stop()
+    await token_usage.stop()
+    await database.close_db()
     print("Shutdown completed. Cleanup task stopped and state saved.")
 
 app.mount("/", StaticFiles(directory=".", html=True), name="static")
\ No newline at end of file
@@ -14,7 +14,13 @@ from ..live_quiz_models import (
 )
 from ..state import LIVE_QUIZ_GAMES, ROOM_CODES
 from ..generative import call_generative_model
-from ..config import DEBUG_MODE
+from ..archive import question_archive
+from ..question_cache import question_cache, make_cache_key
+from ..question_batch import generate_question_batch
+from ..model_health import model_health
+from ..usage import token_usage
+from ..deadline import Deadline
+from ..config import DEBUG_MODE, LIVE_QUIZ_BATCH_SIZE, GENERATION_DEADLINE_SECONDS
 
 async def broadcast_to_game(game_id: str, event_type: str, data: dict, active_sse_queues: Dict[str, List[asyncio.Queue]]):
     """Broadcast an SSE event to all connected clients in a game."""
@@ -60,14 +66,19 @@ def generate_game_id() -> str:
     """Generate a unique game ID."""
     return f"game_{datetime.now().timestamp()}_{random.randint(1000, 9999)}"
 
-async def generate_live_quiz_question(game_state: LiveQuizGameState, category: str, question_number: int):
-    """Generate a question using the existing AI system."""
+async def generate_live_quiz_question(game_state: LiveQuizGameState, category: str, question_number: int,
+                                      priority: str = "live", hedge: bool = True):
+    """
+    Generate a question using the existing AI system.
+    A host waiting for the question gets the "live" priority and hedging; pre-generation passes "prefetch" and
+    hedge=False so it does not compete with questions someone is waiting for.
+    """
     from ..models import QuestionRequest
-    from ..utils import build_question_prompt as build_prompt
+    from ..utils import build_question_prompt as build_prompt, is_question_valid
     
     # Create request for the existing question generation system
     req = QuestionRequest(
-        model=game_state.selected_question_model,
+        model=model_health.resolve_selection(game_state.selected_question_model),
         gameId=game_state.game_id,
         category=category,
         gameMode=game_state.game_mode,
@@ -77,12 +88,38 @@ async def generate_live_quiz_question(game_state: LiveQuizGameState, category: s
         includeCategoryTheme=game_state.include_category_theme
     )
     
-    # Use the existing generation logic
-    prompt = build_prompt(req.model_dump(), category)
-    data, raw_response = await call_generative_model(prompt, req.model, return_raw=True)
-    
-    if not data or not isinstance(data, dict) or not data.get('question'):
-        raise ValueError("Failed to generate valid question")
+    # Prefer a question left over from an earlier batch, then a stored question nobody in this game has seen yet
+    cache_key = make_cache_key(category, req.model_dump())
+    data = question_cache.pop(cache_key)
+    if data is not None:
+        question_archive.mark_served(game_state.game_id, data)
+    elif question_archive.should_reuse():
+        data = await question_archive.take(game_state.game_id, cache_key)
+
+    if data is None:
+        # The host is waiting: generation gives up in time to fall back to the archive
+        deadline = Deadline(GENERATION_DEADLINE_SECONDS)
+        try:
+            if LIVE_QUIZ_BATCH_SIZE > 1:
+                # One call for several questions of this category; the rest are cached for its next turns
+                served = await generate_question_batch(req.model_dump(), category, req.model, LIVE_QUIZ_BATCH_SIZE,
+                                                       endpoint="live_quiz", priority=priority, serve=1, hedge=hedge,
+                                                       game_id=game_state.game_id, deadline=deadline)
+                data = served[0]
+                question_archive.mark_served(game_state.game_id, data)
+            else:
+                # Use the existing generation logic
+                prompt = build_prompt(req.model_dump(), category)
+                data, raw_response = await call_generative_model(prompt, req.model, return_raw=True, endpoint="live_quiz", priority=priority, hedge=hedge,
+                                                           validator=lambda d: is_question_valid(d, req.gameMode)[0],
+                                                           game_id=game_state.game_id, deadline=deadline)
+            if not data or not isinstance(data, dict) or not data.get('question'):
+                raise ValueError("Failed to generate valid question")
+        except Exception:
+            # Generation failed: fall back to the archive before giving up
+            data = await question_archive.take(game_state.game_id, cache_key)
+            if data is None:
+                raise
     
     # Create Question object
     question = Question(
@@ -100,7 +137,8 @@ async def generate_live_quiz_question(game_state: LiveQuizGameState, category: s
     if question.subcategory and question.key_entities:
         from ..utils import update_generation_history
         update_generation_history(category, question.subcategory, question.key_entities)
-    
+
+    token_usage.record_served(game_state.game_id)
     return question
 
 async def start_question(game_id: str, question_index: int, active_sse_queues: Dict[str, List[asyncio.Queue]]):
@@ -201,7 +239,7 @@ async def pregenerate_next_question(game_id: str, next_question_index: int):
         if game_state.questions[next_question_index] is None:
             category = game_state.categories[next_question_index % 6]
             question_number = next_question_index + 1
-            question = await generate_live_quiz_question(game_state, category, question_number)
+            question = await generate_live_quiz_question(game_state, category, question_number, priority="prefetch", hedge=False)
             game_state.questions[next_question_index] = GameQuestion(
                 question=question,
                 category=category,
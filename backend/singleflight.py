@@ -0,0 +1,65 @@
+"""
+@file singleflight.py
+Keyed single-flight registry: concurrent callers asking for the same work share one in-flight task.
+
+The first caller for a key starts the work as its own task; callers arriving while it runs await the same
+task instead of starting a duplicate. The work is shielded, so a caller that is cancelled (e.g. by a
+timeout) does not cancel it for the others. Callers pass share=False to always run their own work.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from .config import SINGLEFLIGHT_ENABLED
+
+T = TypeVar("T")
+
+class SingleFlight:
+    def __init__(self, name: str, enabled: bool = SINGLEFLIGHT_ENABLED):
+        self.name = name
+        self.enabled = enabled
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.started = 0
+        self.coalesced = 0
+        self.bypassed = 0
+        self.failed = 0
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Retrieve the exception so it is not reported as unhandled when every waiter was cancelled
+        if not task.cancelled() and task.exception() is not None:
+            self.failed += 1
+
+    async def do(self, key: Hashable, work: Callable[[], Awaitable[T]], share: bool = True) -> T:
+        """Runs work() once per key at a time and returns its result (or raises its exception) to every caller."""
+        if not (share and self.enabled):
+            self.bypassed += 1
+            return await work()
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(work())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def pending(self, key: Hashable) -> Optional[asyncio.Task]:
+        """The task running the work for key, if any (await it shielded)."""
+        return self._inflight.get(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inflight": len(self._inflight),
+            "started": self.started,
+            "duplicates_avoided": self.coalesced,
+            "bypassed": self.bypassed,
+            "failed": self.failed,
+        }
+
+# Blueprint batches, keyed by (category, language, theme, priority class)
+blueprint_flights = SingleFlight("blueprints")
+# Preloaded questions, keyed by the question cache key
+preload_flights = SingleFlight("preload")
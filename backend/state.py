@@ -10,15 +10,8 @@ MAX_SUBCATEGORY_HISTORY = 10
 MAX_ENTITY_HISTORY = 20
 MAX_CATEGORIES_TRACKED = 100
 
-# Background task state tracking
-# Format: { "gameId": {"state": "scheduled|running|done", "event": asyncio.Event(), "last_scheduled": ts, "req_signature": str, ...} }
-PRELOAD_TASK_STATUS: Dict[str, Dict[str, Any]] = {}
-
-MAX_QUESTIONS_PER_CATEGORY_IN_CACHE = 2
-
-# placeholders to be initialized on startup
+# placeholder to be initialized on startup
 PRELOAD_CONCURRENCY_SEMAPHORE: Optional[asyncio.Semaphore] = None
-PRELOAD_STATUS_LOCK: Optional[asyncio.Lock] = None
 
 # --- Live Quiz State ---
 LIVE_QUIZ_GAMES: Dict[str, Any] = {}
@@ -26,12 +19,6 @@ ROOM_CODES: Dict[str, str] = {}  # room_code -> game_id mapping
 
 STATE_FILE = "game_state.pickle"
 
-def get_preload_status(game_id: str) -> Optional[Dict[str, Any]]:
-    return PRELOAD_TASK_STATUS.get(game_id)
-
-def set_preload_status(game_id: str, status: Dict[str, Any]):
-    PRELOAD_TASK_STATUS[game_id] = status
-
 def save_state_to_disk():
     """Serializes active games to a local file."""
     try:
@@ -0,0 +1,174 @@
+"""
+@file telemetry.py
+Write-behind queue for telemetry that nobody waits on: model stats, prompt history and error logs.
+It also carries the deferred deletes of preloaded questions already served from memory.
+
+Request handlers enqueue records without awaiting any I/O. A background task coalesces them and
+group-commits them in one transaction every TELEMETRY_FLUSH_INTERVAL_MS or as soon as
+TELEMETRY_FLUSH_BATCH_SIZE records are waiting. When the bounded queue is full new records are dropped
+and counted instead of applying backpressure to the request path. Cache deletes are never dropped: after a
+failed flush they go back to the front of the queue, and are given up (and counted) only after
+CACHE_DELETE_MAX_ATTEMPTS failed flushes.
+"""
+
+import time
+import asyncio
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import database
+from .config import TELEMETRY_QUEUE_SIZE, TELEMETRY_FLUSH_INTERVAL_MS, TELEMETRY_FLUSH_BATCH_SIZE
+
+# Flushes a served question's deferred delete is tried in before it is given up
+CACHE_DELETE_MAX_ATTEMPTS = 3
+
+class TelemetryWriter:
+    def __init__(self, max_queue: int = TELEMETRY_QUEUE_SIZE, flush_interval_ms: int = TELEMETRY_FLUSH_INTERVAL_MS, batch_size: int = TELEMETRY_FLUSH_BATCH_SIZE):
+        self.max_queue = max(1, max_queue)
+        self.flush_interval = max(1, flush_interval_ms) / 1000
+        self.batch_size = max(1, batch_size)
+        self._queue: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.dropped = 0
+        self.written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.retried_cache_deletes = 0
+        self.lost_cache_deletes = 0
+        self.last_flush_ms = 0.0
+
+    # --- Producers (never block) ---
+    def _enqueue(self, kind: str, payload: Any):
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._queue.append((kind, payload))
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def record_cache_delete(self, row_id: int):
+        # Never dropped: losing one would re-serve the question after a restart. Payload: (row id, failed flushes)
+        self._queue.append(("cache_delete", (row_id, 0)))
+
+    def record_model_stats(self, model_name: str, success: bool, response_time: float):
+        self._enqueue("model_stats", (model_name, success, response_time))
+
+    def record_prompt_history(self, history_entry: Dict[str, Any]):
+        self._enqueue("prompt", history_entry)
+
+    def log_error(self, endpoint: str, error_details: Dict[str, Any]):
+        # Serialize now so later mutation of the caller's objects can't leak into the log
+        self._enqueue("error", database.make_error_entry(endpoint, error_details))
+
+    # --- Consumer ---
+    def _take_batch(self) -> List[Tuple[str, Any]]:
+        batch = []
+        while self._queue and len(batch) < self.batch_size:
+            batch.append(self._queue.popleft())
+        return batch
+
+    async def flush(self) -> int:
+        """Writes at most one batch. Returns the number of records taken off the queue."""
+        batch = self._take_batch()
+        if not batch:
+            return 0
+
+        model_stats: Dict[str, Dict[str, Any]] = {}
+        prompts: List[Dict[str, Any]] = []
+        errors: List[database.ErrorEntry] = []
+        cache_deletes: List[Tuple[int, int]] = []
+        for kind, payload in batch:
+            if kind == "model_stats":
+                model_name, success, response_time = payload
+                stats = model_stats.setdefault(model_name, {"generated_questions": 0, "errors": 0, "total_response_time": 0.0})
+                if success:
+                    stats["generated_questions"] += 1
+                    stats["total_response_time"] += response_time
+                else:
+                    stats["errors"] += 1
+            elif kind == "prompt":
+                prompts.append(payload)
+            elif kind == "error":
+                errors.append(payload)
+            elif kind == "cache_delete":
+                cache_deletes.append(payload)
+
+        start = time.perf_counter()
+        try:
+            await database.write_telemetry_batch(model_stats, prompts, errors, [row_id for row_id, _ in cache_deletes])
+            self.written += len(batch)
+        except Exception as e:
+            self.failed_flushes += 1
+            print(f"ERROR: Telemetry flush of {len(batch)} records failed. Reason: {e}")
+            self._retry_cache_deletes(cache_deletes)
+        self.flushes += 1
+        self.last_flush_ms = (time.perf_counter() - start) * 1000
+        return len(batch)
+
+    def _retry_cache_deletes(self, cache_deletes: List[Tuple[int, int]]):
+        """Puts the deletes of a failed flush back at the front of the queue, giving up on those out of attempts."""
+        retry = [(row_id, failures + 1) for row_id, failures in cache_deletes if failures + 1 < CACHE_DELETE_MAX_ATTEMPTS]
+        for payload in reversed(retry):
+            self._queue.appendleft(("cache_delete", payload))
+        self.retried_cache_deletes += len(retry)
+        lost = [row_id for row_id, failures in cache_deletes if failures + 1 >= CACHE_DELETE_MAX_ATTEMPTS]
+        if lost:
+            self.lost_cache_deletes += len(lost)
+            print(f"ERROR: Gave up deleting {len(lost)} served preloaded questions (ids {lost}); they can be served again after a restart.")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while await self.flush() >= self.batch_size:
+                pass
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+            print("Started telemetry writer")
+
+    async def stop(self):
+        """Stops the background task and drains everything still queued."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task:
+            try:
+                await self._task
+            except Exception as e:
+                print(f"Error stopping telemetry writer: {e}")
+            self._task = None
+        while await self.flush():
+            pass
+        print(f"Stopped telemetry writer ({self.written} records written, {self.dropped} dropped)")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": len(self._queue),
+            "max_queue": self.max_queue,
+            "dropped": self.dropped,
+            "written": self.written,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "retried_cache_deletes": self.retried_cache_deletes,
+            "lost_cache_deletes": self.lost_cache_deletes,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "running": self._task is not None and not self._task.done(),
+        }
+
+telemetry_writer = TelemetryWriter()
+
+def record_model_stats(model_name: str, success: bool, response_time: float):
+    telemetry_writer.record_model_stats(model_name, success, response_time)
+
+def record_prompt_history(history_entry: Dict[str, Any]):
+    telemetry_writer.record_prompt_history(history_entry)
+
+def log_error(endpoint: str, error_details: Dict[str, Any]):
+    telemetry_writer.log_error(endpoint, error_details)
@@ -0,0 +1,180 @@
+"""
+@file usage.py
+Token usage accounting per model, endpoint (prompt type) and game.
+
+Every model response's usage (prompt and completion tokens) is added to in-memory counters held per
+one-minute time bucket, keyed by (model, endpoint, game); questions served to players are counted per game
+the same way. Responses without a usage block (streamed responses, providers that omit it) are estimated at
+CHARS_PER_TOKEN and counted as estimated. A background task writes completed minutes to the token_usage and
+served_questions tables every METRICS_FLUSH_INTERVAL_SECONDS; window summaries merge the stored minutes
+with the ones still in memory.
+"""
+
+import time
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import database
+from .config import METRICS_FLUSH_INTERVAL_SECONDS
+
+USAGE_BUCKET_SECONDS = 60
+# Rough size of a token for estimates when the provider reports no usage
+CHARS_PER_TOKEN = 4
+# Prompt type of each call_generative_model endpoint
+PROMPT_TYPES = {
+    "generate_question": "question",
+    "live_quiz": "question",
+    "preload": "question",
+    "blueprints": "blueprint",
+    "generate_categories": "categories",
+    "category_mutation": "mutate",
+    "incorrect_explanation": "explain",
+}
+TOP_GAMES = 20
+
+# (bucket_start, model, endpoint, game_id) -> [calls, prompt_tokens, completion_tokens, estimated_calls]
+UsageKey = Tuple[int, str, str, str]
+
+def prompt_type(endpoint: str) -> str:
+    return PROMPT_TYPES.get(endpoint, endpoint)
+
+def response_tokens(response: Any, prompt: str, text: str) -> Tuple[int, int, bool]:
+    """(prompt_tokens, completion_tokens, estimated) for a completion; estimated when it carries no usage."""
+    usage = getattr(response, "usage", None) if response is not None else None
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if prompt_tokens is None or completion_tokens is None:
+        return len(prompt) // CHARS_PER_TOKEN, len(text or "") // CHARS_PER_TOKEN, True
+    return int(prompt_tokens), int(completion_tokens), False
+
+def _bucket(now: float) -> int:
+    return int(now) // USAGE_BUCKET_SECONDS * USAGE_BUCKET_SECONDS
+
+def _summary(calls: int, prompt_tokens: int, completion_tokens: int, estimated: int, served: Optional[int] = None) -> Dict[str, Any]:
+    summary = {
+        "calls": calls,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "estimated_calls": estimated,
+    }
+    if served is not None:
+        summary["served_questions"] = served
+        summary["tokens_per_served_question"] = round((prompt_tokens + completion_tokens) / served, 1) if served else None
+    return summary
+
+class TokenUsage:
+    def __init__(self, flush_interval_seconds: int = METRICS_FLUSH_INTERVAL_SECONDS):
+        self.flush_interval = max(1, flush_interval_seconds)
+        self._pending: Dict[UsageKey, List[int]] = {}
+        self._served: Dict[Tuple[int, str], int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.failed_flushes = 0
+
+    def record(self, model: str, endpoint: str, game_id: Optional[str], prompt_tokens: int, completion_tokens: int,
+               estimated: bool = False):
+        key = (_bucket(time.time()), model, endpoint, game_id or "")
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = self._pending[key] = [0, 0, 0, 0]
+        entry[0] += 1
+        entry[1] += prompt_tokens
+        entry[2] += completion_tokens
+        if estimated:
+            entry[3] += 1
+
+    def record_response(self, model: str, endpoint: str, game_id: Optional[str], response: Any, prompt: str, text: str):
+        self.record(model, endpoint, game_id, *response_tokens(response, prompt, text))
+
+    def record_served(self, game_id: Optional[str], questions: int = 1):
+        """A question handed to a player (generated, cached or from the archive)."""
+        key = (_bucket(time.time()), game_id or "")
+        self._served[key] = self._served.get(key, 0) + questions
+
+    async def flush(self, everything: bool = False) -> int:
+        """Writes finished minutes (or everything, on shutdown) to SQLite. Returns the number of rows written."""
+        now = time.time()
+        usage_keys = [key for key in self._pending if everything or key[0] + USAGE_BUCKET_SECONDS <= now]
+        served_keys = [key for key in self._served if everything or key[0] + USAGE_BUCKET_SECONDS <= now]
+        if not usage_keys and not served_keys:
+            return 0
+        usage_rows = [(*key, *self._pending.pop(key)) for key in usage_keys]
+        served_rows = [(*key, self._served.pop(key)) for key in served_keys]
+        try:
+            await database.write_usage_buckets(usage_rows, served_rows)
+        except Exception as e:
+            self.failed_flushes += 1
+            print(f"ERROR: Flushing {len(usage_rows) + len(served_rows)} token usage rows failed. Reason: {e}")
+        return len(usage_rows) + len(served_rows)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            print("Started token usage flush task")
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self._task = None
+        await self.flush(everything=True)
+
+    async def window_summary(self, window_seconds: int) -> Dict[str, Any]:
+        """Token totals and rates for the window, by model, prompt type, endpoint and (top) game."""
+        now = time.time()
+        # Minutes overlapping the window start are included whole
+        since = _bucket(now - window_seconds)
+        usage_rows, served_rows = await database.load_usage_buckets(since)
+        usage_rows += [(*key, *entry) for key, entry in self._pending.items() if key[0] >= since]
+        served_rows += [(*key, served) for key, served in self._served.items() if key[0] >= since]
+
+        groups: Dict[str, Dict[str, List[int]]] = {"model": {}, "prompt_type": {}, "endpoint": {}, "game": {}}
+        totals = [0, 0, 0, 0]
+        for _, model, endpoint, game_id, *counts in usage_rows:
+            for group, name in (("model", model), ("prompt_type", prompt_type(endpoint)), ("endpoint", endpoint), ("game", game_id)):
+                entry = groups[group].setdefault(name, [0, 0, 0, 0])
+                for i, value in enumerate(counts):
+                    entry[i] += value
+            for i, value in enumerate(counts):
+                totals[i] += value
+        served_by_game: Dict[str, int] = {}
+        for _, game_id, served in served_rows:
+            served_by_game[game_id] = served_by_game.get(game_id, 0) + served
+        served_total = sum(served_by_game.values())
+
+        span_seconds = max(now - since, 1)
+        question_tokens = groups["prompt_type"].get("question", [0, 0, 0, 0])
+        summary = _summary(*totals, served=served_total)
+        summary["tokens_per_second"] = round(summary["total_tokens"] / span_seconds, 3)
+        summary["question_tokens_per_served_question"] = (
+            round((question_tokens[1] + question_tokens[2]) / served_total, 1) if served_total else None
+        )
+        top_games = sorted(
+            (game for game in groups["game"].items() if game[0]),
+            key=lambda item: item[1][1] + item[1][2], reverse=True
+        )[:TOP_GAMES]
+        return {
+            "window_seconds": window_seconds,
+            "bucket_seconds": USAGE_BUCKET_SECONDS,
+            "totals": summary,
+            "by_model": {name: _summary(*counts) for name, counts in sorted(groups["model"].items())},
+            "by_prompt_type": {name: _summary(*counts) for name, counts in sorted(groups["prompt_type"].items())},
+            "by_endpoint": {name: _summary(*counts) for name, counts in sorted(groups["endpoint"].items())},
+            "top_games": [
+                {"game_id": game_id, **_summary(*counts, served=served_by_game.get(game_id, 0))}
+                for game_id, counts in top_games
+            ],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_rows": len(self._pending) + len(self._served),
+            "failed_flushes": self.failed_flushes,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+token_usage = TokenUsage()
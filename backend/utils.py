@@ -1,11 +1,11 @@
-import re
 import random
-import json
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, FrozenSet, List, Optional
 from collections import deque
 from fastapi import HTTPException
 
-from .config import ALLOWED_MODELS, PROMPTS, DEBUG_MODE
+from .config import ALLOWED_MODELS, DEBUG_MODE
+from .json_extract import extract_json, JsonTruncatedError
+from .prompts import prompt_registry
 from .state import CATEGORY_GENERATION_HISTORY, MAX_SUBCATEGORY_HISTORY, MAX_ENTITY_HISTORY, MAX_CATEGORIES_TRACKED
 
 def update_generation_history(category: str, subcategory: str, key_entities: List[str]):
@@ -60,6 +60,22 @@ def is_question_valid(data: Any, game_mode: str) -> (bool, str):
             return False, "MCQ mode: The provided 'answer' is not in the 'options' list."
     return True, "Validation successful."
 
+def are_categories_valid(data: Any) -> bool:
+    categories = data.get("categories") if isinstance(data, dict) else None
+    return isinstance(categories, list) and len(categories) >= 6 and all(isinstance(c, str) and c.strip() for c in categories)
+
+def are_mutation_choices_valid(data: Any) -> bool:
+    choices = data.get("choices") if isinstance(data, dict) else None
+    return isinstance(choices, list) and bool(choices) and all(isinstance(c, dict) and c.get("name") for c in choices)
+
+def is_explanation_valid(data: Any) -> bool:
+    if isinstance(data, str):
+        return bool(data.strip())
+    if not isinstance(data, dict) or data.get("verdict_for") not in ("player", "game"):
+        return False
+    explanation = data.get("explanation")
+    return isinstance(explanation, str) and bool(explanation.strip())
+
 def validate_model(model: str):
     # Allow any model when using dynamic models from API
     from .config import DYNAMIC_MODELS
@@ -76,127 +92,112 @@ def build_question_prompt(params: Dict[str, Any], category: str, blueprint: Opti
     Otherwise uses default generate_question prompt.
     """
     lang = params.get("language", "pl") # Default to PL if missing
-    
-    if blueprint:
-        # Use blueprint-specific prompt
-        prompt_struct = PROMPTS["generate_question_from_blueprint"][lang]
-    else:
-        prompt_struct = PROMPTS["generate_question"][lang]
-    
-    # Validate that the prompt structure has required fields
-    required_fields = ["persona", "static_instructions", "task_template"]
-    for field in required_fields:
-        if field not in prompt_struct:
-            raise ValueError(f"Missing required field '{field}' in prompt structure for language '{lang}'")
-
-    history = CATEGORY_GENERATION_HISTORY.get(category, {})
-    
-    subcategory_history = list(history.get("subcategories", []))
-    entity_history = list(history.get("entities", []))
-
-    subcategory_history_prompt = ', '.join(f'"{item}"' for item in subcategory_history) if subcategory_history else "Brak historii / No history."
-    entity_history_prompt = ', '.join(f'"{item}"' for item in entity_history) if entity_history else "Brak historii / No history."
-
-    knowledge_key = params.get("knowledgeLevel", "basic")
-    game_mode_key = params.get("gameMode", "mcq")
-    
-    knowledge_prompt = PROMPTS["knowledge_prompts"][knowledge_key][lang]
-    game_mode_prompt = PROMPTS["game_mode_prompts"][game_mode_key][lang]
-    
-    theme_context = params.get("theme", "General knowledge")
-    if params.get("includeCategoryTheme") and theme_context:
-         theme_text = f"Temat: {theme_context}" if lang == 'pl' else f"Theme: {theme_context}"
-    else:
-         theme_text = "Brak dodatkowego motywu" if lang == 'pl' else "No additional theme"
-
-    print(f"🔍 LIVE-QUIZ DEBUG: Generating question for category '{category}'")
+    template = prompt_registry.get("generate_question_from_blueprint" if blueprint else "generate_question", lang)
+    if DEBUG_MODE:
+        print(f"Generating question prompt for category '{category}'")
+        if blueprint:
+            print(f"Using blueprint: {blueprint.get('subcategory')} -> {blueprint.get('target_answer')}")
+    return template.render(**_question_prompt_values(template.fields, params, category, blueprint))
+
+def _question_prompt_values(fields: FrozenSet[str], params: Dict[str, Any], category: str,
+                            blueprint: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """The per-request values for a question template; only the placeholders it uses (`fields`) are computed."""
+    lang = params.get("language", "pl")
+    knowledge_prompt = prompt_registry.knowledge_prompt(params.get("knowledgeLevel", "basic"), lang)
+    game_mode_prompt = prompt_registry.game_mode_prompt(params.get("gameMode", "mcq"), lang)
+    values = {
+        "category": category,
+        "subcategory_suggestion": "",
+        "knowledge_prompt": knowledge_prompt,
+        "knowledge_level": knowledge_prompt,
+        "game_mode_prompt": game_mode_prompt,
+        "game_mode": game_mode_prompt,
+    }
+    if "theme_context" in fields:
+        theme_context = params.get("theme", "General knowledge")
+        if params.get("includeCategoryTheme") and theme_context:
+            values["theme_context"] = f"Temat: {theme_context}" if lang == 'pl' else f"Theme: {theme_context}"
+        else:
+            values["theme_context"] = "Brak dodatkowego motywu" if lang == 'pl' else "No additional theme"
+    if "subcategory_history_prompt" in fields or "entity_history_prompt" in fields:
+        history = CATEGORY_GENERATION_HISTORY.get(category, {})
+        subcategory_history = history.get("subcategories")
+        entity_history = history.get("entities")
+        values["subcategory_history_prompt"] = ', '.join(f'"{item}"' for item in subcategory_history) if subcategory_history else "Brak historii / No history."
+        values["entity_history_prompt"] = ', '.join(f'"{item}"' for item in entity_history) if entity_history else "Brak historii / No history."
     if blueprint:
-        print(f"🔧 Using blueprint: {blueprint.get('subcategory')} -> {blueprint.get('target_answer')}")
-    print("-" * 80)
-    
-    static_part = [
-        prompt_struct["persona"],
-        "\n".join(prompt_struct["static_instructions"])
-    ]
-    static_content = "\n\n".join(static_part)
+        values["subcategory"] = blueprint.get("subcategory", "")
+        values["modifier"] = blueprint.get("modifier") or ""
+        values["target_answer"] = blueprint.get("target_answer", "")
+    return values
 
-    if blueprint:
-        # Format blueprint-specific template
-        dynamic_content = prompt_struct["task_template"].format(
-            category=category,
-            subcategory=blueprint.get("subcategory", ""),
-            modifier=blueprint.get("modifier", ""),
-            target_answer=blueprint.get("target_answer", ""),
-            knowledge_prompt=knowledge_prompt,
-            game_mode_prompt=game_mode_prompt,
-            theme_context=theme_text,
-            subcategory_history_prompt=subcategory_history_prompt,
-            entity_history_prompt=entity_history_prompt
-        )
+def build_question_batch_prompt(params: Dict[str, Any], category: str, count: int,
+                                blueprints: Optional[List[Dict[str, Any]]] = None) -> str:
+    """
+    Build one prompt asking for several questions: the persona and static instructions are sent once,
+    followed by one task per blueprint (or the regular task for `count` free questions) and the batch format.
+    """
+    lang = params.get("language", "pl")
+    if not blueprints:
+        template = prompt_registry.get("generate_question", lang)
+        base_prompt = template.render(**_question_prompt_values(template.fields, params, category))
     else:
-        # Default template (legacy)
-        dynamic_content = prompt_struct["task_template"].format(
-            category=category,
-            subcategory_suggestion="",
-            knowledge_prompt=knowledge_prompt,
-            game_mode_prompt=game_mode_prompt,
-            theme_context=theme_text,
-            subcategory_history_prompt=subcategory_history_prompt,
-            entity_history_prompt=entity_history_prompt
-        )
-
-    full_prompt = f"{static_content}\n\n{dynamic_content}"
-
-    return full_prompt
+        count = len(blueprints)
+        template = prompt_registry.get("generate_question_from_blueprint", lang)
+        header = prompt_registry.blueprint_headers[lang]
+        tasks = [
+            header.format(index=index) + "\n" + template.render_task(**_question_prompt_values(template.fields, params, category, blueprint))
+            for index, blueprint in enumerate(blueprints, start=1)
+        ]
+        base_prompt = template.prefix + "\n\n" + "\n\n".join(tasks)
+    batch_instructions = prompt_registry.batch_instructions[lang].format(count=count)
+    return f"{base_prompt}\n\n{batch_instructions}"
+
+def extract_question_batch(data: Any) -> List[Any]:
+    """Returns the list of question items from a batch response ({"questions": [...]}, a bare list or a single question)."""
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        questions = data.get("questions")
+        if isinstance(questions, list):
+            return questions
+        if "question" in data:
+            return [data]
+    return []
 
 def extract_json_from_response(text: str) -> Any:
+    """The JSON value in a model response (see json_extract.py), or an {"error": ...} dict when there is none."""
     if not text or not isinstance(text, str):
         return {"error": "Input text is empty or invalid."}
-
-    cleaned_text = text.strip()
-    cleaned_text = re.sub(r'```(?:json)?', '', cleaned_text)
-    cleaned_text = cleaned_text.lstrip('`').rstrip('`')
-
     try:
-        return json.loads(cleaned_text)
-    except (json.JSONDecodeError, ValueError):
-        pass
-
-    json_match_md = re.search(r'{[\s\S]*?}', cleaned_text, re.DOTALL)
-    if json_match_md:
-        json_str = json_match_md.group().strip()
-        try:
-            return json.loads(json_str)
-        except (json.JSONDecodeError, ValueError):
-            pass
-
-    first_brace_index = cleaned_text.find('{')
-    if first_brace_index != -1:
-        candidate = cleaned_text[first_brace_index:]
-        brace_count = 0
-        for i, char in enumerate(candidate):
-            if char == '{':
-                brace_count += 1
-            elif char == '}':
-                brace_count -= 1
-            if brace_count == 0:
-                json_str = candidate[:i+1].strip()
-                try:
-                    return json.loads(json_str)
-                except (json.JSONDecodeError, ValueError):
-                    break
-
-    error_msg = f"ERROR: JSON parsing failed after all attempts. Raw snippet: {text[:200]}..."
-    print(error_msg)
-    from . import database
+        return extract_json(text)
+    except JsonTruncatedError:
+        print(f"ERROR: Response was cut off before its JSON value ended. Raw snippet: {text[-200:]}...")
+        return {"error": "Response was cut off before the JSON value was complete."}
+    except ValueError:
+        print(f"ERROR: JSON parsing failed. Raw snippet: {text[:200]}...")
+        return {"error": "Unable to parse JSON from response. Check model output format."}
+
+def extract_question_batch_from_response(text: str) -> Any:
+    """
+    Like extract_json_from_response, but a batch that was cut off keeps its complete questions: the value is
+    repaired and its last item, which may be missing fields, is dropped.
+    """
+    if not text or not isinstance(text, str):
+        return extract_json_from_response(text)
     try:
-        # database.log_error_db is now async, but this is a sync function.
-        # We'll skip logging here or use a background task if needed.
-        # For now, just print.
-        print(f"JSON parsing failed: {text[:200]}")
-    except:
-        pass  # Don't fail if database logging fails
-    return {"error": "Unable to parse JSON from response. Check model output format."}
+        data = extract_json(text)
+    except JsonTruncatedError:
+        try:
+            data = extract_json(text, repair=True)
+        except ValueError:
+            return extract_json_from_response(text)
+        items = extract_question_batch(data)[:-1]
+        print(f"WARNING: Batch response was cut off; keeping its {len(items)} complete question(s).")
+        return {"questions": items}
+    except ValueError:
+        return extract_json_from_response(text)
+    return data
 
 def format_explanation_part(part: Any) -> str:
     if isinstance(part, str): return part
@@ -206,12 +207,4 @@ def format_explanation_part(part: Any) -> str:
 
 def build_categories_prompt(language: str, theme: str) -> str:
     """Build a prompt for generating categories, similar to build_question_prompt but for categories."""
-    prompt_struct = PROMPTS["generate_categories"][language]
-    
-    # Combine static instructions and task template
-    static_instructions = "\n".join(prompt_struct["static_instructions"])
-    task_template = prompt_struct["task_template"].format(theme=theme)
-    
-    full_prompt = f"{static_instructions}\n\n{task_template}"
-    
-    return full_prompt
\ No newline at end of file
+    return prompt_registry.get("generate_categories", language).render(theme=theme)
\ No newline at end of file
@@ -0,0 +1,191 @@
+"""
+@file warm_pool.py
+Per-game warm pool: keeps ready questions in the preload cache for every category on a game's board.
+
+The client sends the game's plan (POST /api/preload-plan) whenever the board changes hands: the board
+categories, the chance of landing on each one in the next turns, and the language, level and mode. Every board
+category gets WARM_POOL_TARGET ready questions, the ones with a chance of at least WARM_POOL_LIKELY_PROBABILITY
+get WARM_POOL_LIKELY_TARGET. One runner task per game tops the pool up: it fills the categories furthest below
+their target, likeliest first, several at a time. Each fill is one preload_category call (a batch of
+PRELOAD_BATCH_SIZE questions) run through preload_flights, so games sharing a cache key share the generation,
+and it holds a slot of the global preload semaphore (MAX_CONCURRENT_PRELOAD_TASKS) only while generating.
+A new plan replaces the old one and the running runner picks it up; serving a question from the cache starts
+the runner again, so the pool stays topped up while the game goes on. A fill that fails is not retried until
+the next plan or served question.
+"""
+
+import time
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import (WARM_POOL_TARGET, WARM_POOL_LIKELY_TARGET, WARM_POOL_LIKELY_PROBABILITY, WARM_POOL_PLAN_TTL_SECONDS,
+                     MAX_PRELOAD_CATEGORIES, MAX_CONCURRENT_PRELOAD_TASKS, DEBUG_MODE)
+from .question_cache import question_cache, make_cache_key, CacheKey
+from .singleflight import preload_flights
+from .preload import preload_category, preload_slot
+
+class WarmPool:
+    def __init__(self, target: int = WARM_POOL_TARGET, likely_target: int = WARM_POOL_LIKELY_TARGET,
+                 likely_probability: float = WARM_POOL_LIKELY_PROBABILITY, plan_ttl: float = WARM_POOL_PLAN_TTL_SECONDS,
+                 max_categories: int = MAX_PRELOAD_CATEGORIES, fills_per_game: int = MAX_CONCURRENT_PRELOAD_TASKS):
+        self.target = target
+        self.likely_target = likely_target
+        self.likely_probability = likely_probability
+        self.plan_ttl = plan_ttl
+        self.max_categories = max_categories
+        self.fills_per_game = max(1, fills_per_game)
+        # gameId -> {"model", "params", "targets": [{"category", "probability", "target"}], "updated"}
+        self._plans: Dict[str, Dict[str, Any]] = {}
+        self._runners: Dict[str, asyncio.Task] = {}
+        self.plans_received = 0
+        self.fills = 0
+        self.filled = 0
+        self.failed = 0
+        self.skipped = 0
+        self.expired = 0
+
+    def _targets(self, categories: List[str], upcoming: Dict[str, float]) -> List[Dict[str, Any]]:
+        """Board categories (deduplicated, at most max_categories) with their target, likeliest first."""
+        targets: List[Dict[str, Any]] = []
+        seen = set()
+        for category in categories:
+            category = category.strip()
+            if not category or category in seen:
+                continue
+            seen.add(category)
+            probability = min(1.0, max(0.0, float(upcoming.get(category, 0.0))))
+            target = self.likely_target if probability >= self.likely_probability else self.target
+            targets.append({"category": category, "probability": probability, "target": target})
+        # Stable sort: board order breaks ties, and the likeliest categories survive the cap
+        targets.sort(key=lambda t: -t["probability"])
+        return targets[:self.max_categories]
+
+    def plan(self, game_id: str, model_selection: str, params: Dict[str, Any], categories: List[str],
+             upcoming: Dict[str, float]) -> Dict[str, Any]:
+        """Replaces the game's plan and starts topping its pool up. Returns the plan's status."""
+        self._expire()
+        self._plans[game_id] = {"model": model_selection, "params": params, "targets": self._targets(categories, upcoming),
+                                "updated": time.monotonic()}
+        self.plans_received += 1
+        self.refill(game_id)
+        return self.status(game_id)
+
+    def add_category(self, game_id: str, model_selection: str, params: Dict[str, Any], category: str) -> Dict[str, Any]:
+        """
+        Adds one category as the next landing to the game's plan (from the one-category /api/preload-questions).
+        A plan with other settings (language, level, mode, theme) is replaced.
+        """
+        current = self._plans.get(game_id)
+        categories, upcoming = [category], {category: 1.0}
+        if current is not None and make_cache_key(category, current["params"]) == make_cache_key(category, params):
+            categories = [t["category"] for t in current["targets"]] + [category]
+            upcoming = {**{t["category"]: t["probability"] for t in current["targets"]}, category: 1.0}
+        return self.plan(game_id, model_selection, params, categories, upcoming)
+
+    def refill(self, game_id: str):
+        """Starts the game's runner unless it is running already (no-op for games without a plan)."""
+        if game_id not in self._plans:
+            return
+        runner = self._runners.get(game_id)
+        if runner is None or runner.done():
+            self._runners[game_id] = asyncio.ensure_future(self._run(game_id))
+
+    def shortfalls(self, game_id: str) -> List[Tuple[Dict[str, Any], CacheKey, int]]:
+        """(target, cache key, questions missing) for the plan's categories below their target, in fill order."""
+        plan = self._plans.get(game_id)
+        if plan is None:
+            return []
+        missing = []
+        for target in plan["targets"]:
+            key = make_cache_key(target["category"], plan["params"])
+            short = target["target"] - question_cache.count(key)
+            if short > 0:
+                missing.append((target, key, short))
+        # Likeliest first, then the emptiest
+        missing.sort(key=lambda m: (-m[0]["probability"], -m[2]))
+        return missing
+
+    async def _run(self, game_id: str):
+        fills: Dict[asyncio.Task, CacheKey] = {}
+        failed = set()
+        try:
+            while True:
+                # The plan is read again every round, so a replaced plan takes effect for the next fills
+                plan = self._plans.get(game_id)
+                for target, key, _ in self.shortfalls(game_id):
+                    if len(fills) >= self.fills_per_game:
+                        break
+                    if key in failed or key in fills.values():
+                        continue
+                    fills[asyncio.ensure_future(self._fill(game_id, plan, target, key))] = key
+                if not fills:
+                    return
+                done, _ = await asyncio.wait(fills, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    key = fills.pop(task)
+                    if task.cancelled() or task.exception() is not None or not task.result():
+                        failed.add(key)
+        finally:
+            for task in fills:
+                task.cancel()
+            if self._runners.get(game_id) is asyncio.current_task():
+                del self._runners[game_id]
+
+    async def _fill(self, game_id: str, plan: Dict[str, Any], target: Dict[str, Any], key: CacheKey) -> bool:
+        async def generate() -> bool:
+            async with preload_slot():
+                # Another game may have topped the key up while this fill queued for a slot
+                if question_cache.count(key) >= target["target"]:
+                    self.skipped += 1
+                    return True
+                self.fills += 1
+                if DEBUG_MODE:
+                    print(f"[{game_id}] Warm pool filling '{target['category']}' (chance {target['probability']:.2f})")
+                ok = await preload_category(game_id, plan["model"], plan["params"], target["category"])
+                if ok:
+                    self.filled += 1
+                else:
+                    self.failed += 1
+                return ok
+
+        # Games filling the same key at the same time share one generation
+        return await preload_flights.do(key, generate)
+
+    def status(self, game_id: str) -> Optional[Dict[str, Any]]:
+        plan = self._plans.get(game_id)
+        if plan is None:
+            return None
+        categories = []
+        for target in plan["targets"]:
+            key = make_cache_key(target["category"], plan["params"])
+            categories.append({**target, "ready": question_cache.count(key), "filling": preload_flights.pending(key) is not None})
+        return {"gameId": game_id, "categories": categories,
+                "missing": sum(max(0, c["target"] - c["ready"]) for c in categories)}
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.plan_ttl
+        for game_id in [g for g, plan in self._plans.items() if plan["updated"] < cutoff]:
+            del self._plans[game_id]
+            self.expired += 1
+
+    def stop(self):
+        for runner in self._runners.values():
+            runner.cancel()
+        self._runners.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "games": len(self._plans),
+            "running": sum(not runner.done() for runner in self._runners.values()),
+            "missing": sum(m[2] for game_id in self._plans for m in self.shortfalls(game_id)),
+            "plans_received": self.plans_received,
+            "fills": self.fills,
+            "filled": self.filled,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "expired_plans": self.expired,
+            "target": self.target,
+            "likely_target": self.likely_target,
+        }
+
+warm_pool = WarmPool()
@@ -0,0 +1,132 @@
+"""
+@file db_pool_benchmark.py
+Before/after benchmark for the SQLite access layer.
+
+Replays the database work of one /api/generate-question request (cache pop, blueprint count,
+blueprint claim, model stats, prompt history, question insert) many times concurrently:
+- "before": a fresh aiosqlite connection per helper call (the original get_db_connection() pattern)
+- "after": the pooled reader/writer connections from backend/database.py, with the cache pop served from the
+  in-memory question_cache and its row deleted by the telemetry writer (drained before the clock stops)
+
+Usage:
+    python -m benchmarks.db_pool_benchmark [--requests 500] [--concurrency 8]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+
+import aiosqlite
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("OPENAI_API_BASE", "http://localhost:1")
+
+from backend import database  # noqa: E402
+from backend.question_cache import question_cache  # noqa: E402
+from backend.telemetry import telemetry_writer  # noqa: E402
+
+CATEGORY = "Historia"
+CACHE_KEY = (CATEGORY, "pl", "basic", "mcq", "")
+QUESTION = {"question": "Benchmark question?", "answer": "A", "options": ["A", "B", "C", "D"], "explanation": "x" * 400}
+PROMPT = "p" * 4000
+
+# --- "before": one connection per helper call ---
+async def legacy_request(path: str, i: int):
+    async with aiosqlite.connect(path, timeout=10) as conn:
+        async with conn.execute("SELECT id, question_data_json FROM preloaded_questions_cache WHERE category = ? AND language = ? AND knowledge_level = ? AND game_mode = ? AND theme = ? ORDER BY id LIMIT 1", CACHE_KEY) as cursor:
+            row = await cursor.fetchone()
+        if row:
+            await conn.execute("DELETE FROM preloaded_questions_cache WHERE id = ?", (row[0],))
+            await conn.commit()
+    async with aiosqlite.connect(path, timeout=10) as conn:
+        async with conn.execute("SELECT COUNT(*) FROM question_blueprints WHERE category = ? AND is_used = 0", (CATEGORY,)) as cursor:
+            await cursor.fetchone()
+    async with aiosqlite.connect(path, timeout=10) as conn:
+        async with conn.execute("SELECT id FROM question_blueprints WHERE category = ? AND is_used = 0 ORDER BY RANDOM() LIMIT 1", (CATEGORY,)) as cursor:
+            row = await cursor.fetchone()
+        if row:
+            await conn.execute("UPDATE question_blueprints SET is_used = 1 WHERE id = ?", (row[0],))
+            await conn.commit()
+    async with aiosqlite.connect(path, timeout=10) as conn:
+        await conn.execute("""
+            INSERT INTO model_stats (model_name, generated_questions, total_response_time) VALUES (?, 1, ?)
+            ON CONFLICT(model_name) DO UPDATE SET generated_questions = generated_questions + 1,
+                total_response_time = total_response_time + excluded.total_response_time
+        """, ("trivia", 1.0))
+        await conn.commit()
+    async with aiosqlite.connect(path, timeout=10) as conn:
+        # The original insert-count-trim sequence (ids are given explicitly now that the table is a ring)
+        await conn.execute("INSERT INTO prompt_history (id, timestamp, model, prompt, raw_response) VALUES (?, ?, ?, ?, ?)", (1_000_000 + i, "now", "trivia", PROMPT, json.dumps(QUESTION)))
+        async with conn.execute("SELECT COUNT(*) FROM prompt_history") as cursor:
+            count = (await cursor.fetchone())[0]
+        if count > 50:
+            await conn.execute("DELETE FROM prompt_history WHERE id IN (SELECT id FROM prompt_history ORDER BY id ASC LIMIT ?)", (count - 50,))
+        await conn.commit()
+    async with aiosqlite.connect(path, timeout=10) as conn:
+        try:
+            await conn.execute("""
+                INSERT INTO generated_questions (model, language, category, knowledge_level, game_mode, question_text, answer_text)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, ("trivia", "pl", CATEGORY, "basic", "mcq", f"legacy question {i}", "A"))
+            await conn.commit()
+        except aiosqlite.IntegrityError:
+            pass
+
+# --- "after": pooled helpers ---
+async def pooled_request(i: int):
+    question_cache.pop(CACHE_KEY)
+    await database.get_blueprint_count(CATEGORY)
+    await database.get_unused_blueprint(CATEGORY)
+    await database.update_model_stats_db("trivia", True, 1.0)
+    await database.add_prompt_history_db({"timestamp": "now", "model": "trivia", "prompt": PROMPT, "raw_response": json.dumps(QUESTION)})
+    await database.add_question({**QUESTION, "question": f"pooled question {i}"}, {"model": "trivia", "language": "pl", "category": CATEGORY, "knowledgeLevel": "basic", "gameMode": "mcq"})
+
+async def seed(requests: int):
+    await database.save_blueprints_batch(CATEGORY, [{"subcategory": "s", "modifier": "", "target_answer": f"t{i}"} for i in range(requests * 2)])
+    for _ in range(requests):
+        await database.cache_question(CACHE_KEY, QUESTION)
+
+async def run(label: str, make_request, requests: int, concurrency: int, finish=None) -> float:
+    sem = asyncio.Semaphore(concurrency)
+    async def one(i):
+        async with sem:
+            await make_request(i)
+    # The helpers log every saved question; keep the report readable
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        if finish is not None:
+            await finish()
+        elapsed = time.perf_counter() - start
+    print(f"{label:<8} {requests} requests in {elapsed:.2f}s -> {requests / elapsed:8.1f} req/s ({elapsed / requests * 1000:.2f} ms/request)")
+    return elapsed
+
+async def main(requests: int, concurrency: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        database.DATABASE_FILE = path
+        await database.init_db()
+        await seed(requests)
+        await database.close_db()
+        before = await run("before", lambda i: legacy_request(path, i), requests, concurrency)
+
+        await database.init_db()
+        await seed(requests)
+        await question_cache.load()
+        telemetry_writer.start()
+        after = await run("after", pooled_request, requests, concurrency, finish=telemetry_writer.stop)
+        await database.close_db()
+        print(f"speedup: {before / after:.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
@@ -0,0 +1,218 @@
+"""
+@file json_extract_benchmark.py
+Before/after benchmark for extracting JSON from model responses, on real raw responses.
+
+The corpus is the raw_response column of prompt_history in --db (default: $DATABASE_FILE); without one, or
+when it is empty, a synthetic corpus shaped like the app's responses (questions, batches, blueprints,
+explanations) is used. Each response is run as-is ("raw") and in three derived forms the app also receives:
+wrapped in a ```json fence with a line of prose ("fenced"), with a trailing comma before the last closing
+brace ("trailing comma") and cut off at 60% of its length ("truncated").
+- "before": the three-stage extractor utils.extract_json_from_response used to be (fence regex + json.loads,
+  non-greedy {...} regex, per-character brace count), copied below
+- "after": json_extract.extract_json, with repair=True for "truncated" (what batch salvage uses; the default
+  rejects a cut-off value)
+For every group it reports how many responses each version could parse, whether they agree where both do,
+and the time per response. A "stream" group compares decoding the explanation field after every 24-character
+delta: re-decoding the whole text each time (the old extract_partial_json_string) vs feeding JsonScanner.
+
+Usage:
+    python -m benchmarks.json_extract_benchmark [--db /app/data/questions.db] [--limit 2000] [--repeat 20]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import functools
+import contextlib
+from typing import Any, Callable, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("OPENAI_API_BASE", "http://localhost:1")
+
+from backend.json_extract import JsonScanner, extract_json  # noqa: E402
+
+STREAM_CHUNK_CHARS = 24
+FAILED = object()
+
+# --- "before": the extractor as it was ---
+def legacy_extract(text: str) -> Any:
+    cleaned_text = text.strip()
+    cleaned_text = re.sub(r'```(?:json)?', '', cleaned_text)
+    cleaned_text = cleaned_text.lstrip('`').rstrip('`')
+    try:
+        return json.loads(cleaned_text)
+    except (json.JSONDecodeError, ValueError):
+        pass
+    json_match_md = re.search(r'{[\s\S]*?}', cleaned_text, re.DOTALL)
+    if json_match_md:
+        try:
+            return json.loads(json_match_md.group().strip())
+        except (json.JSONDecodeError, ValueError):
+            pass
+    first_brace_index = cleaned_text.find('{')
+    if first_brace_index != -1:
+        candidate = cleaned_text[first_brace_index:]
+        brace_count = 0
+        for i, char in enumerate(candidate):
+            if char == '{':
+                brace_count += 1
+            elif char == '}':
+                brace_count -= 1
+            if brace_count == 0:
+                try:
+                    return json.loads(candidate[:i + 1].strip())
+                except (json.JSONDecodeError, ValueError):
+                    break
+    print(f"ERROR: JSON parsing failed after all attempts. Raw snippet: {text[:200]}...")
+    return FAILED
+
+_JSON_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f'}
+
+def legacy_partial_string(text: str, field: str) -> Optional[str]:
+    match = re.search(r'"%s"\s*:\s*"' % re.escape(field), text)
+    if not match:
+        return None
+    out = []
+    i, n = match.end(), len(text)
+    while i < n:
+        c = text[i]
+        if c == '"':
+            break
+        if c != '\\':
+            out.append(c)
+            i += 1
+            continue
+        if i + 1 >= n:
+            break
+        escape = text[i + 1]
+        if escape == 'u':
+            if i + 6 > n:
+                break
+            try:
+                out.append(chr(int(text[i + 2:i + 6], 16)))
+            except ValueError:
+                break
+            i += 6
+            continue
+        out.append(_JSON_ESCAPES.get(escape, escape))
+        i += 2
+    return "".join(out)
+
+# --- "after" ---
+def new_extract(text: str, repair: bool = False) -> Any:
+    try:
+        return extract_json(text, repair=repair)
+    except ValueError:
+        return FAILED
+
+def legacy_stream(text: str) -> Optional[str]:
+    received, explanation = "", None
+    for i in range(0, len(text), STREAM_CHUNK_CHARS):
+        received += text[i:i + STREAM_CHUNK_CHARS]
+        explanation = legacy_partial_string(received, "explanation")
+    return explanation
+
+def scanner_stream(text: str) -> Optional[str]:
+    scanner, explanation = JsonScanner(), None
+    for i in range(0, len(text), STREAM_CHUNK_CHARS):
+        scanner.feed(text[i:i + STREAM_CHUNK_CHARS])
+        explanation = scanner.string_field("explanation")
+    return explanation
+
+# --- corpus ---
+def load_prompt_history(db_path: str, limit: int) -> List[str]:
+    if not db_path or not os.path.exists(db_path):
+        return []
+    with contextlib.closing(sqlite3.connect(db_path)) as conn:
+        try:
+            rows = conn.execute("SELECT raw_response FROM prompt_history ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Could not read prompt_history from {db_path}: {e}")
+            return []
+    return [row[0] for row in rows if row[0]]
+
+def synthetic_corpus(count: int) -> List[str]:
+    rng = random.Random(1)
+
+    def question(n: int) -> dict:
+        options = [f"Odpowiedź {n}-{letter} {{wariant}}" for letter in "ABCD"]
+        return {
+            "question": f"Pytanie numer {n}: które z \"poniższych\" jest prawdą?\nWybierz jedną odpowiedź.",
+            "options": options, "answer": options[n % 4],
+            "explanation_correct": "Wyjaśnienie, z nawiasami [1] i {klamrami}, " * rng.randint(1, 4),
+            "explanation_distractors": "Pozostałe odpowiedzi są błędne.", "subcategory": f"Podkategoria {n % 7}",
+            "key_entities": [f"Encja {n}", f"Encja {n + 1}"],
+        }
+
+    shapes: List[Callable[[int], Any]] = [
+        question,
+        lambda n: {"questions": [question(n * 10 + i) for i in range(rng.randint(2, 8))]},
+        lambda n: {"topics": [{"subcategory": f"Temat {i}", "modifier": "Data", "target_answer": str(1000 + i)} for i in range(20)]},
+        lambda n: {"verdict_for": "game", "verdict_certainty": 85, "explanation": "Odpowiedź gracza jest \"prawie\" dobra, ale " * 8},
+        lambda n: {"categories": [f"Kategoria {i}" for i in range(6)]},
+    ]
+    return [json.dumps(shapes[n % len(shapes)](n), ensure_ascii=n % 2 == 0, indent=2 if n % 3 == 0 else None)
+            for n in range(count)]
+
+def variants(corpus: List[str]) -> List[Tuple[str, List[str]]]:
+    def trailing_comma(text: str) -> str:
+        end = text.rfind("}")
+        return text[:end].rstrip() + ",\n" + text[end:] if end > 0 else text
+
+    return [
+        ("raw", corpus),
+        ("fenced", [f"Oto odpowiedź:\n```json\n{text}\n```" for text in corpus]),
+        ("trailing comma", [trailing_comma(text) for text in corpus]),
+        ("truncated", [text[:len(text) * 6 // 10] for text in corpus]),
+    ]
+
+def time_per_item(fn: Callable[[str], Any], texts: List[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            fn(text)
+    return (time.perf_counter() - start) / (repeat * len(texts))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=os.getenv("DATABASE_FILE", ""))
+    parser.add_argument("--limit", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    corpus = load_prompt_history(args.db, args.limit)
+    source = f"{len(corpus)} responses from prompt_history in {args.db}"
+    if not corpus:
+        corpus = synthetic_corpus(200)
+        source = f"{len(corpus)} synthetic responses (no prompt_history rows found)"
+    print(f"Corpus: {source}, {sum(map(len, corpus)) / len(corpus):.0f} characters on average")
+    print(f"{'group':>16} {'before ok':>10} {'after ok':>9} {'disagree':>9} {'before us':>10} {'after us':>9} {'speedup':>8}")
+
+    with open(os.devnull, "w", buffering=1) as devnull:
+        for name, texts in variants(corpus):
+            with contextlib.redirect_stdout(devnull):
+                before = [legacy_extract(text) for text in texts]
+                before_us = time_per_item(legacy_extract, texts, args.repeat) * 1e6
+            extract = functools.partial(new_extract, repair=name == "truncated")
+            after = [extract(text) for text in texts]
+            after_us = time_per_item(extract, texts, args.repeat) * 1e6
+            before_ok = sum(result is not FAILED for result in before)
+            after_ok = sum(result is not FAILED for result in after)
+            disagree = sum(b is not FAILED and a is not FAILED and a != b for b, a in zip(before, after))
+            print(f"{name:>16} {before_ok:>10} {after_ok:>9} {disagree:>9} {before_us:>10.1f} {after_us:>9.1f} {before_us / after_us:>7.1f}x")
+
+    streamed = [text for text in corpus if '"explanation"' in text]
+    if streamed:
+        mismatches = sum(legacy_stream(text) != scanner_stream(text) for text in streamed)
+        before_us = time_per_item(legacy_stream, streamed, args.repeat) * 1e6
+        after_us = time_per_item(scanner_stream, streamed, args.repeat) * 1e6
+        print(f"{'stream':>16} {len(streamed):>10} {len(streamed) - mismatches:>9} {mismatches:>9} {before_us:>10.1f} {after_us:>9.1f} {before_us / after_us:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
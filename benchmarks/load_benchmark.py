@@ -0,0 +1,226 @@
+"""
+@file load_benchmark.py
+End-to-end load generator for the question routes, run against the app pointed at the stub provider.
+
+Replays a weighted mix of traffic against a running server:
+- question: POST /api/generate-question for a random category
+- preload: POST /api/preload-plan for a board of six random categories, with random landing odds (a fresh gameId each time)
+- live: a live quiz host creating a room, starting the game and moving through --live-questions questions
+Requests run closed-loop from --concurrency workers, or open-loop at --rate arrivals per second (Poisson) with
+at most --concurrency in flight; arrivals beyond that are counted as dropped. After the run it reports
+throughput, p50/p95/p99 latency and errors per route, and, from the stub's /stub/stats, the provider calls
+made during the run per served question (questions returned by /api/generate-question or started in a live quiz).
+
+Usage:
+    python -m benchmarks.stub_openai_server --latency lognormal:800,0.4
+    OPENAI_API_KEY=stub OPENAI_API_BASE=http://127.0.0.1:8081/v1 DATABASE_FILE=/tmp/loadtest.db \\
+        uvicorn backend.server:app --port 8000
+    python -m benchmarks.load_benchmark [--base-url http://127.0.0.1:8000] [--stub-url http://127.0.0.1:8081]
+        [--duration 60] [--concurrency 16] [--rate 0] [--mix question=6,preload=3,live=1]
+        [--live-questions 6] [--language pl] [--settle 5] [--json results.json]
+"""
+
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+CATEGORIES = ["Historia", "Geografia", "Nauka", "Sport", "Muzyka", "Film", "Literatura", "Sztuka", "Technologia",
+              "Przyroda", "Kuchnia", "Mitologia"]
+SCENARIOS = ("question", "preload", "live")
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario '{name}' (expected one of {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("The mix needs at least one scenario with a positive weight")
+    return mix
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.served_questions = 0
+        self.dropped = 0
+
+    async def request(self, client: httpx.AsyncClient, route: str, method: str, path: str,
+                      payload: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, json=payload)
+            ok = response.status_code < 400
+            body = response.json() if ok and response.content else None
+        except (httpx.HTTPError, ValueError):
+            ok, body = False, None
+        self.latencies.setdefault(route, []).append(time.perf_counter() - started)
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+        return body if ok else None
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        routes = {}
+        for route, latencies in sorted(self.latencies.items()):
+            ordered = sorted(latencies)
+            routes[route] = {
+                "requests": len(ordered),
+                "errors": self.errors.get(route, 0),
+                "rps": round(len(ordered) / elapsed, 2),
+                "p50_ms": round(percentile(ordered, 0.50) * 1000, 1),
+                "p95_ms": round(percentile(ordered, 0.95) * 1000, 1),
+                "p99_ms": round(percentile(ordered, 0.99) * 1000, 1),
+            }
+        return {
+            "elapsed_s": round(elapsed, 1),
+            "requests": sum(len(v) for v in self.latencies.values()),
+            "dropped": self.dropped,
+            "served_questions": self.served_questions,
+            "routes": routes,
+        }
+
+def question_payload(args: argparse.Namespace, game_id: str) -> Dict[str, Any]:
+    return {
+        "model": "trivia", "gameId": game_id, "category": random.choice(CATEGORIES), "gameMode": "mcq",
+        "knowledgeLevel": "intermediate", "language": args.language, "theme": None, "includeCategoryTheme": True,
+    }
+
+async def run_question(client: httpx.AsyncClient, recorder: Recorder, args: argparse.Namespace, worker: int):
+    body = await recorder.request(client, "generate-question", "POST", "/api/generate-question",
+                                  question_payload(args, f"load-{worker}"))
+    if body and body.get("question"):
+        recorder.served_questions += 1
+
+async def run_preload(client: httpx.AsyncClient, recorder: Recorder, args: argparse.Namespace, worker: int):
+    game_id = f"load-preload-{worker}-{random.getrandbits(32):x}"
+    payload = question_payload(args, game_id)
+    board = random.sample(CATEGORIES, 6)
+    odds = [random.random() for _ in board]
+    payload.pop("category")
+    payload["categories"] = board
+    payload["upcoming"] = [{"category": category, "probability": p / sum(odds)} for category, p in zip(board, odds)]
+    await recorder.request(client, "preload-plan", "POST", "/api/preload-plan", payload)
+
+async def run_live(client: httpx.AsyncClient, recorder: Recorder, args: argparse.Namespace, worker: int):
+    room = await recorder.request(client, "live:create-room", "POST", "/api/live-quiz/create-room", {
+        "categories": random.sample(CATEGORIES, 6), "game_mode": "mcq", "knowledge_level": "intermediate",
+        "language": args.language, "selected_question_model": "trivia", "questions_per_category": 5,
+    })
+    if not room:
+        return
+    for index in range(args.live_questions):
+        action = "start_game" if index == 0 else "next_question"
+        body = await recorder.request(client, f"live:{action}", "POST", "/api/live-quiz/host-control",
+                                      {"game_id": room["game_id"], "action": action})
+        if body is None:
+            return
+        recorder.served_questions += 1
+
+RUNNERS = {"question": run_question, "preload": run_preload, "live": run_live}
+
+async def stub_stats(client: httpx.AsyncClient, stub_url: str) -> Optional[Dict[str, Any]]:
+    try:
+        response = await client.get(f"{stub_url}/stub/stats")
+        return response.json()
+    except (httpx.HTTPError, ValueError):
+        return None
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    recorder = Recorder()
+    names = [name for name, weight in args.mix.items() if weight > 0]
+    weights = [args.mix[name] for name in names]
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    timeout = httpx.Timeout(args.timeout)
+
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=timeout) as client:
+        before = await stub_stats(client, args.stub_url)
+        started = time.perf_counter()
+        deadline = started + args.duration
+
+        async def one(worker: int):
+            scenario = random.choices(names, weights=weights)[0]
+            await RUNNERS[scenario](client, recorder, args, worker)
+
+        if args.rate > 0:
+            in_flight = set()
+            arrival = 0
+            while time.perf_counter() < deadline:
+                await asyncio.sleep(random.expovariate(args.rate))
+                if len(in_flight) >= args.concurrency:
+                    recorder.dropped += 1
+                    continue
+                arrival += 1
+                task = asyncio.create_task(one(arrival))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            if in_flight:
+                await asyncio.wait(in_flight)
+        else:
+            async def worker_loop(worker: int):
+                while time.perf_counter() < deadline:
+                    await one(worker)
+            await asyncio.gather(*(worker_loop(worker) for worker in range(args.concurrency)))
+
+        elapsed = time.perf_counter() - started
+        # Background work started by the run (preloads, cached batches) still calls the provider for a while
+        await asyncio.sleep(args.settle)
+        after = await stub_stats(client, args.stub_url)
+
+    result = recorder.report(elapsed)
+    if before is not None and after is not None:
+        calls = after["calls"] - before["calls"]
+        result["llm_calls"] = calls
+        result["llm_calls_by_kind"] = {kind: after["calls_by_kind"][kind] - before["calls_by_kind"].get(kind, 0)
+                                       for kind in after["calls_by_kind"]}
+        result["llm_calls_per_served_question"] = round(calls / recorder.served_questions, 3) if recorder.served_questions else None
+    return result
+
+def print_report(result: Dict[str, Any]):
+    print(f"{result['requests']} requests in {result['elapsed_s']}s, {result['served_questions']} questions served, "
+          f"{result['dropped']} arrivals dropped")
+    print(f"{'route':>24} {'requests':>9} {'errors':>7} {'rps':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, stats in result["routes"].items():
+        print(f"{route:>24} {stats['requests']:>9} {stats['errors']:>7} {stats['rps']:>7.2f} "
+              f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+    if "llm_calls" in result:
+        print(f"LLM calls: {result['llm_calls']} ({result['llm_calls_per_served_question']} per served question) "
+              f"{json.dumps({k: v for k, v in result['llm_calls_by_kind'].items() if v})}")
+    else:
+        print("LLM calls: stub stats unavailable (is --stub-url pointing at benchmarks.stub_openai_server?)")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--stub-url", default="http://127.0.0.1:8081")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=0, help="open-loop arrivals per second (0: closed loop)")
+    parser.add_argument("--mix", type=parse_mix, default="question=6,preload=3,live=1")
+    parser.add_argument("--live-questions", type=int, default=6)
+    parser.add_argument("--language", default="pl")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--settle", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", default=None, help="also write the results to this file")
+    args = parser.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+@file prompt_render_benchmark.py
+Before/after microbenchmark for prompt assembly.
+
+Renders the question, blueprint question and explanation prompts many times:
+- "before": the per-request assembly the call sites used to do (re-joining the persona and
+  static_instructions lists, looking up every prompts.json entry, then str.format; build_question_prompt
+  also printed a debug banner on every call)
+- "after": utils.build_question_prompt and the compiled templates from backend/prompts.py
+Both paths must produce byte-identical prompts; the script checks that before timing them.
+Output printed while timing goes to os.devnull with one write per line (the container runs with
+PYTHONUNBUFFERED=1), so the log cost measured is formatting and the write calls, without any real log sink.
+
+Usage:
+    python -m benchmarks.prompt_render_benchmark [--iterations 20000]
+"""
+
+import os
+import sys
+import time
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("OPENAI_API_BASE", "http://localhost:1")
+
+from backend.config import PROMPTS  # noqa: E402
+from backend.prompts import prompt_registry  # noqa: E402
+from backend.utils import build_question_prompt  # noqa: E402
+
+PARAMS = {"language": "pl", "knowledgeLevel": "intermediate", "gameMode": "mcq", "theme": "Średniowiecze", "includeCategoryTheme": True}
+BLUEPRINT = {"subcategory": "Bitwy", "modifier": "Data", "target_answer": "1410"}
+EXPLANATION = {"question": "W którym roku odbyła się bitwa pod Grunwaldem?", "correct_answer": "1410", "player_answer": "1409"}
+THEME_TEXT = "Temat: Średniowiecze"
+HISTORY = "Brak historii / No history."
+
+# --- "before": assembly as it was done at every call site ---
+def legacy_question_prompt():
+    prompt_struct = PROMPTS["generate_question"]["pl"]
+    for field in ["persona", "static_instructions", "task_template"]:
+        if field not in prompt_struct:
+            raise ValueError(field)
+    print("🔍 LIVE-QUIZ DEBUG: Generating question for category 'Historia'")
+    print("-" * 80)
+    static_content = "\n\n".join([prompt_struct["persona"], "\n".join(prompt_struct["static_instructions"])])
+    dynamic_content = prompt_struct["task_template"].format(
+        category="Historia", subcategory_suggestion="",
+        knowledge_prompt=PROMPTS["knowledge_prompts"]["intermediate"]["pl"],
+        game_mode_prompt=PROMPTS["game_mode_prompts"]["mcq"]["pl"],
+        theme_context=THEME_TEXT, subcategory_history_prompt=HISTORY, entity_history_prompt=HISTORY
+    )
+    return f"{static_content}\n\n{dynamic_content}"
+
+def legacy_blueprint_prompt():
+    prompt_struct = PROMPTS["generate_question_from_blueprint"]["pl"]
+    static_content = "\n\n".join([prompt_struct["persona"], "\n".join(prompt_struct["static_instructions"])])
+    dynamic_content = prompt_struct["task_template"].format(
+        category="Historia", subcategory=BLUEPRINT["subcategory"], modifier=BLUEPRINT["modifier"],
+        target_answer=BLUEPRINT["target_answer"],
+        knowledge_level=PROMPTS["knowledge_prompts"]["intermediate"]["pl"],
+        game_mode=PROMPTS["game_mode_prompts"]["mcq"]["pl"]
+    )
+    return f"{static_content}\n\n{dynamic_content}"
+
+def legacy_explanation_prompt():
+    prompt_struct = PROMPTS["explain_incorrect"]["pl"]
+    prompt = prompt_struct["task_template"].format(**EXPLANATION)
+    static_content = "\n".join(prompt_struct["static_instructions"])
+    return f"{static_content}\n\n{prompt}"
+
+# --- "after": compiled templates ---
+def registry_question_prompt():
+    return build_question_prompt(PARAMS, "Historia")
+
+def registry_blueprint_prompt():
+    return build_question_prompt(PARAMS, "Historia", BLUEPRINT)
+
+def registry_explanation_prompt():
+    return prompt_registry.get("explain_incorrect", "pl").render(**EXPLANATION)
+
+CASES = [
+    ("question", legacy_question_prompt, registry_question_prompt),
+    ("blueprint question", legacy_blueprint_prompt, registry_blueprint_prompt),
+    ("explanation", legacy_explanation_prompt, registry_explanation_prompt),
+]
+
+def time_per_call(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    with open(os.devnull, "w", buffering=1) as devnull, contextlib.redirect_stdout(devnull):
+        mismatches = [name for name, before, after in CASES if before() != after()]
+        timings = [(name, time_per_call(before, args.iterations), time_per_call(after, args.iterations)) for name, before, after in CASES]
+    if mismatches:
+        raise SystemExit(f"Compiled prompts differ from the legacy assembly: {mismatches}")
+    print("All compiled prompts are byte-identical to the legacy assembly.")
+
+    for name, before, after in timings:
+        before_us = before * 1e6
+        after_us = after * 1e6
+        print(f"{name:>20}: before {before_us:6.2f} us  after {after_us:6.2f} us  ({before_us / after_us:.1f}x)")
+
+if __name__ == "__main__":
+    main()
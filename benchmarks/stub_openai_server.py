@@ -0,0 +1,257 @@
+"""
+@file stub_openai_server.py
+Local OpenAI-compatible stand-in for load tests: no provider calls, no cost.
+
+Serves POST /v1/chat/completions (plain and stream=True) and GET /v1/models. Each prompt is matched against
+the compiled prompt registry to see which feature sent it (question, question batch, blueprints, categories,
+category mutation, explanation), and the stub answers with a canned response that passes that feature's
+validation. Questions are numbered so they never collide in the question archive. Faults can be injected:
+- --latency: fixed:MS, uniform:LO,HI or lognormal:MEDIAN,SIGMA (milliseconds; per question for batches)
+- --rate-limit-rate: share of calls answered with 429 (with a Retry-After of --retry-after seconds)
+- --error-rate: share of calls answered with 500
+- --malformed-rate: share of calls whose content is truncated, unparseable JSON
+- --canned FILE: JSON object mapping a kind (see KINDS) to the content to return instead of the built-in one
+GET /stub/stats returns the calls per kind and the injected faults; POST /stub/reset zeroes them.
+
+Usage:
+    python -m benchmarks.stub_openai_server [--port 8081] [--latency lognormal:800,0.4] [--rate-limit-rate 0.02]
+        [--error-rate 0] [--malformed-rate 0.01] [--retry-after 1] [--canned canned.json] [--seed 1]
+    OPENAI_API_KEY=stub OPENAI_API_BASE=http://127.0.0.1:8081/v1 uvicorn backend.server:app --port 8000
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+os.environ.setdefault("OPENAI_API_BASE", "http://127.0.0.1:1")
+
+import uvicorn  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import JSONResponse, StreamingResponse  # noqa: E402
+
+from backend.prompts import prompt_registry  # noqa: E402
+
+KINDS = ("question_batch", "question", "blueprints", "categories", "mutation", "explanation", "unknown")
+# Templates whose static prefix identifies the kind of a prompt; batches are recognized first
+PREFIX_KINDS = {
+    "generate_question_from_blueprint": "question",
+    "generate_question": "question",
+    "generate_blueprints": "blueprints",
+    "generate_categories": "categories",
+    "mutate_category": "mutation",
+    "explain_incorrect": "explanation",
+}
+STREAM_CHUNK_CHARS = 24
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Returns a sampler of seconds for fixed:MS, uniform:LO,HI or lognormal:MEDIAN,SIGMA."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0] / 1000
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal" and len(values) == 2:
+        mu = math.log(max(values[0], 1e-3))
+        return lambda: random.lognormvariate(mu, values[1]) / 1000
+    raise argparse.ArgumentTypeError(f"Bad latency spec '{spec}' (fixed:MS, uniform:LO,HI or lognormal:MEDIAN,SIGMA)")
+
+class PromptClassifier:
+    def __init__(self):
+        self._prefixes: List[Tuple[str, str]] = []
+        for name, kind in PREFIX_KINDS.items():
+            for language in ("pl", "en"):
+                prefix = prompt_registry.get(name, language).prefix
+                if prefix:
+                    self._prefixes.append((prefix, kind))
+        # The batch instructions up to the question count, e.g. "BATCH MODE: Create "
+        self._batch_markers = [
+            instructions.split("{count}")[0].replace("{{", "{").replace("}}", "}")
+            for instructions in prompt_registry.batch_instructions.values()
+        ]
+
+    def classify(self, prompt: str) -> Tuple[str, int]:
+        """Returns (kind, number of questions asked for)."""
+        for marker in self._batch_markers:
+            position = prompt.find(marker)
+            if position >= 0:
+                digits = ""
+                for ch in prompt[position + len(marker):]:
+                    if not ch.isdigit():
+                        break
+                    digits += ch
+                return "question_batch", max(1, int(digits or 1))
+        for prefix, kind in self._prefixes:
+            if prompt.startswith(prefix):
+                return kind, 1
+        return "unknown", 1
+
+class StubState:
+    def __init__(self, args: argparse.Namespace):
+        self.latency = args.latency
+        self.rate_limit_rate = args.rate_limit_rate
+        self.error_rate = args.error_rate
+        self.malformed_rate = args.malformed_rate
+        self.retry_after = args.retry_after
+        self.canned: Dict[str, Any] = {}
+        if args.canned:
+            with open(args.canned, "r", encoding="utf-8") as f:
+                self.canned = json.load(f)
+        self.classifier = PromptClassifier()
+        self.question_counter = 0
+        self.reset()
+
+    def reset(self):
+        self.calls = {kind: 0 for kind in KINDS}
+        self.questions = 0
+        self.faults = {"rate_limited": 0, "errors": 0, "malformed": 0}
+        self.started = time.time()
+
+    def question(self, index: int) -> Dict[str, Any]:
+        self.question_counter += 1
+        n = self.question_counter
+        options = [f"Option {n}-{letter}" for letter in "ABCD"]
+        return {
+            "question": f"Stub question number {n} ({index}): which option is correct?",
+            "options": options,
+            "answer": options[n % 4],
+            "explanation_correct": f"Option {n}-{'ABCD'[n % 4]} is correct in the stub.",
+            "explanation_distractors": "The other options are stub distractors.",
+            "subcategory": f"Stub subcategory {n % 7}",
+            "key_entities": [f"Entity {n}"],
+        }
+
+    def content_for(self, kind: str, count: int) -> Any:
+        if kind in self.canned:
+            return self.canned[kind]
+        if kind == "question_batch":
+            return {"questions": [self.question(i) for i in range(count)]}
+        if kind == "question":
+            return self.question(0)
+        if kind == "blueprints":
+            return {"topics": [
+                {"subcategory": f"Stub subcategory {i % 7}", "modifier": "Fact", "target_answer": f"Answer {random.randint(0, 10 ** 9)}"}
+                for i in range(20)
+            ]}
+        if kind == "categories":
+            return {"categories": [f"Stub category {i}" for i in range(1, 7)]}
+        if kind == "mutation":
+            return {"choices": [{"name": f"Stub choice {i}", "description": "A stub alternative."} for i in range(1, 6)]}
+        if kind == "explanation":
+            return {"verdict_for": "game", "verdict_certainty": 90, "explanation": "The stub does not accept this answer."}
+        return {"answer": "stub"}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "calls": sum(self.calls.values()),
+            "calls_by_kind": self.calls,
+            "questions_generated": self.questions,
+            "faults": self.faults,
+        }
+
+def completion_body(model: str, text: str, prompt: str) -> Dict[str, Any]:
+    prompt_tokens, completion_tokens = len(prompt) // 4, len(text) // 4
+    return {
+        "id": f"chatcmpl-stub-{random.getrandbits(48):x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+def create_app(state: StubState) -> FastAPI:
+    app = FastAPI(title="OpenAI stub")
+
+    async def models():
+        return JSONResponse(content={"object": "list", "data": [{"id": "trivia", "object": "model", "owned_by": "stub"}]})
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "trivia")
+        prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        kind, count = state.classifier.classify(prompt)
+        state.calls[kind] += 1
+
+        roll = random.random()
+        if roll < state.rate_limit_rate:
+            state.faults["rate_limited"] += 1
+            return JSONResponse(status_code=429, headers={"Retry-After": str(state.retry_after)},
+                                content={"error": {"message": "Rate limit reached (stub)", "type": "rate_limit_exceeded"}})
+        roll -= state.rate_limit_rate
+
+        latency = sum(state.latency() for _ in range(count))
+        if roll < state.error_rate:
+            await asyncio.sleep(latency / 2)
+            state.faults["errors"] += 1
+            return JSONResponse(status_code=500, content={"error": {"message": "Internal error (stub)", "type": "server_error"}})
+        roll -= state.error_rate
+
+        text = json.dumps(state.content_for(kind, count), ensure_ascii=False)
+        if kind in ("question", "question_batch"):
+            state.questions += count
+        if roll < state.malformed_rate:
+            state.faults["malformed"] += 1
+            text = text[:len(text) // 2]
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            return JSONResponse(content=completion_body(model, text, prompt))
+
+        async def events():
+            chunks = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)] or [""]
+            # A fifth of the latency before the first token, the rest spread over the chunks
+            await asyncio.sleep(latency / 5)
+            base = {"id": f"chatcmpl-stub-{random.getrandbits(48):x}", "object": "chat.completion.chunk",
+                    "created": int(time.time()), "model": model}
+            for chunk in chunks:
+                delta = {**base, "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]}
+                yield f"data: {json.dumps(delta, ensure_ascii=False)}\n\n"
+                await asyncio.sleep(latency * 4 / 5 / len(chunks))
+            yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def stats():
+        return JSONResponse(content=state.stats())
+
+    async def reset():
+        state.reset()
+        return JSONResponse(content=state.stats())
+
+    # The client's base URL may or may not end in /v1
+    for prefix in ("/v1", ""):
+        app.get(f"{prefix}/models")(models)
+        app.post(f"{prefix}/chat/completions")(chat_completions)
+    app.get("/stub/stats")(stats)
+    app.post("/stub/reset")(reset)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=parse_latency, default="lognormal:800,0.4")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--canned", default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    uvicorn.run(create_app(StubState(args)), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
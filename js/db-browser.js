@@ -74,6 +74,12 @@ document.addEventListener('DOMContentLoaded', () => {
         blueprints: { page: 1, sortBy: 'id', sortOrder: 'desc' },
         cache: { page: 1, sortBy: 'id', sortOrder: 'desc' }
     };
+    // Prompt history and error logs are paged from the API on demand when browsing the server's own database
+    const REMOTE_PAGE_SIZE = 50;
+    const remoteTables = {
+        promptHistory: { url: '/api/db/prompts', rows: [], cursor: null, done: false, enabled: false },
+        errorLogs: { url: '/api/db/errors', rows: [], cursor: null, done: false, enabled: false }
+    };
     function parseDateSafe(dateString) {
         if (!dateString) return 0;
         try {
@@ -159,6 +165,7 @@ document.addEventListener('DOMContentLoaded', () => {
             const SQL = await sqlJsPromise;
             if (!SQL) { showError("Nie można zainicjować SQL.js."); return; }
             db = new SQL.Database(uInt8Array);
+            await initRemoteTables(sourceName);
             processDatabase(sourceName);
         } catch (err) {
             showError(`Błąd podczas przetwarzania bazy danych: ${err.message}`);
@@ -571,7 +578,9 @@ document.addEventListener('DOMContentLoaded', () => {
         container.innerHTML = '';
         
         const pageCount = Math.ceil(totalItems / TABLE_ITEMS_PER_PAGE);
-        if (pageCount <= 1) return;
+        const remote = remoteTables[tableName];
+        const hasMoreRemote = Boolean(remote && remote.enabled && !remote.done);
+        if (pageCount <= 1 && !hasMoreRemote) return;
         
         const createButton = (text, disabled, onClick) => {
             const btn = document.createElement('button');
@@ -584,7 +593,7 @@ document.addEventListener('DOMContentLoaded', () => {
         
         const pageInfo = document.createElement('span');
         pageInfo.className = 'px-4 py-2 text-sm font-medium text-gray-700';
-        pageInfo.textContent = `Strona ${currentPage} z ${pageCount}`;
+        pageInfo.textContent = `Strona ${currentPage} z ${pageCount}${hasMoreRemote ? '+' : ''}`;
         
         container.append(
             createButton('Poprzednia', currentPage === 1, () => {
@@ -592,7 +601,15 @@ document.addEventListener('DOMContentLoaded', () => {
                 renderTableFunctions[tableName]();
             }),
             pageInfo,
-            createButton('Następna', currentPage === pageCount, () => {
+            createButton('Następna', currentPage >= pageCount && !hasMoreRemote, async () => {
+                if (currentPage >= pageCount && hasMoreRemote) {
+                    try {
+                        await fetchRemotePage(tableName);
+                    } catch (e) {
+                        showError(`Błąd podczas pobierania kolejnej strony: ${e.message}`);
+                        return;
+                    }
+                }
                 tableState[tableName].page++;
                 renderTableFunctions[tableName]();
             })
@@ -637,6 +654,49 @@ document.addEventListener('DOMContentLoaded', () => {
         cache: renderCache
     };
     
+    async function fetchRemotePage(tableName) {
+        const remote = remoteTables[tableName];
+        const params = new URLSearchParams({ limit: REMOTE_PAGE_SIZE, format: 'ndjson' });
+        if (remote.cursor !== null) params.set('before_id', remote.cursor);
+        const response = await fetch(`${remote.url}?${params}`);
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        // Rows arrive as NDJSON; parse them line by line as the stream comes in
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = '';
+        let received = 0;
+        const pushLine = line => {
+            if (!line.trim()) return;
+            const row = JSON.parse(line);
+            remote.rows.push(row);
+            remote.cursor = row.id;
+            received++;
+        };
+        for (;;) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffered += decoder.decode(value, { stream: true });
+            const lines = buffered.split('\n');
+            buffered = lines.pop();
+            lines.forEach(pushLine);
+        }
+        pushLine(buffered);
+        remote.done = received < REMOTE_PAGE_SIZE;
+    }
+    async function initRemoteTables(sourceName) {
+        for (const [tableName, remote] of Object.entries(remoteTables)) {
+            Object.assign(remote, { rows: [], cursor: null, done: false, enabled: false });
+            // Only the auto-loaded server database matches what the API serves
+            if (sourceName !== 'data/questions.db') continue;
+            try {
+                await fetchRemotePage(tableName);
+                remote.enabled = true;
+            } catch (e) {
+                console.log(`API pagination for ${tableName} unavailable, using the database file.`);
+                Object.assign(remote, { rows: [], cursor: null, done: false });
+            }
+        }
+    }
     function queryDatabase(tableName, columns = "*", orderBy = "") {
         try {
             if (!db.exec(`SELECT name FROM sqlite_master WHERE type='table' AND name='${tableName}'`)[0]) {
@@ -718,7 +778,9 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
     function renderPromptHistory() {
-        const data = queryDatabase('prompt_history', 'id, timestamp, model, prompt, raw_response', '');
+        const data = remoteTables.promptHistory.enabled
+            ? remoteTables.promptHistory.rows
+            : queryDatabase('prompt_history', 'id, timestamp, model, prompt, raw_response', '');
         const container = document.getElementById('prompt-history-table-container');
         if (data.length === 0) {
             container.innerHTML = `<p class="text-gray-500 text-center">Brak danych w historii promptów.</p>`;
@@ -754,7 +816,9 @@ document.addEventListener('DOMContentLoaded', () => {
         renderPaginationControls('prompt-history-pagination', 'promptHistory', data.length, tableState.promptHistory.page);
     }
     function renderErrorLogs() {
-        const data = queryDatabase('error_logs', 'id, timestamp, endpoint, error_details_json', '');
+        const data = remoteTables.errorLogs.enabled
+            ? remoteTables.errorLogs.rows
+            : queryDatabase('error_logs', 'id, timestamp, endpoint, error_details_json', '');
         const container = document.getElementById('error-logs-table-container');
         if (data.length === 0) {
             container.innerHTML = `<p class="text-gray-500 text-center">Brak logów błędów.</p>`;
@@ -8,8 +8,9 @@ import { initializeApp } from './main.js';
 import { gameState, setState } from './state.js';
 import { UI } from './dom.js';
 import { updateModelSelection } from './ui.js';
-import { callApi } from './utils.js';
+import { callApi, streamApi } from './utils.js';
 import { translations } from './config.js';
+import { landingCategoryOdds } from './board.js';
 
 // Construct the API path dynamically from the deployment config.
 const basePath = '/';
@@ -83,24 +84,32 @@ const backendApiAdapter = {
         }
     },
 
-    // A new method to trigger the preload on the server
+    // Sends the whole board to the server's warm pool: every category, and how likely the current
+    // and the next player are to land on each one, so the likeliest questions are ready first
     async preloadQuestions() {
         if (!gameState.gameId) return; // Don't do anything if the game hasn't started
-
-        // Get current category based on current player's position
-        if (!gameState.players || gameState.players.length === 0) return; // Game not started
-        const player = gameState.players[gameState.currentPlayerIndex];
-        if (!player || !gameState.board) return;
-        const square = gameState.board.find(s => s.id === player.position);
-        if (!square || square.categoryIndex === null || square.categoryIndex === undefined) return; // No category to preload
-
-        const category = gameState.categories[square.categoryIndex];
-        if (!category || category.trim() === '') return; // Invalid category
+        if (!gameState.players || gameState.players.length === 0 || !gameState.board) return; // Game not started
+
+        const categories = (gameState.categories || []).filter(category => category && category.trim() !== '');
+        if (categories.length === 0) return; // No category to preload
+
+        const odds = {};
+        const players = [gameState.currentPlayerIndex, (gameState.currentPlayerIndex + 1) % gameState.players.length];
+        for (const index of new Set(players)) {
+            const player = gameState.players[index];
+            if (!player) continue;
+            const playerOdds = landingCategoryOdds(player.position, gameState.categories.length);
+            for (const [categoryIndex, probability] of Object.entries(playerOdds)) {
+                const category = gameState.categories[categoryIndex];
+                if (category) odds[category] = Math.max(odds[category] || 0, probability);
+            }
+        }
 
         const payload = {
             model: this._resolveQuestionModel(),
             gameId: gameState.gameId,
-            category: category,
+            categories: categories,
+            upcoming: Object.entries(odds).map(([category, probability]) => ({ category, probability })),
             gameMode: gameState.gameMode,
             knowledgeLevel: gameState.knowledgeLevel,
             language: gameState.currentLanguage,
@@ -110,14 +119,14 @@ const backendApiAdapter = {
 
         try {
             // Fire-and-forget request, we don't need to wait for the response
-            fetch(apiPath + 'preload-questions', {
+            fetch(apiPath + 'preload-plan', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify(payload)
             });
-            console.log('Preload request sent for category:', category, 'with model selection:', payload.model);
+            console.log('Preload plan sent for categories:', categories, 'with model selection:', payload.model);
         } catch (error) {
-            console.error('Failed to send preload request:', error);
+            console.error('Failed to send preload plan:', error);
         }
     },
 
@@ -169,8 +178,8 @@ const backendApiAdapter = {
         return response;
     },
 
-    async getIncorrectAnswerExplanation() {
-        const payload = {
+    _explanationPayload() {
+        return {
             model: this._resolveExplanationModel(),
             gameId: gameState.gameId,
             language: gameState.currentLanguage,
@@ -178,6 +187,10 @@ const backendApiAdapter = {
             correct_answer: gameState.currentQuestionData.answer,
             player_answer: gameState.currentPlayerAnswer,
         };
+    },
+
+    async getIncorrectAnswerExplanation() {
+        const payload = this._explanationPayload();
         const data = await callApi(apiPath + 'explain-incorrect', payload);
 
         setState({
@@ -189,6 +202,30 @@ const backendApiAdapter = {
         return data;
     },
 
+    /**
+     * Streams the explanation: onDelta receives explanation text as it is generated.
+     * Resolves with the same object as getIncorrectAnswerExplanation().
+     */
+    async streamIncorrectAnswerExplanation(onDelta) {
+        const payload = this._explanationPayload();
+        let data = null;
+        let streamError = null;
+        await streamApi(apiPath + 'explain-incorrect/stream', payload, (event, eventData) => {
+            if (event === 'delta') onDelta(eventData.text);
+            else if (event === 'result') data = eventData;
+            else if (event === 'error') streamError = eventData.detail;
+        });
+        if (!data) throw new Error(streamError || 'Explanation stream ended without a result.');
+
+        setState({
+            promptHistory: [
+                ...gameState.promptHistory,
+                { prompt: JSON.stringify(payload, null, 2), response: JSON.stringify(data, null, 2) }
+            ]
+        }, 'state:history');
+        return data;
+    },
+
     async getCategoryMutationChoices(oldCategory, existingCategories = []) {
         const payload = {
             model: this._resolveCategoryModel(),
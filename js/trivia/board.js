@@ -117,4 +117,29 @@ export function findPossibleMoves(startId, steps) {
         }
     }
     return finalPaths;
-}
\ No newline at end of file
+}
+/**
+ * Estimates the chance of each category being asked on a player's next turn. Every die roll (1-6) is equally
+ * likely, and so is every destination of a roll. The hub lets the player pick any category, so its share is
+ * spread over all of them; roll-again squares ask nothing.
+ * @param {number} startId - The square the player stands on.
+ * @param {number} categoryCount - The number of categories in the game.
+ * @returns {object} An object where keys are category indexes and values are probabilities.
+ */
+export function landingCategoryOdds(startId, categoryCount) {
+    const odds = {};
+    const add = (index, probability) => { odds[index] = (odds[index] || 0) + probability; };
+    for (let roll = 1; roll <= 6; roll++) {
+        const destinations = Object.keys(findPossibleMoves(startId, roll));
+        const share = 1 / 6 / destinations.length;
+        for (const id of destinations) {
+            const square = gameState.board.find(s => s.id === Number(id));
+            if (square.type === CONFIG.SQUARE_TYPES.HUB) {
+                for (let i = 0; i < categoryCount; i++) add(i, share / categoryCount);
+            } else if (square.categoryIndex !== null && square.categoryIndex !== undefined) {
+                add(square.categoryIndex, share);
+            }
+        }
+    }
+    return odds;
+}
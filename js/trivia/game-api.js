@@ -111,7 +111,24 @@ export async function verifyIncorrectAnswer() {
     if (UI.llmEvaluationContainer) UI.llmEvaluationContainer.classList.add('hidden');
     try {
         const api = getApiAdapter();
-        const responseData = await api.getIncorrectAnswerExplanation();
+        let responseData;
+        if (typeof api.streamIncorrectAnswerExplanation === 'function') {
+            let streamedText = '';
+            try {
+                responseData = await api.streamIncorrectAnswerExplanation(text => {
+                    // Show the explanation as soon as the first words arrive
+                    UI.incorrectExplanationLoader.classList.add('hidden');
+                    streamedText += text;
+                    UI.incorrectExplanationText.textContent = streamedText;
+                });
+            } catch (streamError) {
+                if (streamedText) throw streamError;
+                console.warn("Explanation streaming unavailable, falling back to a regular request.", streamError);
+                responseData = await api.getIncorrectAnswerExplanation();
+            }
+        } else {
+            responseData = await api.getIncorrectAnswerExplanation();
+        }
 
         UI.incorrectExplanationText.innerHTML = (responseData.explanation || translations.incorrect_answer_analysis_error[gameState.currentLanguage]).replace(/\n/g, '<br>');
 
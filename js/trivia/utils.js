@@ -57,4 +57,45 @@ export async function callApi(endpoint, payload) {
         console.error(`Failed to call backend endpoint ${endpoint}:`, error);
         throw error; // Re-throw the error to be caught by the calling function
     }
-}
\ No newline at end of file
+}
+/**
+ * Calls a backend endpoint that answers with server-sent events over a POST request.
+ * @param {string} endpoint The backend API endpoint (e.g., '/api/explain-incorrect/stream').
+ * @param {object} payload The request body payload to send to the backend.
+ * @param {function(string, any): void} onEvent Called with (eventName, parsedData) for every event.
+ * @returns {Promise<void>} Resolves when the stream ends.
+ */
+export async function streamApi(endpoint, payload, onEvent) {
+    const response = await fetch(endpoint, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+        },
+        body: JSON.stringify(payload),
+    });
+    if (!response.ok || !response.body) {
+        throw new ApiError(`Request failed with status ${response.status}`, response.status);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let eventName = 'message';
+            const dataLines = [];
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+            });
+            if (dataLines.length) onEvent(eventName, JSON.parse(dataLines.join('\n')));
+        }
+    }
+}
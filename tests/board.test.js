@@ -4,7 +4,7 @@
  */
 
 import { describe, it, expect } from 'vitest';
-import { createBoardLayout, findPossibleMoves } from '../js/trivia/board.js';
+import { createBoardLayout, findPossibleMoves, landingCategoryOdds } from '../js/trivia/board.js';
 import { gameState } from '../js/trivia/state.js';
 
 describe('board layout', () => {
@@ -18,4 +18,15 @@ describe('board layout', () => {
     const moves = findPossibleMoves(0, 1);
     expect(Object.keys(moves).length).toBeGreaterThan(0);
   });
+
+  it('spreads the next landing over the categories', () => {
+    createBoardLayout();
+    const odds = landingCategoryOdds(0, 6);
+    const values = Object.values(odds);
+    expect(values.length).toBe(6);
+    // Roll-again squares ask nothing, so the odds add up to at most 1
+    const total = values.reduce((sum, p) => sum + p, 0);
+    expect(total).toBeGreaterThan(0.5);
+    expect(total).toBeLessThanOrEqual(1 + 1e-9);
+  });
 });
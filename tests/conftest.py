@@ -0,0 +1,37 @@
+import os
+import asyncio
+from typing import Any, Awaitable, Callable, Optional
+
+import pytest
+
+# backend.config refuses to import without API settings; tests never call the API
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("OPENAI_API_BASE", "http://127.0.0.1:9")
+
+from backend import database  # noqa: E402
+
+class TestDatabase:
+    __test__ = False
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def run(self, scenario: Optional[Callable[[], Awaitable[Any]]] = None) -> Any:
+        """Opens the database (applying migrations), awaits scenario() and closes it again, in a new event loop."""
+        async def run():
+            await database.init_db()
+            try:
+                return await scenario() if scenario is not None else None
+            finally:
+                await database.close_db()
+        return asyncio.run(run())
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh questions.db in tmp_path as database.DATABASE_FILE, restored (and the pool closed) after the test."""
+    test_db = TestDatabase(str(tmp_path / "questions.db"))
+    monkeypatch.setattr(database, "DATABASE_FILE", test_db.path)
+    yield test_db
+    # A test that opened the pool itself and failed before closing it
+    if database._manager is not None:
+        asyncio.run(database.close_db())
@@ -0,0 +1,40 @@
+"""
+@file test_archive.py
+Archive reuse must never show a game the same question twice.
+"""
+
+from backend import database
+from backend.archive import QuestionArchive
+
+KEY = ("Historia", "pl", "basic", "mcq", "")
+INPUTS = {"model": "trivia", "category": "Historia", "language": "pl", "knowledgeLevel": "basic", "gameMode": "mcq", "includeCategoryTheme": False}
+
+def make_question(i):
+    return {"question": f"Question {i}?", "answer": "A", "options": ["A", "B", "C", "D"], "explanation": "", "subcategory": "s", "key_entities": []}
+
+def test_archive_serves_each_question_once_per_game(db):
+    async def scenario():
+        for i in range(5):
+            await database.add_question(make_question(i), INPUTS)
+        await database.add_question(make_question(99), {**INPUTS, "gameMode": "short_answer"})
+        archive = QuestionArchive(reuse_ratio=1.0)
+        first_game = [await archive.take("game-1", KEY) for _ in range(6)]
+        second_game = await archive.take("game-2", KEY)
+        return first_game, second_game
+
+    first_game, second_game = db.run(scenario)
+    served = [q["question"] for q in first_game[:5]]
+    assert sorted(served) == [f"Question {i}?" for i in range(5)]
+    assert first_game[5] is None
+    assert "archive_id" not in first_game[0]
+    assert second_game is not None
+
+def test_generated_questions_count_as_seen(db):
+    async def scenario():
+        archive = QuestionArchive(reuse_ratio=1.0)
+        archive.remember("game-1", await database.add_question(make_question(1), INPUTS))
+        return await archive.take("game-1", KEY), await archive.take("game-2", KEY)
+
+    same_game, other_game = db.run(scenario)
+    assert same_game is None
+    assert other_game["question"] == "Question 1?"
@@ -0,0 +1,38 @@
+"""
+@file test_blueprints.py
+Blueprint claiming must stay atomic under concurrent preload tasks.
+"""
+
+import asyncio
+
+from backend import database
+
+def make_blueprints(count):
+    return [{"subcategory": f"sub {i}", "modifier": "", "target_answer": f"answer {i}"} for i in range(count)]
+
+def test_concurrent_claims_never_return_the_same_blueprint(db):
+    async def scenario():
+        await database.save_blueprints_batch("Historia", make_blueprints(50))
+        claims = await asyncio.gather(*(database.get_unused_blueprint("Historia") for _ in range(80)))
+        return claims, await database.get_blueprint_count("Historia")
+
+    claims, remaining = db.run(scenario)
+    claimed_ids = [c["id"] for c in claims if c]
+    assert len(claimed_ids) == 50
+    assert len(set(claimed_ids)) == 50
+    assert claims.count(None) == 30
+    assert remaining == 0
+
+def test_blueprint_count_is_tracked_incrementally(db):
+    async def scenario():
+        await database.save_blueprints_batch("Nauka", make_blueprints(5))
+        counts = [await database.get_blueprint_count("Nauka")]
+        await database.get_unused_blueprint("Nauka")
+        counts.append(await database.get_blueprint_count("Nauka"))
+        await database.save_blueprints_batch("Nauka", make_blueprints(3))
+        counts.append(await database.get_blueprint_count("Nauka"))
+        assert await database.get_unused_blueprint("Sport") is None
+        counts.append(await database.get_blueprint_count("Sport"))
+        return counts
+
+    assert db.run(scenario) == [5, 4, 7, 0]
@@ -0,0 +1,155 @@
+"""
+@file test_deadline.py
+A request's time budget cancels the work still running when it runs out, skips waits that would outlast it,
+and turns into a fast 504 from /api/generate-question (a 504 error event from the explanation stream).
+"""
+
+import time
+import json
+import asyncio
+
+import pytest
+from types import SimpleNamespace
+
+from backend import generative, routes
+from backend.deadline import Deadline, DeadlineExceeded, NO_DEADLINE
+from backend.models import QuestionRequest, ExplanationRequest
+
+class RateLimited(Exception):
+    status_code = 429
+
+def test_run_cancels_work_past_the_deadline():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def scenario():
+        deadline = Deadline(0.05)
+        with pytest.raises(DeadlineExceeded) as info:
+            await deadline.run(slow(), "model_call")
+        # Nothing is started once the budget is gone
+        with pytest.raises(DeadlineExceeded):
+            await deadline.run(slow(), "database")
+        return info.value
+
+    error = asyncio.run(scenario())
+    assert error.stage == "model_call"
+    assert cancelled == [True]
+
+def test_waits_that_would_outlast_the_deadline_fail_at_once():
+    async def scenario():
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            await Deadline(1).sleep(5, "backoff")
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 0.1
+    assert Deadline(1).cap(30) <= 1
+    assert NO_DEADLINE.cap(30) == 30
+
+def test_timeouts_of_the_work_itself_pass_through():
+    async def times_out():
+        await asyncio.wait_for(asyncio.sleep(1), 0.01)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(Deadline(5).run(times_out(), "model_call"))
+
+def test_generation_stops_at_the_deadline_without_fallback(monkeypatch):
+    sent = []
+
+    async def slow_send(request_params, priority, endpoint):
+        sent.append(request_params["model"])
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(generative, "validate_model", lambda model: None)
+    monkeypatch.setattr(generative, "_send_request", slow_send)
+
+    async def scenario():
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            await generative.call_generative_model("prompt", "slow-model", endpoint="generate_question", deadline=Deadline(0.1))
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 1
+    assert sent == ["slow-model"]
+
+def test_rate_limit_backoff_longer_than_the_budget_is_skipped(monkeypatch):
+    async def rate_limited(request_params, priority, endpoint):
+        raise RateLimited("Error code: 429")
+
+    monkeypatch.setattr(generative, "validate_model", lambda model: None)
+    monkeypatch.setattr(generative, "_send_request", rate_limited)
+
+    async def scenario():
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded) as info:
+            await generative.call_generative_model("prompt", "busy-model", endpoint="generate_question", deadline=Deadline(1))
+        return time.monotonic() - started, info.value
+
+    elapsed, error = asyncio.run(scenario())
+    assert elapsed < 0.5
+    assert error.stage == "backoff"
+
+def test_generate_question_answers_504_when_the_budget_runs_out(monkeypatch):
+    async def slow_generation(req, deadline):
+        await deadline.run(asyncio.sleep(10), "model_call")
+
+    async def no_archived_question(game_id, cache_key):
+        return None
+
+    monkeypatch.setattr(routes, "GENERATION_DEADLINE_SECONDS", 0.1)
+    monkeypatch.setattr(routes, "_generate_question", slow_generation)
+    monkeypatch.setattr(routes.question_archive, "take", no_archived_question)
+    monkeypatch.setattr(routes.telemetry, "log_error", lambda *args, **kwargs: None)
+    req = QuestionRequest(model="trivia", gameId="game-1", category="Historia", gameMode="mcq", knowledgeLevel="intermediate",
+                          language="pl", theme=None, includeCategoryTheme=True)
+
+    started = time.monotonic()
+    response = asyncio.run(routes.generate_question(req))
+    assert time.monotonic() - started < 1
+    assert response.status_code == 504
+    body = json.loads(response.body)
+    assert body["stage"] == "model_call"
+    assert body["budget_seconds"] == 0.1
+
+def test_explanation_stream_sends_a_timeout_event_when_no_text_arrives_in_time(monkeypatch):
+    fallback_calls = []
+
+    async def create(**kwargs):
+        async def chunks():
+            await asyncio.sleep(10)
+            yield None
+        return chunks()
+
+    async def fallback(*args, **kwargs):
+        fallback_calls.append(args)
+
+    async def not_cached(model, prompt, endpoint):
+        return None
+
+    monkeypatch.setattr(routes, "GENERATION_DEADLINE_SECONDS", 0.1)
+    monkeypatch.setattr(routes, "call_generative_model", fallback)
+    monkeypatch.setattr(routes.response_cache, "get", not_cached)
+    monkeypatch.setattr(routes.telemetry, "log_error", lambda *args, **kwargs: None)
+    monkeypatch.setattr(generative, "validate_model", lambda model: None)
+    monkeypatch.setattr(generative, "client", SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    req = ExplanationRequest(model="trivia", question="Kiedy?", correct_answer="1410", player_answer="1920", language="pl", gameId="game-1")
+
+    async def scenario():
+        response = await routes.stream_incorrect_explanation(req)
+        return [event async for event in response.body_iterator]
+
+    started = time.monotonic()
+    events = asyncio.run(scenario())
+    assert time.monotonic() - started < 1
+    assert len(events) == 1 and events[0].startswith("event: error\n")
+    body = json.loads(events[0].split("data: ", 1)[1])
+    assert body["status_code"] == 504
+    assert body["detail"].startswith("Explaining the answer timed out: ")
+    # The budget is gone, so there is no non-streamed fallback either
+    assert fallback_calls == []
@@ -0,0 +1,92 @@
+"""
+@file test_error_logs.py
+Identical errors are rolled up per bucket with one full row, retention trims raw rows by age and count, the
+summary reports per-model rates, and error logs are filtered by the same model make_error_entry rolls them up under.
+"""
+
+import time
+
+from backend import database
+
+async def collect(rows):
+    return [row async for row in rows]
+
+def test_model_filter_reads_top_level_and_request_models(db):
+    async def scenario():
+        await database.log_error_db("stream", {"model": "m1", "error": "top level"})
+        await database.log_error_db("generate_question", {"request": {"model": "m2"}, "error": "in request"})
+        await database.log_error_db("generate_question", {"model": "", "request": {"model": "m2"}, "error": "empty top level"})
+        return (await collect(database.iter_error_logs(10, model="m1")),
+                await collect(database.iter_error_logs(10, model="m2")))
+
+    m1, m2 = db.run(scenario)
+    assert [row["endpoint"] for row in m1] == ["stream"]
+    assert [row["endpoint"] for row in m2] == ["generate_question", "generate_question"]
+    # The rollups (and so the error summary) agree
+    entry = database.make_error_entry("generate_question", {"request": {"model": "m2"}, "error": "in request"})
+    assert entry[2] == "m2"
+
+async def rows(sql, params=()):
+    async with database.read_connection() as conn:
+        async with conn.execute(sql, params) as cursor:
+            return [tuple(row) for row in await cursor.fetchall()]
+
+def test_identical_errors_roll_up_with_one_full_row_per_bucket(db):
+    bucket = database.ERROR_ROLLUP_BUCKET_SECONDS
+    start = (int(time.time()) // bucket) * bucket
+
+    async def scenario():
+        entries = [
+            # Numbers are masked, so these three share a signature
+            database.make_error_entry("preload", {"model": "m1", "error": "Timed out after 12s"}, start + 1),
+            database.make_error_entry("preload", {"model": "m1", "error": "Timed out after 30s"}, start + 2),
+            database.make_error_entry("preload", {"request": {"model": "m1"}, "error": "Timed out after 7s"}, start + 3),
+            database.make_error_entry("preload", {"model": "m1", "error": "Timed out after 5s"}, start + bucket + 1),
+            database.make_error_entry("preload", {"model": "m2", "error": "Timed out after 5s"}, start + 4),
+        ]
+        async with database.write_connection() as conn:
+            await database._write_errors(conn, entries)
+        return (await rows("SELECT bucket_start, model, error_signature, count FROM error_rollups ORDER BY bucket_start, model"),
+                await rows("SELECT error_details_json FROM error_logs"))
+
+    rollups, logs = db.run(scenario)
+    assert rollups == [(start, "m1", "Timed out after #s", 3), (start, "m2", "Timed out after #s", 1),
+                       (start + bucket, "m1", "Timed out after #s", 1)]
+    # The first occurrence of each rollup keeps its full details
+    assert len(logs) == 3
+    assert '"Timed out after 12s"' in logs[0][0]
+
+def test_compaction_enforces_age_row_count_and_rollup_retention(db):
+    async def scenario():
+        for n in range(6):
+            await database.log_error_db("generate_question", {"model": "m1", "error": f"error kind {'abcdef'[n]}"})
+        async with database.write_connection() as conn:
+            await conn.execute("UPDATE error_logs SET timestamp = '2000-01-01 00:00:00' WHERE id <= 2")
+            await conn.execute("UPDATE error_rollups SET bucket_start = 0 WHERE error_signature = 'error kind a'")
+        result = await database.compact_error_logs(max_age_days=1, max_rows=3, rollup_retention_days=30)
+        return result, await rows("SELECT id FROM error_logs ORDER BY id"), await rows("SELECT COUNT(*) FROM error_rollups")
+
+    result, remaining, rollups = db.run(scenario)
+    assert result == {"expired_rows": 2, "overflow_rows": 1, "expired_rollups": 1}
+    # The newest max_rows rows are kept
+    assert remaining == [(4,), (5,), (6,)]
+    assert rollups == [(5,)]
+
+def test_summary_reports_per_model_rates(db):
+    async def scenario():
+        for _ in range(3):
+            await database.log_error_db("generate_question", {"request": {"model": "m1"}, "error": "invalid"})
+        await database.log_error_db("live_quiz", {"model": "m2", "error": "timeout"})
+        for _ in range(3):
+            await database.update_model_stats_db("m1", True, 1.0)
+        await database.update_model_stats_db("m1", False, 1.0)
+        return await database.get_error_summary(7200)
+
+    summary = db.run(scenario)
+    by_model = {row["model"]: row for row in summary["by_model"]}
+    assert by_model["m1"]["errors"] == 3
+    assert by_model["m1"]["errors_per_hour"] == 1.5
+    assert by_model["m1"]["lifetime_error_rate"] == 0.25
+    assert by_model["m2"]["lifetime_error_rate"] is None
+    assert [(row["endpoint"], row["errors"]) for row in summary["by_endpoint"]] == [("generate_question", 3), ("live_quiz", 1)]
+    assert summary["top_signatures"][0]["errors"] == 3
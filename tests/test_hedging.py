@@ -0,0 +1,121 @@
+"""
+@file test_hedging.py
+Hedged requests: a slow primary is duplicated after the percentile delay, the budget caps hedges, and the
+losing request is cancelled.
+"""
+
+import asyncio
+
+import pytest
+
+from backend.hedging import HedgePolicy
+
+def make_policy(**kwargs):
+    params = dict(enabled=True, percentile=0.95, budget=1.0, min_samples=5, min_delay_ms=0, alternate_model="")
+    params.update(kwargs)
+    policy = HedgePolicy(**params)
+    for _ in range(20):
+        policy.observe("q", 0.02)
+    return policy
+
+def sender(latencies, log, queued=0.0):
+    """
+    send(model, admitted) that waits `queued` for a limiter slot, then sleeps latencies[model] (popping per call
+    when it is a list) and logs its outcome.
+    """
+    async def send(model, admitted):
+        await asyncio.sleep(queued)
+        admitted.set()
+        latency = latencies[model]
+        if isinstance(latency, list):
+            latency = latency.pop(0)
+        try:
+            await asyncio.sleep(latency)
+        except asyncio.CancelledError:
+            log.append(("cancelled", model))
+            raise
+        log.append(("done", model))
+        return model
+    return send
+
+def test_slow_primary_loses_to_hedge():
+    policy = make_policy(alternate_model="fast")
+    log = []
+    response, model = asyncio.run(policy.run("q", "slow", sender({"slow": 1.0, "fast": 0.01}, log), lambda r: True))
+    assert (response, model) == ("fast", "fast")
+    assert ("cancelled", "slow") in log
+    stats = policy.stats()["endpoints"]["q"]
+    assert stats["hedges_sent"] == 1 and stats["hedge_wins"] == 1
+
+def test_fast_primary_is_not_hedged():
+    policy = make_policy(alternate_model="other")
+    log = []
+    _, model = asyncio.run(policy.run("q", "main", sender({"main": 0.001, "other": 0.001}, log), lambda r: True))
+    assert model == "main"
+    assert log == [("done", "main")]
+    assert policy.stats()["endpoints"]["q"]["hedges_sent"] == 0
+
+def test_no_hedge_before_min_samples():
+    policy = HedgePolicy(enabled=True, budget=1.0, min_samples=50, min_delay_ms=0)
+    for _ in range(20):
+        policy.observe("q", 0.01)
+    _, model = asyncio.run(policy.run("q", "main", sender({"main": 0.1}, []), lambda r: True))
+    assert model == "main"
+    assert policy.stats()["endpoints"]["q"]["no_baseline"] == 1
+
+def test_budget_caps_hedges():
+    policy = make_policy(budget=0.25)
+    policy._credit = 0.0
+
+    async def run():
+        for _ in range(20):
+            await policy.run("q", "main", sender({"main": [0.05, 0.05]}, []), lambda r: True)
+
+    asyncio.run(run())
+    stats = policy.stats()["endpoints"]["q"]
+    assert stats["hedges_sent"] == 5
+    assert stats["budget_denied"] == 15
+
+def test_unacceptable_hedge_falls_back_to_primary():
+    policy = make_policy(alternate_model="bad")
+    response, model = asyncio.run(policy.run("q", "good", sender({"good": 0.1, "bad": 0.01}, []), lambda r: r == "good"))
+    assert (response, model) == ("good", "good")
+
+def test_primary_error_is_raised_when_not_hedged():
+    policy = make_policy(enabled=False)
+
+    async def failing(model, admitted):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(policy.run("q", "main", failing, lambda r: True))
+
+def test_time_queued_for_a_slot_does_not_trigger_a_hedge():
+    policy = make_policy(alternate_model="other")
+    log = []
+    # Queued far longer than the hedge delay, then answered quickly
+    _, model = asyncio.run(policy.run("q", "main", sender({"main": 0.001, "other": 0.001}, log, queued=0.2), lambda r: True))
+    assert model == "main"
+    assert log == [("done", "main")]
+    assert policy.stats()["endpoints"]["q"]["hedges_sent"] == 0
+
+def test_fast_invalid_hedge_does_not_beat_a_valid_primary(monkeypatch):
+    from types import SimpleNamespace
+    from backend import generative
+
+    contents = {"slow": '{"question": "valid"}', "fast": '{"question": ""}'}
+    latencies = {"slow": 0.2, "fast": 0.01}
+
+    async def send(request_params, priority, endpoint, admitted=None):
+        admitted.set()
+        model = request_params["model"]
+        await asyncio.sleep(latencies[model])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=contents[model]))], usage=None)
+
+    monkeypatch.setattr(generative, "validate_model", lambda model: None)
+    monkeypatch.setattr(generative, "_send_request", send)
+    monkeypatch.setattr(generative, "hedge_policy", make_policy(alternate_model="fast"))
+    data = asyncio.run(generative.call_generative_model("prompt", "slow", endpoint="q", hedge=True,
+                                                        validator=lambda d: bool(d.get("question"))))
+    assert data == {"question": "valid"}
+    assert generative.hedge_policy.stats()["endpoints"]["q"]["primary_wins"] == 1
@@ -0,0 +1,90 @@
+"""
+@file test_json_extract.py
+The scanner finds the outermost JSON value around fences and prose, ignores structure inside strings,
+drops trailing commas, repairs truncated output only when asked (a cut-off question is rejected, a cut-off batch
+keeps its complete questions) and gives the same result however the text is split.
+"""
+
+import json
+
+import pytest
+
+from backend.json_extract import JsonScanner, JsonTruncatedError, extract_json
+from backend.utils import extract_json_from_response, extract_question_batch_from_response, is_question_valid
+
+QUESTION = {"question": "Co oznacza {x} w \"szablonie\"?", "options": ["a}", "[b", "c,", "d\\"], "answer": "a}"}
+
+def scan(*chunks):
+    scanner = JsonScanner()
+    for chunk in chunks:
+        scanner.feed(chunk)
+    return scanner
+
+@pytest.mark.parametrize("text", [
+    json.dumps(QUESTION),
+    "```json\n" + json.dumps(QUESTION, indent=2) + "\n```",
+    "Here is the question you asked for: " + json.dumps(QUESTION) + "\nGood luck! {not json}",
+    "  \n```\n" + json.dumps(QUESTION) + "```",
+])
+def test_outermost_value_is_found(text):
+    assert extract_json(text) == QUESTION
+
+def test_nested_objects_and_brackets_inside_strings():
+    data = {"questions": [QUESTION, {"nested": {"deep": [1, {"x": "}]"}]}}]}
+    assert extract_json("Batch:\n" + json.dumps(data) + "\n-- end") == data
+
+def test_bare_list_and_prose_with_brackets():
+    assert extract_json('[{"a": 1}, {"a": 2}] trailing') == [{"a": 1}, {"a": 2}]
+    # A response starting with prose only starts its value at a '{'
+    assert extract_json('Answer [see below]: {"a": 1}') == {"a": 1}
+
+def test_trailing_commas_are_dropped():
+    assert extract_json('```json\n{"a": [1, 2, ], "b": {"c": "x,"},\n}\n```') == {"a": [1, 2], "b": {"c": "x,"}}
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1, "b": "tex', {"a": 1, "b": "tex"}),
+    ('{"a": 1, "b', {"a": 1}),
+    ('{"a": 1, "b": ', {"a": 1}),
+    ('{"a": 1, "b": 2', {"a": 1}),
+    ('{"a": [1, 2, {"c": "d"', {"a": [1, 2, {"c": "d"}]}),
+    ('{"a": "x\\u00', {"a": "x"}),
+    ('{"a": "x\\', {"a": "x"}),
+    ('{"questions": [{"q": 1}, {"q": 2}, {"q"', {"questions": [{"q": 1}, {"q": 2}, {}]}),
+])
+def test_truncated_output_is_closed(text, expected):
+    with pytest.raises(JsonTruncatedError):
+        extract_json(text)
+    assert extract_json(text, repair=True) == expected
+
+def test_truncated_question_is_rejected():
+    question = {**QUESTION, "explanation_correct": "Bo tak jest napisane w podręczniku."}
+    assert is_question_valid(question, "mcq")[0]
+    # Cut inside the explanation: repaired, it would pass as a whole question
+    text = json.dumps(question)[:-12]
+    assert is_question_valid(extract_json(text, repair=True), "mcq")[0]
+    data = extract_json_from_response(text)
+    assert list(data) == ["error"]
+    assert not is_question_valid(data, "mcq")[0]
+    assert extract_question_batch_from_response(text) == {"questions": []}
+
+def test_truncated_batch_keeps_its_complete_questions():
+    text = json.dumps({"questions": [QUESTION, QUESTION, QUESTION]})
+    assert extract_question_batch_from_response(text) == {"questions": [QUESTION] * 3}
+    assert extract_question_batch_from_response(text[:-20]) == {"questions": [QUESTION] * 2}
+
+def test_any_split_gives_the_same_result():
+    text = "```json\n" + json.dumps({"questions": [QUESTION, QUESTION]}, ensure_ascii=True) + ",\n```"
+    expected = extract_json(text)
+    for split in range(len(text) + 1):
+        scanner = scan(text[:split], text[split:])
+        assert scanner.complete
+        assert scanner.value() == expected
+    assert scan(*text).value() == expected
+
+def test_errors():
+    with pytest.raises(ValueError):
+        extract_json("no json here")
+    with pytest.raises(ValueError):
+        extract_json("{'single': 'quotes'}")
+    assert extract_json_from_response("") == {"error": "Input text is empty or invalid."}
+    assert list(extract_json_from_response("I can't help with that.")) == ["error"]
@@ -0,0 +1,176 @@
+"""
+@file test_limiter.py
+The adaptive limiter grows while calls are healthy, backs off on 429s and timeouts, and honors Retry-After.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from backend.limiter import AdaptiveLimiter, retry_after_seconds
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, headers=None):
+        super().__init__("Error code: 429 - Too Many Requests")
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+def make_limiter(**kwargs):
+    params = dict(initial_limit=2, min_limit=1, max_limit=8, rate_count=1000, rate_period=1, max_rate_count=4000, adaptive=True)
+    params.update(kwargs)
+    return AdaptiveLimiter(**params)
+
+async def call(limiter, seconds=0.01, error=None):
+    async with limiter.slot():
+        await asyncio.sleep(seconds)
+        if error is not None:
+            raise error
+
+def test_limit_grows_while_saturated_and_healthy():
+    limiter = make_limiter()
+
+    async def run():
+        await asyncio.gather(*(call(limiter) for _ in range(60)))
+
+    asyncio.run(run())
+    assert limiter.limit > 2
+    assert limiter.increases > 0
+    assert limiter.inflight == 0
+
+def test_rate_limit_halves_limit_and_rate():
+    limiter = make_limiter(initial_limit=8)
+    rate = limiter.rate
+
+    async def run():
+        with pytest.raises(RateLimited):
+            await call(limiter, error=RateLimited())
+
+    asyncio.run(run())
+    assert limiter.limit == 4
+    assert limiter.rate == rate / 2
+    assert limiter.stats()["rate_limited"] == 1
+
+def test_decreases_once_per_round():
+    limiter = make_limiter(initial_limit=8)
+
+    async def run():
+        results = await asyncio.gather(*(call(limiter, error=TimeoutError()) for _ in range(8)), return_exceptions=True)
+        assert all(isinstance(r, TimeoutError) for r in results)
+
+    asyncio.run(run())
+    assert limiter.limit == 4
+    assert limiter.decreases == 1
+
+def test_retry_after_holds_new_calls():
+    limiter = make_limiter()
+
+    async def run():
+        with pytest.raises(RateLimited):
+            await call(limiter, error=RateLimited({"retry-after-ms": "200"}))
+        assert limiter.stats()["retry_after_remaining_seconds"] > 0
+        start = time.monotonic()
+        await call(limiter, seconds=0)
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.15
+
+def test_fixed_limits_when_not_adaptive():
+    limiter = make_limiter(adaptive=False)
+
+    async def run():
+        await asyncio.gather(*(call(limiter) for _ in range(20)))
+        with pytest.raises(RateLimited):
+            await call(limiter, error=RateLimited())
+
+    asyncio.run(run())
+    assert limiter.limit == 2
+    assert limiter.stats()["queued"] == 0
+
+def test_retry_after_parsing():
+    assert retry_after_seconds(RateLimited({"retry-after": "3"})) == 3
+    assert retry_after_seconds(RateLimited({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0
+    assert retry_after_seconds(RateLimited({"retry-after": "soon"})) is None
+    assert retry_after_seconds(RateLimited()) is None
+
+def test_interactive_overtakes_queued_background_work():
+    limiter = make_limiter(initial_limit=1, max_limit=1)
+    order = []
+
+    async def job(name, priority):
+        async with limiter.slot(priority):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        first = asyncio.create_task(job("first", "bulk"))
+        await asyncio.sleep(0)
+        background = [asyncio.create_task(job(f"prefetch{i}", "prefetch")) for i in range(3)]
+        await asyncio.sleep(0)
+        player = asyncio.create_task(job("player", "interactive"))
+        await asyncio.gather(first, player, *background)
+
+    asyncio.run(run())
+    assert order[:2] == ["first", "player"]
+    classes = limiter.stats()["classes"]
+    assert classes["prefetch"]["admitted"] == 3
+    assert classes["prefetch"]["wait_mean_ms"] > classes["interactive"]["wait_mean_ms"]
+
+def test_reserved_slots_stay_free_for_foreground():
+    limiter = make_limiter(initial_limit=4, max_limit=4, reserved_share=0.5, adaptive=False)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def hold(priority):
+            async with limiter.slot(priority):
+                await release.wait()
+
+        tasks = [asyncio.create_task(hold("bulk")) for _ in range(4)]
+        await asyncio.sleep(0.01)
+        assert limiter.inflight == 2
+        live = asyncio.create_task(hold("live"))
+        await asyncio.sleep(0.01)
+        assert limiter.stats()["classes"]["live"]["inflight"] == 1
+        release.set()
+        await asyncio.gather(live, *tasks)
+
+    asyncio.run(run())
+    assert limiter.inflight == 0
+
+def test_waiting_work_ages_past_newer_foreground_work():
+    limiter = make_limiter(initial_limit=1, max_limit=1, aging_seconds=0.1, adaptive=False)
+    order = []
+
+    async def job(name, priority, seconds=0.01):
+        async with limiter.slot(priority):
+            order.append(name)
+            await asyncio.sleep(seconds)
+
+    async def run():
+        first = asyncio.create_task(job("first", "interactive", seconds=0.5))
+        await asyncio.sleep(0)
+        old_bulk = asyncio.create_task(job("bulk", "bulk"))
+        await asyncio.sleep(0.45)
+        player = asyncio.create_task(job("player", "interactive"))
+        await asyncio.gather(first, old_bulk, player)
+
+    asyncio.run(run())
+    assert order == ["first", "bulk", "player"]
+
+def test_cancelled_waiter_leaves_queue():
+    limiter = make_limiter(initial_limit=1, max_limit=1)
+
+    async def run():
+        holder = asyncio.create_task(call(limiter, seconds=0.05))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(call(limiter))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(holder, waiter, return_exceptions=True)
+        await call(limiter, seconds=0)
+
+    asyncio.run(run())
+    assert limiter.inflight == 0
+    assert limiter.stats()["queued"] == 0
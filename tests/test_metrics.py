@@ -0,0 +1,36 @@
+"""
+@file test_metrics.py
+Latency histograms must give the same percentiles before and after they are flushed to SQLite.
+"""
+
+from backend import database
+from backend.metrics import LatencyHistograms, LATENCY_BUCKETS_MS, estimate_percentile
+
+def test_percentiles_interpolate_within_buckets():
+    counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    counts[LATENCY_BUCKETS_MS.index(1000)] = 90   # 750-1000 ms
+    counts[LATENCY_BUCKETS_MS.index(10000)] = 10  # 7500-10000 ms
+    assert 750 < estimate_percentile(counts, 0.50) <= 1000
+    assert 7500 < estimate_percentile(counts, 0.95) <= 10000
+    assert estimate_percentile([0] * len(counts), 0.5) is None
+
+def test_window_stats_merge_flushed_and_pending(db):
+    async def scenario():
+        histograms = LatencyHistograms()
+        for i in range(100):
+            histograms.observe("trivia", "generate_question", 0.8 if i < 95 else 12.0, success=i % 10 != 0)
+        before = await histograms.window_stats(3600)
+        await histograms.flush(everything=True)
+        histograms.observe("trivia", "preload", 0.2)
+        after = await histograms.window_stats(3600)
+        return before, after
+
+    before, after = db.run(scenario)
+    rows = {(row["model"], row["endpoint"]): row for row in after}
+    question_row = rows[("trivia", "generate_question")]
+    assert [r for r in before if r["endpoint"] == "generate_question"][0] == question_row
+    assert question_row["requests"] == 100
+    assert question_row["error_rate"] == 0.1
+    assert 750 < question_row["p50_ms"] <= 1000
+    assert 10000 < question_row["p99_ms"] <= 15000
+    assert rows[("trivia", "all")]["requests"] == 101
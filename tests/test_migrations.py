@@ -0,0 +1,77 @@
+"""
+@file test_migrations.py
+Databases created by older builds (user_version 0) must upgrade in place without losing data.
+"""
+
+import sqlite3
+
+from backend import database
+
+LEGACY_SCHEMA = """
+CREATE TABLE generated_questions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, model TEXT NOT NULL, language TEXT NOT NULL,
+    category TEXT NOT NULL, knowledge_level TEXT NOT NULL, game_mode TEXT NOT NULL,
+    theme TEXT, question_text TEXT NOT NULL UNIQUE, answer_text TEXT NOT NULL,
+    explanation TEXT, subcategory TEXT, key_entities_json TEXT, options_json TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE preloaded_questions_cache (id INTEGER PRIMARY KEY AUTOINCREMENT, category TEXT NOT NULL, question_data_json TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE prompt_history (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, model TEXT, prompt TEXT, raw_response TEXT);
+CREATE TABLE question_blueprints (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, category TEXT NOT NULL, subcategory TEXT NOT NULL, modifier TEXT,
+    target_answer TEXT NOT NULL, is_used BOOLEAN DEFAULT 0, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_blueprints_cat_used ON question_blueprints(category, is_used);
+INSERT INTO generated_questions (model, language, category, knowledge_level, game_mode, question_text, answer_text)
+VALUES ('trivia', 'pl', 'Historia', 'basic', 'mcq', 'Kto?', 'Ja');
+INSERT INTO prompt_history (model, prompt, raw_response) VALUES ('trivia', 'p1', 'r1'), ('trivia', 'p2', 'r2');
+INSERT INTO question_blueprints (category, subcategory, target_answer) VALUES ('Historia', 's', 't');
+"""
+
+def test_legacy_database_is_upgraded_in_place(db):
+    conn = sqlite3.connect(db.path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.close()
+
+    async def scenario():
+        # A second startup must find nothing left to apply
+        assert await database._apply_migrations() == database.SCHEMA_VERSION
+        history = [row async for row in database.iter_prompt_history(10)]
+        return history, await database.get_blueprint_count("Historia"), await database.pick_archived_question(("Historia", "pl", "basic", "mcq", ""), [])
+
+    history, blueprints, archived = db.run(scenario)
+    assert [row["prompt"] for row in history] == ["p2", "p1"]
+    assert blueprints == 1
+    assert archived["question"] == "Kto?"
+
+    conn = sqlite3.connect(db.path)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == database.SCHEMA_VERSION
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert "idx_blueprints_cat_used" not in indexes
+        assert {"idx_blueprints_claim", "idx_cache_key", "idx_generated_lookup", "idx_error_logs_model"} <= indexes
+    finally:
+        conn.close()
+
+def test_legacy_prompt_history_keeps_the_newest_rows_in_their_ring_slots(db, monkeypatch):
+    monkeypatch.setattr(database, "PROMPT_HISTORY_CAPACITY", 4)
+    conn = sqlite3.connect(db.path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.executemany("INSERT INTO prompt_history (model, prompt, raw_response) VALUES ('trivia', ?, 'r')",
+                     [(f"p{n}",) for n in range(3, 9)])
+    conn.commit()
+    conn.close()
+
+    async def scenario():
+        # The sequence continues after the migrated rows
+        await database.add_prompt_history_db({"timestamp": "2024-01-01T00:00:00", "model": "trivia", "prompt": "p9", "raw_response": "r"})
+        return [row async for row in database.iter_prompt_history(10)]
+
+    history = db.run(scenario)
+    assert [(row["id"], row["prompt"]) for row in history] == [(9, "p9"), (8, "p8"), (7, "p7"), (6, "p6")]
+
+    conn = sqlite3.connect(db.path)
+    try:
+        assert conn.execute("SELECT slot, id FROM prompt_history ORDER BY slot").fetchall() == [(0, 8), (1, 9), (2, 6), (3, 7)]
+    finally:
+        conn.close()
@@ -0,0 +1,97 @@
+"""
+@file test_model_health.py
+Per-model circuit breakers open on repeated failures, admit one trial request after the cooldown, and
+route fallback and random choices away from unhealthy models.
+"""
+
+import pytest
+
+from backend import config
+from backend.model_health import ModelHealthTracker, ModelUnavailableError, OPEN, HALF_OPEN, CLOSED
+
+class RateLimited(Exception):
+    status_code = 429
+
+def make_tracker(**kwargs):
+    params = dict(enabled=True, failure_threshold=3, failure_rate=0.5, cooldown_seconds=0, max_cooldown_seconds=0)
+    params.update(kwargs)
+    return ModelHealthTracker(**params)
+
+def test_consecutive_failures_open_the_circuit():
+    tracker = make_tracker(cooldown_seconds=60, max_cooldown_seconds=60)
+    for _ in range(3):
+        tracker.acquire("a")
+        tracker.record_failure("a", RuntimeError("boom"))
+    assert tracker.stats()["models"]["a"]["state"] == OPEN
+    assert not tracker.available("a")
+    with pytest.raises(ModelUnavailableError):
+        tracker.acquire("a")
+
+def test_invalid_responses_count_as_failures():
+    tracker = make_tracker(cooldown_seconds=60, max_cooldown_seconds=60)
+    for _ in range(3):
+        tracker.record_success("a", 0.1)
+        tracker.record_validation("a", False)
+    assert tracker.stats()["models"]["a"]["state"] == OPEN
+
+def test_rate_limits_and_cancellations_are_not_failures():
+    tracker = make_tracker()
+    for _ in range(5):
+        tracker.record_failure("a", RateLimited("Error code: 429"))
+    tracker.record_failure("a", KeyboardInterrupt())
+    assert tracker.stats()["models"]["a"]["state"] == CLOSED
+    assert tracker.stats()["models"]["a"]["failures"] == 0
+
+def test_half_open_admits_one_trial_and_closes_on_success():
+    tracker = make_tracker()
+    for _ in range(3):
+        tracker.record_failure("a", RuntimeError("boom"))
+    tracker.acquire("a")
+    assert tracker._models["a"].state == HALF_OPEN
+    with pytest.raises(ModelUnavailableError):
+        tracker.acquire("a")
+    tracker.record_success("a", 0.1)
+    assert tracker._models["a"].state == CLOSED
+    tracker.acquire("a")
+
+def test_failed_trial_reopens_with_longer_cooldown():
+    tracker = make_tracker(cooldown_seconds=10, max_cooldown_seconds=100)
+    for _ in range(3):
+        tracker.record_failure("a", RuntimeError("boom"))
+    health = tracker._models["a"]
+    health.open_until = 0
+    tracker.acquire("a")
+    tracker.record_failure("a", RuntimeError("still broken"))
+    assert health.state == OPEN
+    assert health.cooldown == 20
+
+def test_cancelled_trial_frees_the_probe():
+    tracker = make_tracker()
+    for _ in range(3):
+        tracker.record_failure("a", RuntimeError("boom"))
+    tracker.acquire("a")
+    tracker.record_failure("a", KeyboardInterrupt())
+    assert tracker.available("a")
+
+def test_fallback_prefers_configured_model_then_healthiest(monkeypatch):
+    monkeypatch.setattr(config, "FALLBACK_MODEL", "fb")
+    monkeypatch.setattr(config, "ALLOWED_MODELS", {"a", "b", "c", "fb"})
+    monkeypatch.setattr(config, "DYNAMIC_MODELS", None)
+    tracker = make_tracker(cooldown_seconds=60, max_cooldown_seconds=60)
+    assert tracker.fallback_for("a") == "fb"
+    for _ in range(3):
+        tracker.record_failure("fb", RuntimeError("boom"))
+    tracker.record_success("b", 0.1)
+    tracker.record_success("c", 0.1)
+    tracker.record_validation("c", False)
+    assert tracker.fallback_for("a") == "b"
+    assert tracker.fallback_for("a", exclude={"b", "c"}) is None
+
+def test_random_selection_avoids_open_models(monkeypatch):
+    monkeypatch.setattr(config, "MODELS_BY_LANGUAGE", {"pl": ["a", "b"], "en": []})
+    tracker = make_tracker(cooldown_seconds=60, max_cooldown_seconds=60)
+    for _ in range(3):
+        tracker.record_failure("a", RuntimeError("boom"))
+    assert {tracker.resolve_selection("random-pl") for _ in range(20)} == {"b"}
+    assert tracker.resolve_selection("random-en") == "random-en"
+    assert tracker.resolve_selection("some-model") == "some-model"
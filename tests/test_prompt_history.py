@@ -0,0 +1,52 @@
+"""
+@file test_prompt_history.py
+prompt_history is a ring buffer: entry n goes to slot n % capacity, overwriting the oldest, and reads stay
+newest-first across the wraparound and restarts.
+"""
+
+from backend import database
+
+CAPACITY = 4
+
+def entry(n):
+    return {"timestamp": "2024-01-01T00:00:00", "model": "trivia", "prompt": f"p{n}", "raw_response": f"r{n}"}
+
+async def slots():
+    async with database.read_connection() as conn:
+        async with conn.execute("SELECT slot, id FROM prompt_history ORDER BY slot") as cursor:
+            return [tuple(row) for row in await cursor.fetchall()]
+
+def test_ring_wraps_around_and_reads_newest_first(db, monkeypatch):
+    monkeypatch.setattr(database, "PROMPT_HISTORY_CAPACITY", CAPACITY)
+
+    async def scenario():
+        for n in range(1, 7):
+            await database.add_prompt_history_db(entry(n))
+        # A batch longer than the ring only keeps its last lap
+        async with database.write_connection() as conn:
+            await database._write_prompt_history(conn, [entry(n) for n in range(7, 13)])
+        first_page = [row async for row in database.iter_prompt_history(2)]
+        second_page = [row async for row in database.iter_prompt_history(10, before_id=first_page[-1]["id"])]
+        return first_page, second_page, await slots()
+
+    first_page, second_page, ring = db.run(scenario)
+    assert [row["prompt"] for row in first_page] == ["p12", "p11"]
+    assert [row["prompt"] for row in second_page] == ["p10", "p9"]
+    # p7 and p8 were dropped with the rest of the batch beyond one lap; p9-p12 took sequence numbers 7-10
+    assert [row["id"] for row in first_page + second_page] == [10, 9, 8, 7]
+    assert ring == [(0, 8), (1, 9), (2, 10), (3, 7)]
+
+def test_sequence_continues_after_a_restart(db, monkeypatch):
+    monkeypatch.setattr(database, "PROMPT_HISTORY_CAPACITY", CAPACITY)
+
+    def write(numbers):
+        async def scenario():
+            for n in numbers:
+                await database.add_prompt_history_db(entry(n))
+            return [row["id"] async for row in database.iter_prompt_history(10)], await slots()
+        return db.run(scenario)
+
+    write(range(1, 4))
+    ids, ring = write(range(4, 7))
+    assert ids == [6, 5, 4, 3]
+    assert ring == [(0, 4), (1, 5), (2, 6), (3, 3)]
@@ -0,0 +1,34 @@
+"""
+@file test_prompts.py
+The prompt registry keeps a stable prefix per prompt and rejects templates the code can't fill.
+"""
+
+import pytest
+
+from backend.prompts import PromptRegistry, prompt_registry
+from backend.config import PROMPTS
+from backend.utils import build_question_prompt
+
+PARAMS = {"language": "en", "knowledgeLevel": "basic", "gameMode": "mcq", "theme": "Space", "includeCategoryTheme": True}
+
+def test_question_prompts_share_a_byte_identical_prefix():
+    prefix = prompt_registry.get("generate_question", "en").prefix
+    first = build_question_prompt(PARAMS, "Astronomy")
+    second = build_question_prompt({**PARAMS, "knowledgeLevel": "expert"}, "Physics")
+    assert first.startswith(prefix + "\n\n") and second.startswith(prefix + "\n\n")
+    assert first != second
+
+def test_blueprint_prompt_renders_target_answer():
+    blueprint = {"subcategory": "Planets", "modifier": "", "target_answer": "Jupiter"}
+    prompt = build_question_prompt(PARAMS, "Astronomy", blueprint)
+    assert prompt.startswith(prompt_registry.get("generate_question_from_blueprint", "en").prefix)
+    assert "Jupiter" in prompt
+
+def test_unknown_placeholder_fails_at_load():
+    broken = {**PROMPTS, "explain_incorrect": {"en": {"static_instructions": ["x"], "task_template": "{question} {typo}"}}}
+    with pytest.raises(ValueError, match="typo"):
+        PromptRegistry(broken)
+
+def test_missing_value_is_reported():
+    with pytest.raises(ValueError, match="player_answer"):
+        prompt_registry.get("explain_incorrect", "en").render(question="Q", correct_answer="A")
@@ -0,0 +1,58 @@
+"""
+@file test_query_plans.py
+Hot queries must be answered from an index, never by scanning a table.
+"""
+
+import sqlite3
+
+import pytest
+
+from backend import database
+
+def explain(db_path, sql, params):
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    finally:
+        conn.close()
+
+@pytest.fixture
+def db_path(db):
+    # A migrated, empty database
+    db.run()
+    return db.path
+
+KEY = ("Historia", "pl", "basic", "mcq", "")
+
+HOT_QUERIES = {
+    "claim blueprint": (database._CLAIM_BLUEPRINT_SQL, ("Historia", 0.5), "idx_blueprints_claim"),
+    "count blueprints": ("SELECT COUNT(*) FROM question_blueprints WHERE category = ? AND is_used = 0", ("Historia",), "idx_blueprints_claim"),
+    "pick archived question": (database._PICK_ARCHIVED_SQL.format(op=">="), (*KEY[:4], None, 1, "[]"), "idx_generated_lookup"),
+    "archive by model": ("SELECT id FROM generated_questions WHERE model = ? AND created_at >= ? ORDER BY created_at", ("trivia", "2024-01-01"), "idx_generated_model_created"),
+    "cached question by key": (
+        "SELECT id, question_data_json FROM preloaded_questions_cache WHERE category = ? AND language = ? AND knowledge_level = ? AND game_mode = ? AND theme = ? ORDER BY id LIMIT 1",
+        KEY, "idx_cache_key"
+    ),
+    "prompt history page": (database._keyset_sql(database._PROMPT_HISTORY_SELECT, [], True), (100, 50), "idx_prompt_history_id"),
+    "error log page": (database._keyset_sql(database._ERROR_LOGS_SELECT, [], True), (100, 50), "PRIMARY KEY"),
+    "error log page by endpoint": (database._keyset_sql(database._ERROR_LOGS_SELECT, ["endpoint = ?"], True), ("generate_question", 100, 50), "idx_error_logs_endpoint"),
+    "error log page by model": (database._keyset_sql(database._ERROR_LOGS_SELECT, [f"{database.ERROR_LOG_MODEL_EXPR} = ?"], False), ("trivia", 50), "idx_error_logs_model"),
+    "error log retention": ("DELETE FROM error_logs WHERE timestamp < ?", ("2024-01-01 00:00:00",), "idx_error_logs_timestamp"),
+    "latency window": ("SELECT * FROM latency_histograms WHERE bucket_start >= ?", (0,), "sqlite_autoindex_latency_histograms_1"),
+    "response cache purge": ("DELETE FROM response_cache WHERE expires_at <= ?", (0,), "idx_response_cache_expires"),
+    "error summary": ("SELECT endpoint, SUM(count) FROM error_rollups WHERE bucket_start >= ? GROUP BY endpoint", (0,), "sqlite_autoindex_error_rollups_1"),
+}
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_uses_index(db_path, name):
+    sql, params, index = HOT_QUERIES[name]
+    plan = explain(db_path, sql, params)
+    assert any(index in step for step in plan), plan
+    assert not any(step.startswith("SCAN") and "json_each" not in step for step in plan), plan
+
+def test_schema_version_is_recorded(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == database.SCHEMA_VERSION
+    finally:
+        conn.close()
@@ -0,0 +1,53 @@
+"""
+@file test_question_batch.py
+A batch keeps its valid questions (archived and cached together) and drops the invalid ones.
+"""
+
+from backend import database, question_batch
+from backend.question_cache import question_cache, make_cache_key
+from backend.utils import build_question_batch_prompt
+from backend.config import PROMPTS
+
+PARAMS = {"language": "en", "knowledgeLevel": "basic", "gameMode": "mcq", "theme": "", "includeCategoryTheme": False}
+
+def make_item(i):
+    return {"question": f"Which option is number {i}?", "options": ["A", "B", "C", "D"], "answer": "A",
+            "subcategory": f"sub {i}", "explanation_correct": "Because."}
+
+def test_batch_stores_valid_items_and_drops_invalid(db, monkeypatch):
+    items = [make_item(1), {"question": "Broken?"}, make_item(2), make_item(3)]
+
+    async def fake_call(prompt, model, return_raw=False, endpoint="unknown", priority="interactive", hedge=False, validator=None, game_id=None, deadline=None, parse=None):
+        assert prompt.count(PROMPTS["generate_question"]["en"]["persona"]) == 1
+        return {"questions": items}, "{}"
+
+    monkeypatch.setattr(question_batch, "call_generative_model", fake_call)
+    key = make_cache_key("History", PARAMS)
+
+    async def scenario():
+        await question_cache.load()
+        served = await question_batch.generate_question_batch(PARAMS, "History", "trivia", 4, endpoint="test",
+                                                              priority="bulk", serve=1, use_blueprints=False)
+        cached = [question_cache.pop(key), question_cache.pop(key), question_cache.pop(key)]
+        async with database.read_connection() as conn:
+            async with conn.execute("SELECT COUNT(*) FROM generated_questions") as cursor:
+                archived = (await cursor.fetchone())[0]
+        await question_cache.load()
+        return served, cached, archived, question_cache.count(key)
+
+    served, cached, archived, reloaded = db.run(scenario)
+    assert [q["question"] for q in served] == [make_item(1)["question"]]
+    assert served[0]["archive_id"] is not None
+    assert [q["question"] for q in cached[:2]] == [make_item(2)["question"], make_item(3)["question"]]
+    assert cached[2] is None
+    assert archived == 3
+    assert reloaded == 2
+    assert question_batch.batch_stats["dropped"] >= 1
+
+def test_blueprint_batch_prompt_has_one_task_per_blueprint():
+    blueprints = [{"subcategory": f"sub {i}", "modifier": "", "target_answer": f"answer {i}"} for i in range(3)]
+    prompt = build_question_batch_prompt(PARAMS, "History", 10, blueprints)
+    assert prompt.count(PROMPTS["generate_question_from_blueprint"]["en"]["persona"]) == 1
+    assert all(f"BLUEPRINT {i}:" in prompt for i in (1, 2, 3))
+    assert "Create 3 DIFFERENT questions" in prompt
+    assert '{"questions": [ ... ]}' in prompt
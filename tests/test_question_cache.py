@@ -0,0 +1,87 @@
+"""
+@file test_question_cache.py
+The in-memory tier serves questions oldest first in O(1), is rebuilt from SQLite on startup, and never serves
+a popped question again: its row is deleted through the telemetry writer before the next startup.
+"""
+
+from backend import question_cache as question_cache_module
+from backend.question_cache import PreloadedQuestionCache, make_cache_key
+from backend.telemetry import TelemetryWriter
+
+PARAMS = {"language": "pl", "knowledgeLevel": "intermediate", "gameMode": "mcq", "theme": None, "includeCategoryTheme": False}
+KEY = make_cache_key("Historia", PARAMS)
+
+def question(text):
+    return {"question": text, "answer": "A", "options": ["A", "B", "C", "D"]}
+
+def test_pop_serves_oldest_first_and_counts(db, monkeypatch):
+    monkeypatch.setattr(question_cache_module, "telemetry_writer", TelemetryWriter())
+
+    async def scenario():
+        cache = PreloadedQuestionCache()
+        await cache.put(KEY, question("q1"))
+        await cache.put(KEY, question("q2"))
+        counts = [cache.count(KEY)]
+        served = [cache.pop(KEY), cache.pop(KEY), cache.pop(KEY)]
+        counts.append(cache.count(KEY))
+        return counts, served, cache.stats()
+
+    counts, served, stats = db.run(scenario)
+    assert counts == [2, 0]
+    assert [q["question"] if q else None for q in served] == ["q1", "q2", None]
+    assert (stats["hits"], stats["misses"], stats["total_depth"]) == (2, 1, 0)
+
+def test_popped_question_is_not_served_after_a_restart(db, monkeypatch):
+    writer = TelemetryWriter()
+    monkeypatch.setattr(question_cache_module, "telemetry_writer", writer)
+
+    async def first_run():
+        cache = PreloadedQuestionCache()
+        for text in ("q1", "q2", "q3"):
+            await cache.put(KEY, question(text))
+        served = cache.pop(KEY)
+        # The delete is only queued: the row is still in SQLite until the writer flushes
+        rebuilt = PreloadedQuestionCache()
+        await rebuilt.load()
+        pending = rebuilt.count(KEY)
+        # Shutdown drains the queue
+        await writer.stop()
+        return served, pending
+
+    async def second_run():
+        cache = PreloadedQuestionCache()
+        await cache.load()
+        return cache.count(KEY), cache.pop(KEY)
+
+    served, pending = db.run(first_run)
+    count, next_question = db.run(second_run)
+    assert served["question"] == "q1"
+    assert pending == 3
+    assert count == 2
+    assert next_question["question"] == "q2"
+
+def test_entries_are_isolated_by_language_level_mode_and_theme(db, monkeypatch):
+    monkeypatch.setattr(question_cache_module, "telemetry_writer", TelemetryWriter())
+    stored = {**PARAMS, "theme": "Starożytność", "includeCategoryTheme": True}
+    others = [
+        {**stored, "language": "en"},
+        {**stored, "knowledgeLevel": "expert"},
+        {**stored, "gameMode": "short_answer"},
+        {**stored, "theme": "Średniowiecze"},
+        # The theme only counts when it is part of the prompt
+        {**stored, "includeCategoryTheme": False},
+    ]
+
+    async def scenario():
+        cache = PreloadedQuestionCache()
+        await cache.put(make_cache_key("Historia", stored), question("q1"))
+        # Also through the composite key columns in SQLite
+        rebuilt = PreloadedQuestionCache()
+        await rebuilt.load()
+        return ([c.count(make_cache_key("Historia", params)) for c in (cache, rebuilt) for params in others],
+                rebuilt.pop(make_cache_key("Historia", stored)))
+
+    misses, hit = db.run(scenario)
+    assert misses == [0] * 10
+    assert hit["question"] == "q1"
+    assert make_cache_key("Historia", {**PARAMS, "theme": "Starożytność"}) == KEY
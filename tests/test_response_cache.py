@@ -0,0 +1,42 @@
+"""
+@file test_response_cache.py
+The response cache must evict by LRU, expire by TTL and survive restarts through its SQLite tier.
+"""
+
+import asyncio
+
+from backend import database
+from backend.response_cache import ResponseCache
+
+CATEGORIES = {"categories": ["A", "B", "C", "D", "E", "F"]}
+
+def test_lru_eviction_and_ttl():
+    async def scenario():
+        cache = ResponseCache(max_entries=2, ttls={"generate_categories": 60, "category_mutation": -1}, persist=False)
+        for prompt in ("p1", "p2"):
+            await cache.put("trivia", prompt, "generate_categories", CATEGORIES, "raw")
+        await cache.get("trivia", "p1", "generate_categories")  # p1 becomes most recently used
+        await cache.put("trivia", "p3", "generate_categories", CATEGORIES, "raw")
+        await cache.put("trivia", "p1", "category_mutation", {"choices": []}, "raw")  # TTL <= 0: never cached
+        results = [await cache.get("trivia", p, "generate_categories") for p in ("p1", "p2", "p3")]
+        hit = results[0][0]
+        hit["categories"].append("mutated")
+        return results, await cache.get("trivia", "p1", "generate_categories"), await cache.get("trivia", "p1", "category_mutation"), cache.stats()
+
+    results, again, disabled, stats = asyncio.run(scenario())
+    assert results[0] is not None and results[1] is None and results[2] is not None
+    assert again[0] == CATEGORIES
+    assert disabled is None
+    assert stats["evictions"] == 1
+    assert stats["endpoints"] == {"generate_categories": {"hits": 4, "misses": 1}}
+
+def test_persistent_tier_survives_restart(db):
+    async def scenario():
+        ttls = {"generate_categories": 60}
+        await ResponseCache(ttls=ttls, persist=True).put("trivia", "theme", "generate_categories", CATEGORIES, "raw")
+        restarted = ResponseCache(ttls=ttls, persist=True)
+        return await restarted.get("trivia", "theme", "generate_categories"), restarted.stats()["persistent_hits"]
+
+    (parsed, raw), persistent_hits = db.run(scenario)
+    assert parsed == CATEGORIES and raw == "raw"
+    assert persistent_hits == 1
@@ -0,0 +1,80 @@
+"""
+@file test_singleflight.py
+Concurrent callers for the same key must share one piece of work; blueprint batches are only shared with
+callers of the same or a lower priority class.
+"""
+
+import asyncio
+
+from backend import generative
+from backend.singleflight import SingleFlight, blueprint_flights
+
+def test_concurrent_callers_share_one_call():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "batch"
+
+    async def scenario():
+        flight = SingleFlight("test", enabled=True)
+        results = await asyncio.gather(*(flight.do("Historia", work) for _ in range(10)), flight.do("Nauka", work))
+        own = await flight.do("Historia", work, share=False)
+        return results, own, flight.stats()
+
+    results, own, stats = asyncio.run(scenario())
+    assert results == ["batch"] * 11 and own == "batch"
+    assert len(calls) == 3
+    assert stats == {"inflight": 0, "started": 2, "duplicates_avoided": 9, "bypassed": 1, "failed": 0}
+
+def test_errors_reach_every_caller_and_cancelling_one_keeps_the_work():
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("no blueprints")
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def scenario():
+        flight = SingleFlight("test", enabled=True)
+        errors = await asyncio.gather(flight.do("k", failing), flight.do("k", failing), return_exceptions=True)
+        leader = asyncio.ensure_future(flight.do("s", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("s", slow))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return errors, await follower, flight.stats()
+
+    errors, follower_result, stats = asyncio.run(scenario())
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert follower_result == "done"
+    assert stats["failed"] == 1
+
+def test_blueprint_callers_never_wait_on_a_lower_priority_batch(monkeypatch):
+    batches = []
+
+    async def no_blueprints(category):
+        return 0
+
+    async def generate_blueprints(category, language, theme, model, priority):
+        batches.append(priority)
+        await asyncio.sleep(0.02)
+
+    monkeypatch.setattr(generative.database, "get_blueprint_count", no_blueprints)
+    monkeypatch.setattr(generative, "_generate_blueprints", generate_blueprints)
+    monkeypatch.setattr(blueprint_flights, "enabled", True)
+
+    async def scenario():
+        bulk = asyncio.ensure_future(generative.ensure_blueprints_exist("Historia", "pl", "General knowledge", priority="bulk"))
+        await asyncio.sleep(0)
+        # A player's request starts its own batch; later background callers join the better one
+        interactive = asyncio.ensure_future(generative.ensure_blueprints_exist("Historia", "pl", "General knowledge", priority="interactive"))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(generative.ensure_blueprints_exist("Historia", "pl", "General knowledge", priority=p))
+                     for p in ("prefetch", "bulk", "interactive")]
+        await asyncio.gather(bulk, interactive, *followers)
+
+    asyncio.run(scenario())
+    assert batches == ["bulk", "interactive"]
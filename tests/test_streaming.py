@@ -0,0 +1,110 @@
+"""
+@file test_streaming.py
+Partial decoding of a streamed JSON completion must never emit half an escape sequence, and
+/api/explain-incorrect/stream sends the explanation as deltas and then the result, falls back to a regular call
+when the stream fails before any text and ends with an error event when it fails after.
+"""
+
+import json
+import asyncio
+from types import SimpleNamespace
+
+from backend import generative, routes
+from backend.json_extract import JsonScanner
+from backend.models import ExplanationRequest
+
+RESULT = {"verdict_for": "game", "verdict_certainty": 90, "explanation": "Bitwa pod Grunwaldem była w 1410 roku."}
+REQUEST = ExplanationRequest(model="trivia", question="Kiedy była bitwa pod Grunwaldem?", correct_answer="1410",
+                             player_answer="1920", language="pl", gameId="game-1")
+
+def test_partial_string_grows_monotonically():
+    full = json.dumps({"verdict_for": "game", "explanation": "Zażółć \"gęślą\"\njaźń \\ koniec"}, ensure_ascii=True)
+    expected = json.loads(full)["explanation"]
+    previous = ""
+    for cut in range(len(full) + 1):
+        scanner = JsonScanner()
+        scanner.feed(full[:cut])
+        decoded = scanner.string_field("explanation")
+        if decoded is None:
+            assert previous == ""
+            continue
+        assert decoded.startswith(previous)
+        assert expected.startswith(decoded)
+        previous = decoded
+    assert previous == expected
+
+def test_missing_field_returns_none():
+    scanner = JsonScanner()
+    scanner.feed('{"verdict_for": "pla')
+    assert scanner.string_field("explanation") is None
+
+def fake_stream(monkeypatch, text, fail_after=None, fallback=RESULT):
+    """
+    Streams `text` in 8-character chunks through a fake client (raising after `fail_after` chunks, or before
+    the stream starts when it is 0) and replaces the non-streamed fallback. Returns the fallback's calls.
+    """
+    fallback_calls = []
+
+    async def create(**kwargs):
+        assert kwargs["stream"] is True
+        if fail_after == 0:
+            raise ConnectionError("stream refused")
+
+        async def chunks():
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None))])
+            for n, i in enumerate(range(0, len(text), 8)):
+                if n == fail_after:
+                    raise ConnectionError("connection dropped")
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[i:i + 8]))])
+        return chunks()
+
+    async def call_generative_model(prompt, model, return_raw=False, **kwargs):
+        fallback_calls.append(kwargs["endpoint"])
+        return fallback, json.dumps(fallback)
+
+    async def not_cached(model, prompt, endpoint):
+        return None
+
+    async def put(model, prompt, endpoint, parsed_data, raw_response):
+        pass
+
+    monkeypatch.setattr(generative, "validate_model", lambda model: None)
+    monkeypatch.setattr(generative, "client", SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    monkeypatch.setattr(routes, "call_generative_model", call_generative_model)
+    monkeypatch.setattr(routes.response_cache, "get", not_cached)
+    monkeypatch.setattr(routes.response_cache, "put", put)
+    return fallback_calls
+
+def stream_events():
+    async def scenario():
+        response = await routes.stream_incorrect_explanation(REQUEST)
+        return [event async for event in response.body_iterator]
+
+    events = []
+    for event in asyncio.run(scenario()):
+        name, data = event.strip().split("\n")
+        events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+def test_route_streams_deltas_then_the_result(monkeypatch):
+    fallback_calls = fake_stream(monkeypatch, json.dumps(RESULT, ensure_ascii=False))
+    events = stream_events()
+    names = [name for name, _ in events]
+    assert names[-1] == "result" and set(names[:-1]) == {"delta"} and len(names) > 2
+    assert "".join(data["text"] for _, data in events[:-1]) == RESULT["explanation"]
+    assert events[-1][1] == RESULT
+    assert fallback_calls == []
+
+def test_route_falls_back_to_a_regular_call_when_the_stream_fails_before_any_text(monkeypatch):
+    fallback_calls = fake_stream(monkeypatch, json.dumps(RESULT), fail_after=0)
+    assert stream_events() == [("result", RESULT)]
+    assert fallback_calls == ["incorrect_explanation"]
+
+def test_route_sends_an_error_event_when_the_stream_fails_after_text_was_sent(monkeypatch):
+    # The explanation has started arriving by the 9th chunk
+    fallback_calls = fake_stream(monkeypatch, json.dumps(RESULT), fail_after=9)
+    events = stream_events()
+    assert [name for name, _ in events[:-1]] == ["delta"] * (len(events) - 1) and len(events) > 1
+    assert events[-1][0] == "error"
+    assert "connection dropped" in events[-1][1]["detail"]
+    assert fallback_calls == []
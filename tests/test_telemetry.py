@@ -0,0 +1,114 @@
+"""
+@file test_telemetry.py
+The write-behind queue coalesces records into group commits of at most batch_size, drops (and counts) records
+when full, drains on stop, and keeps the deferred cache deletes of a failed flush.
+"""
+
+import asyncio
+
+from backend import telemetry
+from backend.telemetry import TelemetryWriter, CACHE_DELETE_MAX_ATTEMPTS
+
+def capture_writes(monkeypatch, failures=0):
+    """Replaces the database write; the first `failures` calls raise. Returns the list of successful writes."""
+    writes, calls = [], {"n": 0}
+
+    async def write_telemetry_batch(model_stats, prompts, errors, cache_deletes=()):
+        calls["n"] += 1
+        if calls["n"] <= failures:
+            raise RuntimeError("database is locked")
+        writes.append({"model_stats": model_stats, "prompts": prompts, "errors": errors, "cache_deletes": list(cache_deletes)})
+
+    monkeypatch.setattr(telemetry.database, "write_telemetry_batch", write_telemetry_batch)
+    return writes
+
+def test_records_are_coalesced_into_one_commit(monkeypatch):
+    writes = capture_writes(monkeypatch)
+    writer = TelemetryWriter(max_queue=100, flush_interval_ms=1000, batch_size=50)
+    writer.record_model_stats("m1", True, 1.5)
+    writer.record_model_stats("m1", True, 0.5)
+    writer.record_model_stats("m1", False, 9.0)
+    writer.record_prompt_history({"model": "m1", "prompt": "p"})
+    writer.log_error("preload", {"model": "m1", "error": "boom"})
+    writer.record_cache_delete(7)
+
+    assert asyncio.run(writer.flush()) == 6
+    assert len(writes) == 1
+    assert writes[0]["model_stats"] == {"m1": {"generated_questions": 2, "errors": 1, "total_response_time": 2.0}}
+    assert len(writes[0]["prompts"]) == 1 and len(writes[0]["errors"]) == 1
+    assert writes[0]["cache_deletes"] == [7]
+    assert writer.stats()["written"] == 6
+
+def test_full_queue_drops_records_but_not_cache_deletes(monkeypatch):
+    capture_writes(monkeypatch)
+    writer = TelemetryWriter(max_queue=2, flush_interval_ms=1000, batch_size=10)
+    for _ in range(3):
+        writer.record_model_stats("m1", True, 1.0)
+    writer.record_cache_delete(1)
+    stats = writer.stats()
+    assert stats["dropped"] == 1
+    assert stats["queue_depth"] == 3
+
+def test_flushes_group_commit_at_most_batch_size(monkeypatch):
+    writes = capture_writes(monkeypatch)
+    writer = TelemetryWriter(max_queue=100, flush_interval_ms=1000, batch_size=2)
+    for n in range(5):
+        writer.record_prompt_history({"prompt": str(n)})
+
+    async def flush_all():
+        sizes = []
+        while size := await writer.flush():
+            sizes.append(size)
+        return sizes
+
+    assert asyncio.run(flush_all()) == [2, 2, 1]
+    assert [[p["prompt"] for p in w["prompts"]] for w in writes] == [["0", "1"], ["2", "3"], ["4"]]
+
+def test_stop_drains_the_queue(monkeypatch):
+    writes = capture_writes(monkeypatch)
+    # Neither the interval nor the batch size would flush on its own
+    writer = TelemetryWriter(max_queue=100, flush_interval_ms=60000, batch_size=100)
+
+    async def scenario():
+        writer.start()
+        for n in range(5):
+            writer.record_prompt_history({"prompt": str(n)})
+        await asyncio.sleep(0)
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert sum(len(w["prompts"]) for w in writes) == 5
+    assert writer.stats()["queue_depth"] == 0
+    assert not writer.stats()["running"]
+
+def test_cache_deletes_of_a_failed_flush_are_retried(monkeypatch):
+    writes = capture_writes(monkeypatch, failures=1)
+    writer = TelemetryWriter(max_queue=100, flush_interval_ms=1000, batch_size=10)
+    writer.record_model_stats("m1", True, 1.0)
+    writer.record_cache_delete(3)
+    writer.record_cache_delete(4)
+
+    async def scenario():
+        await writer.flush()
+        await writer.flush()
+
+    asyncio.run(scenario())
+    # Telemetry of the failed flush is lost, the deletes are written by the next one in order
+    assert writes == [{"model_stats": {}, "prompts": [], "errors": [], "cache_deletes": [3, 4]}]
+    assert writer.stats()["retried_cache_deletes"] == 2
+    assert writer.stats()["lost_cache_deletes"] == 0
+
+def test_cache_deletes_are_given_up_and_counted_after_repeated_failures(monkeypatch):
+    writes = capture_writes(monkeypatch, failures=100)
+    writer = TelemetryWriter(max_queue=100, flush_interval_ms=1000, batch_size=10)
+    writer.record_cache_delete(3)
+
+    async def flush_all():
+        flushes = 0
+        while await writer.flush():
+            flushes += 1
+        return flushes
+
+    assert asyncio.run(flush_all()) == CACHE_DELETE_MAX_ATTEMPTS
+    assert writes == []
+    assert writer.stats()["lost_cache_deletes"] == 1
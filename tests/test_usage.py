@@ -0,0 +1,51 @@
+"""
+@file test_usage.py
+Token usage is grouped by model, prompt type and game, and survives a flush to SQLite unchanged.
+"""
+
+from types import SimpleNamespace
+
+from backend import database
+from backend.usage import TokenUsage, response_tokens
+
+def test_usage_block_is_read_and_missing_usage_is_estimated():
+    response = SimpleNamespace(usage=SimpleNamespace(prompt_tokens=120, completion_tokens=30))
+    assert response_tokens(response, "p" * 400, "t" * 80) == (120, 30, False)
+    assert response_tokens(SimpleNamespace(usage=None), "p" * 400, "t" * 80) == (100, 20, True)
+    assert response_tokens(None, "p" * 40, "") == (10, 0, True)
+
+def test_window_summary_merges_flushed_and_pending(db):
+    async def scenario():
+        usage = TokenUsage()
+        for _ in range(4):
+            usage.record("trivia", "generate_question", "game-1", 1000, 200)
+        usage.record("trivia", "blueprints", None, 500, 1500)
+        usage.record("other", "incorrect_explanation", "game-2", 300, 100, estimated=True)
+        usage.record_served("game-1", 4)
+        before = await usage.window_summary(3600)
+        await usage.flush(everything=True)
+        after = await usage.window_summary(3600)
+        usage.record("trivia", "live_quiz", "game-2", 100, 100)
+        usage.record_served("game-2")
+        latest = await usage.window_summary(3600)
+        return before, after, latest
+
+    before, after, latest = db.run(scenario)
+    assert before["totals"] == after["totals"]
+    totals = after["totals"]
+    assert totals["calls"] == 6
+    assert totals["total_tokens"] == 4 * 1200 + 2000 + 400
+    assert totals["estimated_calls"] == 1
+    assert totals["served_questions"] == 4
+    assert totals["tokens_per_served_question"] == 7200 / 4
+    assert totals["question_tokens_per_served_question"] == 4800 / 4
+    assert after["by_prompt_type"]["question"]["total_tokens"] == 4800
+    assert after["by_prompt_type"]["blueprint"]["total_tokens"] == 2000
+    assert after["by_model"]["other"]["prompt_tokens"] == 300
+    # Blueprint batches belong to no game and are left out of the per-game list
+    assert [game["game_id"] for game in after["top_games"]] == ["game-1", "game-2"]
+    assert after["top_games"][0]["tokens_per_served_question"] == 1200
+
+    assert latest["totals"]["calls"] == 7
+    assert latest["totals"]["served_questions"] == 5
+    assert latest["by_prompt_type"]["question"]["calls"] == 5
@@ -0,0 +1,123 @@
+"""
+@file test_warm_pool.py
+The warm pool fills every board category up to its target, likeliest first, within the per-game and global
+preload limits, takes up replaced plans and does not retry a failed fill in the same run.
+"""
+
+import asyncio
+from collections import Counter
+
+from backend import state, warm_pool as warm_pool_module
+from backend.question_cache import make_cache_key
+from backend.warm_pool import WarmPool
+
+PARAMS = {"model": "trivia", "gameId": "game-1", "gameMode": "mcq", "knowledgeLevel": "intermediate", "language": "pl",
+          "theme": None, "includeCategoryTheme": False}
+
+def fake_generation(monkeypatch, fail=(), seconds=0.01):
+    """Replaces preload generation with one that adds a question per call; returns (calls, ready, peak)."""
+    calls, ready, peak = [], Counter(), {"running": 0, "max": 0}
+
+    async def preload_category(game_id, model_selection, params, category):
+        calls.append(category)
+        peak["running"] += 1
+        peak["max"] = max(peak["max"], peak["running"])
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            peak["running"] -= 1
+        if category in fail:
+            return False
+        ready[make_cache_key(category, params)] += 1
+        return True
+
+    monkeypatch.setattr(warm_pool_module, "preload_category", preload_category)
+    monkeypatch.setattr(warm_pool_module.question_cache, "count", lambda key: ready[key])
+    return calls, ready, peak
+
+async def settle(pool: WarmPool):
+    while any(not runner.done() for runner in pool._runners.values()):
+        await asyncio.sleep(0.005)
+
+def test_targets_favor_likely_landings():
+    pool = WarmPool(target=1, likely_target=2, likely_probability=0.2, max_categories=3)
+    targets = pool._targets(["Historia", "Sport", " Historia ", "", "Muzyka", "Kino"], {"Muzyka": 0.5, "Sport": 0.1})
+    assert [(t["category"], t["target"]) for t in targets] == [("Muzyka", 2), ("Sport", 1), ("Historia", 1)]
+
+def test_fills_every_category_to_its_target_likeliest_first(monkeypatch):
+    calls, ready, peak = fake_generation(monkeypatch)
+    monkeypatch.setattr(state, "PRELOAD_CONCURRENCY_SEMAPHORE", None)
+    pool = WarmPool(target=1, likely_target=2, likely_probability=0.2, fills_per_game=2)
+
+    async def scenario():
+        status = pool.plan("game-1", "trivia", PARAMS, ["Historia", "Sport", "Muzyka"], {"Muzyka": 0.6})
+        await settle(pool)
+        return status
+
+    status = asyncio.run(scenario())
+    assert status["missing"] == 4
+    assert calls[0] == "Muzyka"
+    assert Counter(calls) == {"Muzyka": 2, "Historia": 1, "Sport": 1}
+    assert peak["max"] == 2
+    assert pool.status("game-1")["missing"] == 0
+    assert pool.stats()["filled"] == 4
+
+def test_global_limit_holds_across_games(monkeypatch):
+    calls, ready, peak = fake_generation(monkeypatch)
+    monkeypatch.setattr(state, "PRELOAD_CONCURRENCY_SEMAPHORE", asyncio.Semaphore(1))
+    pool = WarmPool(target=1, fills_per_game=3)
+
+    async def scenario():
+        pool.plan("game-1", "trivia", PARAMS, ["Historia", "Sport"], {})
+        pool.plan("game-2", "trivia", {**PARAMS, "language": "en"}, ["History", "Sports"], {})
+        await settle(pool)
+
+    asyncio.run(scenario())
+    assert len(calls) == 4
+    assert peak["max"] == 1
+
+def test_games_with_the_same_settings_share_fills(monkeypatch):
+    calls, ready, peak = fake_generation(monkeypatch)
+    monkeypatch.setattr(state, "PRELOAD_CONCURRENCY_SEMAPHORE", None)
+    pool = WarmPool(target=1)
+
+    async def scenario():
+        pool.plan("game-1", "trivia", PARAMS, ["Historia", "Sport"], {})
+        pool.plan("game-2", "trivia", {**PARAMS, "gameId": "game-2"}, ["Sport", "Historia"], {})
+        await settle(pool)
+
+    asyncio.run(scenario())
+    assert Counter(calls) == {"Historia": 1, "Sport": 1}
+
+def test_failed_fill_is_not_retried_in_the_same_run(monkeypatch):
+    calls, ready, peak = fake_generation(monkeypatch, fail=("Sport",))
+    monkeypatch.setattr(state, "PRELOAD_CONCURRENCY_SEMAPHORE", None)
+    pool = WarmPool(target=1)
+
+    async def scenario():
+        pool.plan("game-1", "trivia", PARAMS, ["Historia", "Sport"], {})
+        await settle(pool)
+        # The next served question starts a new run, which tries again
+        pool.refill("game-1")
+        await settle(pool)
+
+    asyncio.run(scenario())
+    assert Counter(calls) == {"Historia": 1, "Sport": 2}
+    assert pool.stats()["failed"] == 2
+
+def test_single_category_requests_extend_the_plan(monkeypatch):
+    calls, ready, peak = fake_generation(monkeypatch, seconds=0.05)
+    monkeypatch.setattr(state, "PRELOAD_CONCURRENCY_SEMAPHORE", None)
+    pool = WarmPool(target=1, likely_target=2, likely_probability=0.2, fills_per_game=1)
+
+    async def scenario():
+        pool.plan("game-1", "trivia", PARAMS, ["Historia"], {})
+        # Replaces the plan while its first fill is running; the running runner takes it up
+        status = pool.add_category("game-1", "trivia", PARAMS, "Sport")
+        await settle(pool)
+        return status
+
+    status = asyncio.run(scenario())
+    assert [(c["category"], c["target"]) for c in status["categories"]] == [("Sport", 2), ("Historia", 1)]
+    assert Counter(calls) == {"Historia": 1, "Sport": 2}
+    assert pool.stats()["plans_received"] == 2